@@ -22,6 +22,111 @@ ML_MODEL_DIR = BASE_DIR / "ml_models"  # go one level above settings.py folder
 env = environ.Env()
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 
+# Shared on-disk fingerprint cache (one SQLite file used by every worker)
+FINGERPRINT_CACHE_PATH = Path(env('FINGERPRINT_CACHE_PATH', default=str(BASE_DIR / "cache" / "fingerprints.sqlite3")))
+FINGERPRINT_CACHE_MAX_ENTRIES = env.int('FINGERPRINT_CACHE_MAX_ENTRIES', default=1_000_000)
+
+# Process pool used to featurize large batches (0 workers disables the pool). Every web worker
+# starts its own pool, so by default the cores are split between the WEB_CONCURRENCY workers
+# (gunicorn's worker count) rather than each of them starting one process per core
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', default=1)
+FEATURIZATION_WORKERS = env.int(
+    'FEATURIZATION_WORKERS', default=max(1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY))
+)
+FEATURIZATION_CHUNK_SIZE = env.int('FEATURIZATION_CHUNK_SIZE', default=500)
+FEATURIZATION_POOL_MIN_BATCH = env.int('FEATURIZATION_POOL_MIN_BATCH', default=2000)
+
+# Upper bound on model artifacts kept in memory per worker (least recently used are evicted)
+MODEL_MEMORY_BUDGET_MB = env.int('MODEL_MEMORY_BUDGET_MB', default=1024)
+# How often a resident model's artifact file is checked for changes (hot reload)
+MODEL_RELOAD_CHECK_SECONDS = env.int('MODEL_RELOAD_CHECK_SECONDS', default=30)
+
+# Predicted values kept in memory per worker, keyed by (artifact checksum, canonical SMILES);
+# older results are still found in the CachedPrediction table, whose rows for replaced model
+# artifacts are deleted on reload and by `manage.py prune_prediction_cache` (run it periodically)
+PREDICTION_CACHE_MAX_ENTRIES = env.int('PREDICTION_CACHE_MAX_ENTRIES', default=100_000)
+
+# Prediction results are written in batches of this many rows
+PERSIST_BATCH_SIZE = env.int('PERSIST_BATCH_SIZE', default=5000)
+
+# Requests with at least this many SMILES (or with "run_async": true) are queued as jobs for
+# `manage.py run_prediction_worker`, which scores them in chunks of PREDICTION_JOB_CHUNK_SIZE;
+# a running job with no progress for PREDICTION_JOB_LEASE_SECONDS is taken over by another worker
+PREDICTION_ASYNC_THRESHOLD = env.int('PREDICTION_ASYNC_THRESHOLD', default=5000)
+PREDICTION_JOB_CHUNK_SIZE = env.int('PREDICTION_JOB_CHUNK_SIZE', default=1000)
+PREDICTION_JOB_LEASE_SECONDS = env.int('PREDICTION_JOB_LEASE_SECONDS', default=300)
+# CSV uploads queued as jobs are spooled here (a volume shared with the workers); when a job
+# streams its input, repeats are recognised in memory within the last PREDICTION_STREAM_DEDUP_WINDOW molecules
+PREDICTION_UPLOAD_DIR = Path(env('PREDICTION_UPLOAD_DIR', default=str(BASE_DIR / "uploads")))
+PREDICTION_STREAM_DEDUP_WINDOW = env.int('PREDICTION_STREAM_DEDUP_WINDOW', default=100_000)
+# Limits on JSON prediction requests, enforced while the body is parsed (413 beyond them)
+PREDICTION_JSON_MAX_BYTES = env.int('PREDICTION_JSON_MAX_BYTES', default=200 * 1024 * 1024)
+PREDICTION_JSON_MAX_SMILES = env.int('PREDICTION_JSON_MAX_SMILES', default=1_000_000)
+# Queued jobs beyond these limits are refused (429 per user, 503 overall); a worker runs at
+# most PREDICTION_JOB_MAX_RUNNING_PER_USER jobs of one user at a time and otherwise picks
+# the user with the fewest running jobs
+PREDICTION_JOB_MAX_QUEUED = env.int('PREDICTION_JOB_MAX_QUEUED', default=500)
+PREDICTION_JOB_MAX_QUEUED_PER_USER = env.int('PREDICTION_JOB_MAX_QUEUED_PER_USER', default=20)
+PREDICTION_JOB_MAX_RUNNING_PER_USER = env.int('PREDICTION_JOB_MAX_RUNNING_PER_USER', default=1)
+
+# Synchronous predictions run in lanes of slots shared by all workers on the host: requests of
+# up to PREDICTION_FAST_LANE_MAX_SMILES SMILES use the reserved fast lane (waiting briefly for a
+# slot), larger ones the bulk lane (no waiting, at most PREDICTION_BULK_LANE_PER_USER per user).
+# Rejected requests get 429/503 with Retry-After
+PREDICTION_LANE_DIR = Path(env('PREDICTION_LANE_DIR', default=str(BASE_DIR / "cache" / "lanes")))
+PREDICTION_FAST_LANE_MAX_SMILES = env.int('PREDICTION_FAST_LANE_MAX_SMILES', default=50)
+PREDICTION_FAST_LANE_SLOTS = env.int('PREDICTION_FAST_LANE_SLOTS', default=4)
+PREDICTION_FAST_LANE_WAIT_SECONDS = env.float('PREDICTION_FAST_LANE_WAIT_SECONDS', default=2.0)
+PREDICTION_BULK_LANE_SLOTS = env.int('PREDICTION_BULK_LANE_SLOTS', default=1)
+PREDICTION_BULK_LANE_PER_USER = env.int('PREDICTION_BULK_LANE_PER_USER', default=1)
+PREDICTION_RETRY_AFTER_SECONDS = env.int('PREDICTION_RETRY_AFTER_SECONDS', default=5)
+
+# Serve pubchem models with the native PubChem fingerprint; enable only once
+# `manage.py check_pubchem_fingerprint` passes against a reference set
+PUBCHEM_FINGERPRINT_ENABLED = env.bool('PUBCHEM_FINGERPRINT_ENABLED', default=False)
+
+# Molecules scored per step when results are streamed as NDJSON (smaller means earlier first results)
+PREDICTION_STREAM_CHUNK_SIZE = env.int('PREDICTION_STREAM_CHUNK_SIZE', default=200)
+
+# Concurrent predict calls on the same model within this many milliseconds are run as one batch
+# of up to PREDICTION_BATCH_MAX_ROWS rows (0 disables batching; only useful with threaded workers,
+# see `manage.py benchmark_batching`)
+PREDICTION_BATCH_WINDOW_MS = env.float('PREDICTION_BATCH_WINDOW_MS', default=0)
+PREDICTION_BATCH_MAX_ROWS = env.int('PREDICTION_BATCH_MAX_ROWS', default=256)
+
+# "sparse" feeds XGBoost CSR fingerprints via inplace_predict; "dense" uses a float32 DMatrix
+PREDICTION_INFERENCE_MODE = env('PREDICTION_INFERENCE_MODE', default='sparse')
+
+# Unit of the IC50 values the models predict (M, mM, uM or nM), needed to compute LELP
+PREDICTION_IC50_UNIT = env('PREDICTION_IC50_UNIT', default='uM')
+
+# PubChem enrichment (`manage.py enrich_compounds`): PUG REST calls are rate limited, batched by CID
+# and cached in the database; compounds PubChem does not know are retried after the negative TTL
+PUBCHEM_BASE_URL = env('PUBCHEM_BASE_URL', default='https://pubchem.ncbi.nlm.nih.gov/rest/pug')
+PUBCHEM_REQUESTS_PER_SECOND = env.float('PUBCHEM_REQUESTS_PER_SECOND', default=5)
+PUBCHEM_BATCH_SIZE = env.int('PUBCHEM_BATCH_SIZE', default=100)
+PUBCHEM_TIMEOUT_SECONDS = env.float('PUBCHEM_TIMEOUT_SECONDS', default=15)
+PUBCHEM_CACHE_TTL_DAYS = env.int('PUBCHEM_CACHE_TTL_DAYS', default=30)
+PUBCHEM_NEGATIVE_CACHE_TTL_HOURS = env.int('PUBCHEM_NEGATIVE_CACHE_TTL_HOURS', default=24)
+
+# Tanimoto similarity index over all compounds (`/api/v1/compounds/similar/`), memory-mapped by
+# every worker; compounds added since the last rebuild are merged in once there are more than
+# SIMILARITY_INDEX_DELTA_MAX_ROWS of them (see `manage.py build_similarity_index`)
+SIMILARITY_INDEX_DIR = Path(env('SIMILARITY_INDEX_DIR', default=str(BASE_DIR / "cache" / "similarity")))
+SIMILARITY_INDEX_DELTA_MAX_ROWS = env.int('SIMILARITY_INDEX_DELTA_MAX_ROWS', default=20_000)
+SIMILARITY_MAX_RESULTS = env.int('SIMILARITY_MAX_RESULTS', default=1000)
+
+# Clustering of a prediction's compounds (`/api/v1/predictions/<id>/clusters/`): the Tanimoto
+# matrix is computed in CLUSTERING_BLOCK_ROWS-square tiles, and cutoffs linking more than
+# CLUSTERING_MAX_NEIGHBOR_PAIRS compound pairs are rejected, bounding memory either way
+CLUSTERING_BLOCK_ROWS = env.int('CLUSTERING_BLOCK_ROWS', default=2048)
+CLUSTERING_MAX_NEIGHBOR_PAIRS = env.int('CLUSTERING_MAX_NEIGHBOR_PAIRS', default=10_000_000)
+
+# Prediction history (`/api/v1/predictions/`): cursor-paginated, clients may ask for up to
+# PREDICTION_MAX_PAGE_SIZE predictions per page with `page_size`
+PREDICTION_PAGE_SIZE = env.int('PREDICTION_PAGE_SIZE', default=50)
+PREDICTION_MAX_PAGE_SIZE = env.int('PREDICTION_MAX_PAGE_SIZE', default=200)
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -4,7 +4,4 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
-
-    def ready(self):
-        from api.v1.predictions import utils  # Import your utils file
-        utils.load_all_models()
+    # ML models are loaded lazily by api.v1.predictions.registry on first use.
@@ -0,0 +1,72 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.domain import ApplicabilityDomain
+from api.v1.predictions.featurizers import ECFP_BITS, ecfp_key, featurize_smiles, packed_to_csr
+from api.v1.predictions.registry import get_model_registry
+from .benchmark_featurization import synthetic_smiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Time applicability-domain scoring against what a prediction of the same batch costs without "
+        "it (RDKit featurization plus sparse XGBoost inference), and check it against a per-pair Tanimoto computation. Uses the model's shipped training "
+        "fingerprints, or --training-size synthetic ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default="xgb_model_ecfp.json", help="Loaded XGBoost ECFP model file name")
+        parser.add_argument("--sizes", default="1,100,1000,10000", help="Comma-separated batch sizes")
+        parser.add_argument("--training-size", type=int, default=None,
+                            help="Score against this many synthetic training compounds instead")
+
+    def handle(self, *args, **options):
+        registry = get_model_registry()
+        try:
+            model = registry.get(options["model"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["training_size"]:
+            blocks, _ = featurize_smiles(synthetic_smiles(options["training_size"], seed=-1), [ecfp_key()])
+            domain = ApplicabilityDomain(blocks[ecfp_key()], ECFP_BITS)
+        else:
+            domain = registry.applicability_domain(options["model"], ECFP_BITS)
+            if domain is None:
+                raise CommandError("The model ships without training fingerprints; pass --training-size.")
+        self.stdout.write(f"Training set: {domain.size} compounds, {domain.nbytes / 1e6:.1f} MB resident")
+
+        self.stdout.write(
+            f"{'batch':>8} {'featurize ms':>13} {'predict ms':>11} {'domain ms':>10} {'overhead':>9}"
+        )
+        for size in [int(s) for s in options["sizes"].split(",")]:
+            smiles = synthetic_smiles(size, seed=size)
+            featurize_s = self._time(lambda: featurize_smiles(smiles, [ecfp_key()]))
+            queries = packed_to_csr(featurize_smiles(smiles, [ecfp_key()])[0][ecfp_key()], ECFP_BITS)
+            predict_s = self._time(lambda: model.inplace_predict(queries))
+            domain_s = self._time(lambda: domain.score(queries))
+            self.stdout.write(
+                f"{size:>8} {featurize_s * 1000:>13.1f} {predict_s * 1000:>11.1f} {domain_s * 1000:>10.1f} "
+                f"{domain_s / (featurize_s + predict_s):>9.0%}"
+            )
+
+        # Reference: Tanimoto of a few queries to every training compound, one pair at a time
+        packed = featurize_smiles(synthetic_smiles(20, seed=7), [ecfp_key()])[0][ecfp_key()]
+        best, mean = domain.score(packed_to_csr(packed, ECFP_BITS))
+        training = np.unpackbits(domain.planes, axis=1, count=domain.size).T.astype(bool)
+        for row, query in enumerate(np.unpackbits(packed, axis=1, count=ECFP_BITS).astype(bool)):
+            common = (training & query).sum(axis=1)
+            union = (training | query).sum(axis=1)
+            similarity = np.where(union > 0, common / np.maximum(union, 1), 0.0)
+            if not (np.isclose(best[row], similarity.max()) and np.isclose(mean[row], similarity.mean())):
+                raise CommandError(f"Scores differ from the reference for query {row}.")
+        self.stdout.write(self.style.SUCCESS("Scores match a per-pair Tanimoto computation."))
+
+    @staticmethod
+    def _time(fn, repeat=3):
+        """Best wall time of fn over repeat runs, in seconds."""
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
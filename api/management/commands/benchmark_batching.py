@@ -0,0 +1,72 @@
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.batching import InferenceBatcher
+from api.v1.predictions.featurizers import ECFP_BITS, ecfp_key, featurize_smiles, packed_to_csr
+from api.v1.predictions.registry import get_model_registry
+from .benchmark_featurization import synthetic_smiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test cross-request micro-batching: concurrent clients each predict single "
+        "compounds on one XGBoost model, with batching disabled and with the given window. "
+        "Reports throughput and p50/p99 latency per concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default="xgb_model_ecfp.json", help="XGBoost model file name")
+        parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated numbers of concurrent clients")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+        parser.add_argument("--rows", type=int, default=1, help="Compounds per request")
+        parser.add_argument("--window-ms", type=float, default=None,
+                            help="Batching window to compare against (default: PREDICTION_BATCH_WINDOW_MS, or 2)")
+        parser.add_argument("--max-rows", type=int, default=None, help="Batch size cap (default: PREDICTION_BATCH_MAX_ROWS)")
+
+    def handle(self, *args, **options):
+        try:
+            model, _ = get_model_registry().acquire(options["model"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        window_ms = options["window_ms"] if options["window_ms"] is not None else (settings.PREDICTION_BATCH_WINDOW_MS or 2)
+        max_rows = options["max_rows"] or settings.PREDICTION_BATCH_MAX_ROWS
+        rows = options["rows"]
+        blocks, _ = featurize_smiles(synthetic_smiles(1000, seed=0), [ecfp_key()])
+        csr = packed_to_csr(blocks[ecfp_key()], ECFP_BITS)
+        inputs = [csr[i:i + rows] for i in range(0, csr.shape[0] - rows + 1, rows)]
+
+        self.stdout.write(f"{'clients':>8} {'window ms':>10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for clients in [int(c) for c in options["concurrency"].split(",")]:
+            for window in (0, window_ms):
+                batcher = InferenceBatcher(window / 1000, max_rows)
+                latencies, elapsed = self._load(batcher, model.inplace_predict, inputs, clients, options["requests"])
+                p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+                self.stdout.write(
+                    f"{clients:>8} {window:>10g} {len(latencies) / elapsed:>9.0f} {p50:>8.2f} {p99:>8.2f}"
+                )
+
+    @staticmethod
+    def _load(batcher, predict_fn, inputs, clients, requests):
+        """Run `clients` threads issuing `requests` predictions each; returns (latencies, wall seconds)."""
+        latencies = [[] for _ in range(clients)]
+        barrier = threading.Barrier(clients + 1)
+
+        def client(n):
+            barrier.wait()
+            for i in range(requests):
+                matrix = inputs[(n * requests + i) % len(inputs)]
+                start = time.perf_counter()
+                batcher.predict(matrix, predict_fn)
+                latencies[n].append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return np.concatenate(latencies), time.perf_counter() - start
@@ -0,0 +1,55 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from rdkit import DataStructs
+from rdkit.ML.Cluster import Butina
+from api.v1.predictions.clustering import FINGERPRINT_KEY, butina_clusters, tanimoto_neighbors
+from api.v1.predictions.featurizers import featurize_smiles
+from .benchmark_featurization import synthetic_smiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Time blocked Tanimoto neighbor search and Butina clustering of a prediction-sized batch, "
+        "and check the clusters against rdkit.ML.Cluster.Butina on a smaller one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=20000, help="Compounds to cluster")
+        parser.add_argument("--cutoff", type=float, default=0.6, help="Tanimoto similarity cutoff")
+        parser.add_argument("--check-size", type=int, default=1500, help="Compounds compared against RDKit")
+        parser.add_argument("--check-cutoff", type=float, default=0.35, help="Cutoff of the RDKit comparison")
+
+    def handle(self, *args, **options):
+        cutoff = options["cutoff"]
+        self.check_against_rdkit(options["check_size"], options["check_cutoff"])
+
+        packed = featurize_smiles(synthetic_smiles(options["size"], seed=1), [FINGERPRINT_KEY])[0][FINGERPRINT_KEY]
+        start = time.perf_counter()
+        indptr, indices = tanimoto_neighbors(packed, cutoff)
+        neighbors_s = time.perf_counter() - start
+        start = time.perf_counter()
+        clusters = butina_clusters(indptr, indices)
+        butina_s = time.perf_counter() - start
+        self.stdout.write(
+            f"{len(packed)} compounds, {len(indices) // 2} pairs >= {cutoff}: neighbors {neighbors_s * 1000:.0f} ms, "
+            f"Butina {butina_s * 1000:.0f} ms, {len(clusters)} clusters (largest {len(clusters[0])})"
+        )
+
+    def check_against_rdkit(self, size, cutoff):
+        packed = featurize_smiles(synthetic_smiles(size, seed=2), [FINGERPRINT_KEY])[0][FINGERPRINT_KEY]
+        fingerprints = []
+        for row in np.unpackbits(packed, axis=1):
+            fingerprint = DataStructs.ExplicitBitVect(len(row))
+            fingerprint.SetBitsFromList(np.flatnonzero(row).tolist())
+            fingerprints.append(fingerprint)
+        distances = []
+        for i in range(1, len(fingerprints)):
+            distances.extend(1 - s for s in DataStructs.BulkTanimotoSimilarity(fingerprints[i], fingerprints[:i]))
+
+        # RDKit counts distance <= 1 - cutoff as neighbors; equal up to float rounding at the boundary
+        expected = {frozenset(c) for c in Butina.ClusterData(distances, len(fingerprints), 1 - cutoff + 1e-9, isDistData=True)}
+        actual = {frozenset(c.tolist()) for c in butina_clusters(*tanimoto_neighbors(packed, cutoff, block_rows=256))}
+        if actual != expected:
+            raise CommandError(f"Clusters differ from RDKit's Butina ({len(actual)} vs {len(expected)} clusters).")
+        self.stdout.write(self.style.SUCCESS(f"Clusters of {size} compounds match RDKit's Butina ({len(actual)} clusters)."))
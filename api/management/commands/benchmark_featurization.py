@@ -0,0 +1,79 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.featurization_pool import FeaturizationPool
+from api.v1.predictions.featurizers import featurize_smiles, get_descriptor, ecfp_key
+
+# Divalent fragments, so any concatenation is a valid molecule
+FRAGMENTS = ["C", "CC", "N", "O", "S", "C(=O)", "C(=O)N", "C(F)", "C(Cl)", "c1ccc(cc1)", "c1cnc(cc1)", "C1CCC(CC1)"]
+
+
+def synthetic_smiles(n, seed=0):
+    """Build n valid, reasonably drug-sized SMILES by chaining random fragments."""
+    rng = random.Random(seed)
+    return ["".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(4, 10))) for _ in range(n)]
+
+
+class Command(BaseCommand):
+    help = "Compare in-process vs process-pool featurization to find the pool crossover batch size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,500,1000,2000,5000,10000,50000",
+                            help="Comma-separated batch sizes to time")
+        parser.add_argument("--workers", type=int, default=None, help="Pool workers (default: FEATURIZATION_WORKERS)")
+        parser.add_argument("--chunk-size", type=int, default=None, help="SMILES per task (default: FEATURIZATION_CHUNK_SIZE)")
+        parser.add_argument("--descriptors", default=ecfp_key(),
+                            help="Comma-separated descriptor keys computed per parse (e.g. ecfp:r3:2048,maccs,pubchem:v2,properties)")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size (best is reported)")
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+
+        workers = options["workers"] or settings.FEATURIZATION_WORKERS
+        chunk_size = options["chunk_size"] or settings.FEATURIZATION_CHUNK_SIZE
+        sizes = [int(s) for s in options["sizes"].split(",")]
+        keys = options["descriptors"].split(",")
+        try:
+            for key in keys:
+                get_descriptor(key)
+        except ValueError as e:
+            raise CommandError(str(e))
+        pool = FeaturizationPool(workers, chunk_size, min_batch=0)
+
+        # Warm the pool so process start-up is not billed to the first size
+        pool.featurize(synthetic_smiles(workers * 2), keys, force_pool=True)
+
+        self.stdout.write(f"workers={workers} chunk_size={chunk_size} descriptors={','.join(keys)}")
+        self.stdout.write(f"{'batch':>8} {'in-process ms':>14} {'mol/s':>8} {'pool ms':>10} {'speedup':>8}")
+        speedups = []
+        for size in sizes:
+            smiles = synthetic_smiles(size, seed=size)
+            local = self._best_of(options["repeat"], lambda: featurize_smiles(smiles, keys))
+            pooled = self._best_of(options["repeat"], lambda: pool.featurize(smiles, keys, force_pool=True))
+            speedup = local / pooled
+            speedups.append((size, speedup))
+            self.stdout.write(f"{size:>8} {local * 1000:>14.1f} {size / local:>8.0f} {pooled * 1000:>10.1f} {speedup:>7.2f}x")
+        pool.shutdown()
+
+        # Smallest size from which the pool wins at every larger size too
+        crossover = None
+        for size, speedup in reversed(speedups):
+            if speedup <= 1:
+                break
+            crossover = size
+
+        if crossover is None:
+            self.stdout.write("The pool never beat in-process featurization at these sizes.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Pool wins from ~{crossover} SMILES; set FEATURIZATION_POOL_MIN_BATCH accordingly."
+            ))
+
+    @staticmethod
+    def _best_of(repeat, fn):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
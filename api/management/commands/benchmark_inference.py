@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+import numpy as np
+import xgboost as xgb
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.featurizers import ECFP_BITS, ecfp_key, featurize_smiles, unpack_dense, packed_to_csr
+from api.v1.predictions.registry import get_model_registry
+from .benchmark_featurization import synthetic_smiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Check sparse/dense prediction parity and compare their memory use and latency. "
+        "Memory is peak Python-side allocation; XGBoost's internal DMatrix copy is not traced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default="xgb_model_ecfp.json", help="Loaded XGBoost model file name")
+        parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated batch sizes")
+
+    def handle(self, *args, **options):
+        try:
+            model = get_model_registry().get(options["model"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{'batch':>8} {'dense MB':>9} {'sparse MB':>10} {'dense ms':>9} {'sparse ms':>10} {'max |diff|':>11}"
+        )
+        for size in [int(s) for s in options["sizes"].split(",")]:
+            blocks, _ = featurize_smiles(synthetic_smiles(size, seed=size), [ecfp_key()])
+            packed = blocks[ecfp_key()]
+
+            dense_pred, dense_mb, dense_s = self._measure(
+                lambda: model.predict(xgb.DMatrix(unpack_dense(packed, ECFP_BITS), feature_names=model.feature_names))
+            )
+            sparse_pred, sparse_mb, sparse_s = self._measure(
+                lambda: model.inplace_predict(packed_to_csr(packed, ECFP_BITS))
+            )
+
+            diff = float(np.max(np.abs(dense_pred - sparse_pred))) if size else 0.0
+            self.stdout.write(
+                f"{size:>8} {dense_mb:>9.1f} {sparse_mb:>10.1f} {dense_s * 1000:>9.1f} {sparse_s * 1000:>10.1f} {diff:>11.2e}"
+            )
+            if not np.array_equal(dense_pred, sparse_pred):
+                raise CommandError(f"Sparse predictions differ from dense at batch size {size}.")
+
+        self.stdout.write(self.style.SUCCESS("Sparse and dense predictions are identical."))
+
+    @staticmethod
+    def _measure(fn):
+        """Run fn once, returning (result, peak traced MB, seconds)."""
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, peak / 1e6, elapsed
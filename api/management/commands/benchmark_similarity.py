@@ -0,0 +1,83 @@
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.compounds.similarity import ROW_BYTES, SimilarityIndex, popcount_rows
+from api.v1.predictions.featurizers import ecfp_key, featurize_smiles
+from .benchmark_featurization import synthetic_smiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Time similarity queries on a synthetic index of --size compounds (in a temporary "
+        "directory), with compounds in both the base segment and the delta, and check the "
+        "results against a brute-force scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=1_000_000, help="Compounds in the index")
+        parser.add_argument("--delta", type=int, default=10_000, help="Of which appended after the build")
+        parser.add_argument("--queries", type=int, default=50, help="Queries per mode")
+        parser.add_argument("--k", type=int, default=10, help="Top-k for the k-nearest queries")
+        parser.add_argument("--threshold", type=float, default=0.6, help="Similarity for the threshold queries")
+
+    def handle(self, *args, **options):
+        size, delta = options["size"], options["delta"]
+        if not 0 <= delta < size:
+            raise CommandError("--delta must be smaller than --size.")
+        fingerprints = self._fingerprints(size)
+        ids = np.arange(size, dtype=np.int64) + 1
+
+        with tempfile.TemporaryDirectory() as directory:
+            index = SimilarityIndex(Path(directory), delta_max_rows=size)
+            start = time.perf_counter()
+            index.rebuild(ids[:size - delta], fingerprints[:size - delta])
+            self.stdout.write(f"Built base segment of {size - delta} compounds in {time.perf_counter() - start:.1f}s")
+            start = time.perf_counter()
+            for chunk in range(size - delta, size, 1000):
+                index.add(ids[chunk:chunk + 1000], fingerprints[chunk:chunk + 1000])
+            self.stdout.write(f"Appended {delta} compounds in {time.perf_counter() - start:.2f}s")
+
+            rng = np.random.default_rng(1)
+            queries = fingerprints[rng.integers(0, size, options["queries"])]
+            counts = popcount_rows(fingerprints)
+            for label, k, threshold in (
+                (f"top {options['k']}", options["k"], 0.0),
+                (f">= {options['threshold']:g}", None, options["threshold"]),
+            ):
+                timings = []
+                for query in queries:
+                    start = time.perf_counter()
+                    found_ids, found = index.search(query, k, threshold)
+                    timings.append(time.perf_counter() - start)
+                    self._verify(fingerprints, counts, ids, query, k, threshold, found_ids, found)
+                p50, p99 = np.percentile(timings, [50, 99]) * 1000
+                self.stdout.write(f"{label:>12}: p50 {p50:.1f} ms, p99 {p99:.1f} ms over {size} compounds")
+        self.stdout.write(self.style.SUCCESS("Results match a brute-force scan."))
+
+    def _fingerprints(self, size):
+        """Real ECFP rows from synthetic molecules, with two random extra bits each for variety."""
+        base, valid = featurize_smiles(synthetic_smiles(min(size, 20_000), seed=0), [ecfp_key()])
+        base = base[ecfp_key()][valid]
+        rng = np.random.default_rng(0)
+        fingerprints = base[rng.integers(0, len(base), size)]
+        rows = np.repeat(np.arange(size), 2)
+        bits = rng.integers(0, ROW_BYTES * 8, 2 * size)
+        np.bitwise_or.at(fingerprints, (rows, bits // 8), (128 >> (bits % 8)).astype(np.uint8))
+        return fingerprints
+
+    @staticmethod
+    def _verify(fingerprints, counts, ids, query, k, threshold, found_ids, found):
+        common = np.zeros(len(fingerprints), dtype=np.float32)
+        for start in range(0, len(fingerprints), 65536):
+            common[start:start + 65536] = popcount_rows(fingerprints[start:start + 65536] & query)
+        expected = common / (counts + np.float32(popcount_rows(query[None])[0]) - common)
+        if k is not None:
+            # Ties make the ids ambiguous, but not the similarities
+            if not np.allclose(np.sort(expected)[::-1][:k], found):
+                raise CommandError("Top-k similarities differ from a brute-force scan.")
+        elif set(ids[expected >= threshold].tolist()) != set(found_ids.tolist()):
+            raise CommandError("Threshold results differ from a brute-force scan.")
+        if not np.allclose(expected[found_ids - 1], found):
+            raise CommandError("Reported similarities differ from a brute-force scan.")
@@ -0,0 +1,48 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from api.models import Compound
+from api.v1.compounds.similarity import ROW_BYTES, fingerprint_smiles, get_similarity_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the compound similarity index from the Compound table, e.g. to index "
+        "compounds stored before it existed. With --compact, only merge the compounds "
+        "added since the last build into the memory-mapped base segment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compact", action="store_true", help="Merge recent additions instead of rebuilding")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Compounds fingerprinted per step")
+
+    def handle(self, *args, **options):
+        index = get_similarity_index()
+        if options["compact"]:
+            if not index.compact():
+                self.stdout.write(self.style.WARNING("Another process is already compacting the index."))
+                return
+            self.stdout.write(self.style.SUCCESS(f"Compacted: {len(index)} compounds indexed."))
+            return
+
+        ids, fingerprints = [], []
+        rows = Compound.objects.exclude(smiles=None).order_by("pk").values_list("pk", "smiles")
+        batch = []
+        for row in rows.iterator(chunk_size=options["batch_size"]):
+            batch.append(row)
+            if len(batch) == options["batch_size"]:
+                self._fingerprint(batch, ids, fingerprints)
+                batch = []
+        self._fingerprint(batch, ids, fingerprints)
+
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        fingerprints = np.concatenate(fingerprints) if fingerprints else np.zeros((0, ROW_BYTES), dtype=np.uint8)
+        index.rebuild(ids, fingerprints)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt: {len(index)} compounds indexed."))
+
+    def _fingerprint(self, batch, ids, fingerprints):
+        if not batch:
+            return
+        packed, valid = fingerprint_smiles([smiles for _, smiles in batch])
+        ids.append(np.array([pk for pk, _ in batch], dtype=np.int64)[valid])
+        fingerprints.append(packed[valid])
+        self.stdout.write(f"Fingerprinted {sum(len(i) for i in ids)} compounds")
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.domain import training_fingerprints_path
+from api.v1.predictions.featurizers import get_descriptor
+from api.v1.predictions.ingestion import iter_csv_smiles, iter_unique_chunks
+from api.v1.predictions.utils import descriptor_key, featurize_blocks
+
+
+class Command(BaseCommand):
+    help = (
+        "Featurize a model's training-set SMILES and store them as the packed fingerprint "
+        "matrix shipped next to its artifact, which predictions are compared against for "
+        "their applicability domain. Rerun whenever the model is retrained."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="Model file name in ML_MODEL_DIR, e.g. xgb_model_ecfp.json")
+        parser.add_argument("smiles_csv", help="CSV (optionally gzip'd) with the training SMILES in its first column")
+        parser.add_argument("--descriptor", required=True, help="Model descriptor, e.g. ecfp or maccs")
+        parser.add_argument("--standardize", action="store_true", help="Standardize SMILES as the model's training did")
+        parser.add_argument("--chunk-size", type=int, default=10000, help="SMILES featurized per step")
+
+    def handle(self, *args, **options):
+        model_path = settings.ML_MODEL_DIR / options["model"]
+        if not model_path.is_file():
+            raise CommandError(f"Model '{options['model']}' not found in {settings.ML_MODEL_DIR}.")
+        try:
+            key = descriptor_key(options["descriptor"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        blocks, rows = [], 0
+        with open(options["smiles_csv"], "rb") as f:
+            chunks = iter_unique_chunks(iter_csv_smiles(f), options["chunk_size"], options["standardize"])
+            for consumed, unique in chunks:
+                rows += consumed
+                features, valid = featurize_blocks(unique, [key])
+                blocks.append(features[key][valid])
+        packed = np.concatenate(blocks) if blocks else get_descriptor(key).empty(0)
+        if not len(packed):
+            raise CommandError("No valid SMILES in the training set.")
+
+        # Written under a temporary name and renamed, so workers never load a partial file
+        path = training_fingerprints_path(model_path)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(partial, "wb") as f:
+            np.save(f, packed)
+        os.replace(partial, path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(packed)} training fingerprints ({packed.nbytes / 1e6:.1f} MB) from {rows} rows to {path.name}."
+        ))
@@ -0,0 +1,75 @@
+import csv
+import numpy as np
+import pubchempy as pcp
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.predictions.featurizers import PUBCHEM_KEY, featurize_smiles, unpack_dense
+from api.v1.predictions.pubchem_fingerprint import PUBCHEM_BITS
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the native PubChem fingerprint against reference CACTVS fingerprints "
+        "(the ones deepchem's PubChemFingerprint downloads) and report mismatching bits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("reference", help="CSV with 'smiles' and 'fingerprint' (881-character 0/1 string) columns")
+        parser.add_argument("--fetch", action="store_true",
+                            help="Download missing fingerprints from PubChem and write them back to the CSV")
+        parser.add_argument("--top", type=int, default=20, help="Mismatching bits to list")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["reference"], newline="") as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(str(e))
+        if not rows or "smiles" not in rows[0]:
+            raise CommandError("The reference CSV needs a 'smiles' column.")
+
+        if options["fetch"]:
+            self._fetch_missing(rows, options["reference"])
+
+        rows = [row for row in rows if row.get("fingerprint")]
+        if not rows:
+            raise CommandError("No reference fingerprints; run with --fetch to download them.")
+        bad = [row["smiles"] for row in rows if len(row["fingerprint"]) != PUBCHEM_BITS]
+        if bad:
+            raise CommandError(f"Reference fingerprints must have {PUBCHEM_BITS} bits: {bad[:5]}")
+
+        blocks, valid = featurize_smiles([row["smiles"] for row in rows], [PUBCHEM_KEY])
+        native = unpack_dense(blocks[PUBCHEM_KEY], PUBCHEM_BITS).astype(bool)
+        reference = np.array([[c == "1" for c in row["fingerprint"]] for row in rows])
+
+        mismatches = (native != reference) & valid[:, None]
+        exact = int((~mismatches.any(axis=1) & valid).sum())
+        per_bit = Counter({bit: int(n) for bit, n in enumerate(mismatches.sum(axis=0)) if n})
+
+        self.stdout.write(
+            f"{exact}/{int(valid.sum())} molecules identical "
+            f"({len(rows) - int(valid.sum())} unparseable), {len(per_bit)} bits differ"
+        )
+        for bit, n in per_bit.most_common(options["top"]):
+            self.stdout.write(f"  bit {bit:>3}: {n} molecules")
+
+        if per_bit:
+            raise CommandError("The native PubChem fingerprint does not match the reference set.")
+        self.stdout.write(self.style.SUCCESS("The native PubChem fingerprint matches the reference set."))
+
+    def _fetch_missing(self, rows, path):
+        for row in rows:
+            if row.get("fingerprint"):
+                continue
+            try:
+                compounds = pcp.get_compounds(row["smiles"], "smiles")
+            except Exception as e:
+                self.stderr.write(f"PubChem lookup failed for {row['smiles']}: {e}")
+                continue
+            if compounds and compounds[0].cactvs_fingerprint:
+                row["fingerprint"] = compounds[0].cactvs_fingerprint
+
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["smiles", "fingerprint"], extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
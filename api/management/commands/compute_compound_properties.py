@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.models import Compound
+from api.v1.predictions.featurizers import PROPERTY_COLUMNS
+from api.v1.predictions.properties import apply_properties, compute_properties
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the RDKit properties (formula, weight, InChI, InChIKey, heavy atoms, logP) of "
+        "compounds stored without them. New compounds get them when they are created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Compounds computed and written per step")
+
+    def handle(self, *args, **options):
+        updated = skipped = 0
+        last_pk = 0
+        while True:
+            compounds = list(
+                Compound.objects.filter(logp=None, smiles__isnull=False, pk__gt=last_pk)
+                .order_by("pk")[:options["batch_size"]]
+            )
+            if not compounds:
+                break
+            last_pk = compounds[-1].pk
+            properties = compute_properties(list(dict.fromkeys(c.smiles for c in compounds)))
+            changed = [c for c in compounds if apply_properties(c, properties.get(c.smiles, ()))]
+            Compound.objects.bulk_update(changed, PROPERTY_COLUMNS, batch_size=settings.PERSIST_BATCH_SIZE)
+            updated += len(changed)
+            skipped += len(compounds) - len(changed)
+            self.stdout.write(f"Updated {updated} compounds ({skipped} could not be parsed).")
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} compounds updated, {skipped} skipped."))
@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.v1.predictions.enrichment import compounds_to_enrich, enrich_compounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in PubChem metadata for compounds without a CID, off the request path. "
+        "Lookups are batched, cached and rate limited (PUBCHEM_* settings)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Compounds per round (default: PUBCHEM_BATCH_SIZE)")
+        parser.add_argument("--loop", action="store_true", help="Keep running, waiting for new compounds")
+        parser.add_argument("--poll-interval", type=float, default=60.0,
+                            help="Seconds to wait when nothing is left to enrich (with --loop)")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or settings.PUBCHEM_BATCH_SIZE
+        checked = matched = 0
+        while True:
+            compounds = compounds_to_enrich(batch_size)
+            if not compounds:
+                if not options["loop"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+            matched += enrich_compounds(compounds)
+            checked += len(compounds)
+            self.stdout.write(f"Checked {checked} compounds, {matched} found on PubChem.")
+        self.stdout.write(self.style.SUCCESS(f"Done: {matched} of {checked} compounds enriched."))
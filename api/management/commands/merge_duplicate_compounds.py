@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.v1.predictions.persistence import merge_duplicate_compounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill Compound.smiles_hash and merge compounds with the same canonical structure, "
+        "repointing their PredictionCompound rows to the oldest copy."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            hashed, merged = merge_duplicate_compounds()
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} compounds, merged {merged} duplicates."))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.models import MLModel
+from api.v1.predictions.registry import artifact_checksum
+from api.v1.predictions.result_cache import get_result_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete CachedPrediction rows of model artifacts that are no longer registered or whose file "
+        "has been replaced. Run it periodically (e.g. from cron) to bound the size of the table."
+    )
+
+    def handle(self, *args, **options):
+        checksums = set()
+        for file_path in MLModel.objects.exclude(file_path=None).values_list("file_path", flat=True).distinct():
+            model_path = settings.ML_MODEL_DIR / file_path
+            if model_path.exists():
+                checksums.add(artifact_checksum(model_path))
+        deleted = get_result_cache().prune(checksums)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} cached predictions; kept those of {len(checksums)} current artifacts."
+        ))
@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.v1.predictions.jobs import claim_next_job, run_prediction_job
+
+
+def _work(chunk_size, poll_interval, once):
+    while True:
+        prediction = claim_next_job()
+        if prediction is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_prediction_job(prediction, chunk_size)
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _process_main(chunk_size, poll_interval, once):
+    # Restore the default handler; the parent terminates workers with SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Each process opens its own database connection
+    connections.close_all()
+    _work(chunk_size, poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued prediction jobs. Workers claim jobs from the Prediction table with "
+        "SELECT ... FOR UPDATE SKIP LOCKED, so several workers (and hosts) can share the queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes to run")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Molecules scored and committed per step (default: PREDICTION_JOB_CHUNK_SIZE)")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        worker_args = (options["chunk_size"], options["poll_interval"], options["once"])
+        if options["processes"] <= 1:
+            _work(*worker_args)
+            return
+
+        connections.close_all()
+        # Not daemonic: daemonic processes cannot start the featurization process pool
+        processes = [
+            multiprocessing.Process(target=_process_main, args=worker_args)
+            for _ in range(options["processes"])
+        ]
+        # Stop the workers on SIGTERM too, not only on Ctrl-C
+        signal.signal(signal.SIGTERM, _raise_interrupt)
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} prediction workers.")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
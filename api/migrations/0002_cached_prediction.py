@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artifact_checksum', models.CharField(max_length=64)),
+                ('smiles', models.TextField()),
+                ('ic50', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('artifact_checksum', 'smiles')},
+            },
+        ),
+    ]
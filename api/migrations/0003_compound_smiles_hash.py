@@ -0,0 +1,83 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:40
+
+import hashlib
+from django.db import migrations, models
+from rdkit import Chem
+
+# Frozen copy of the merge as of this migration; later changes to the app code
+# (api.v1.predictions.persistence.merge_duplicate_compounds) must not alter it.
+MERGED_FIELDS = (
+    'iupac_name', 'cid', 'category', 'description', 'molecular_formula', 'molecular_weight',
+    'synonyms', 'inchi', 'inchikey', 'structure_image',
+)
+
+
+def smiles_hash(smiles):
+    mol = Chem.MolFromSmiles(smiles) if smiles else None
+    if mol is None:
+        return None
+    return hashlib.sha256(Chem.MolToSmiles(mol).encode()).hexdigest()
+
+
+def merge_duplicates(apps, schema_editor):
+    Compound = apps.get_model('api', 'Compound')
+    PredictionCompound = apps.get_model('api', 'PredictionCompound')
+
+    groups = {}
+    unhashed = {}
+    for pk, smiles, key in Compound.objects.order_by('pk').values_list('pk', 'smiles', 'smiles_hash').iterator():
+        if key is None:
+            key = smiles_hash(smiles)
+            if key is None:
+                continue
+            unhashed[pk] = key
+        groups.setdefault(key, []).append(pk)
+
+    for key, pks in groups.items():
+        if len(pks) < 2:
+            continue
+        # The oldest compound survives and takes over fields it lacks from its duplicates
+        survivor_pk, duplicate_pks = pks[0], pks[1:]
+        compounds = Compound.objects.in_bulk(pks)
+        survivor = compounds[survivor_pk]
+        for field in MERGED_FIELDS:
+            if getattr(survivor, field) is None:
+                values = [getattr(compounds[pk], field) for pk in duplicate_pks]
+                setattr(survivor, field, next((v for v in values if v is not None), None))
+
+        # Repoint results to the survivor, dropping those whose prediction already holds it
+        taken = set(PredictionCompound.objects.filter(compound_id=survivor_pk).values_list('prediction_id', flat=True))
+        repoint, drop = [], []
+        rows = PredictionCompound.objects.filter(compound_id__in=duplicate_pks).values_list('pk', 'prediction_id')
+        for pk, prediction_id in rows:
+            (drop if prediction_id in taken else repoint).append(pk)
+            taken.add(prediction_id)
+        PredictionCompound.objects.filter(pk__in=drop).delete()
+        PredictionCompound.objects.filter(pk__in=repoint).update(compound_id=survivor_pk)
+        Compound.objects.filter(pk__in=duplicate_pks).delete()
+
+        survivor.smiles_hash = key
+        survivor.save(update_fields=[*MERGED_FIELDS, 'smiles_hash'])
+        for pk in pks:
+            unhashed.pop(pk, None)
+
+    # Hash the remaining (unique) compounds only now, after duplicates are gone
+    updates = [Compound(pk=pk, smiles_hash=key) for pk, key in unhashed.items()]
+    Compound.objects.bulk_update(updates, ['smiles_hash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_cached_prediction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compound',
+            name='smiles_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # Duplicates must be merged before the unique index can be built (0004)
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
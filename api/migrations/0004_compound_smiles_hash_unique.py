@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_compound_smiles_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='compound',
+            name='smiles_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_compound_smiles_hash_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='input_smiles',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='progress_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='progress_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='standardize',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='prediction',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='prediction',
+            index=models.Index(fields=['status', 'created_at'], name='api_predict_status_179371_idx'),
+        ),
+    ]
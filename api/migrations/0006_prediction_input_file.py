@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_prediction_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='input_file',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
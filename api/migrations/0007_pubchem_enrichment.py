@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_prediction_input_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedPubChemRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='compound',
+            name='pubchem_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
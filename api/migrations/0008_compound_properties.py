@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_pubchem_enrichment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compound',
+            name='heavy_atoms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='compound',
+            name='logp',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
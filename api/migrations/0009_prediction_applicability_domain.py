@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_compound_properties'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictioncompound',
+            name='domain_max_similarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='predictioncompound',
+            name='domain_mean_similarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
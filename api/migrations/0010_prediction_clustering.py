@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_prediction_applicability_domain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionClustering',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('clusters', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('prediction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clusterings', to='api.prediction')),
+            ],
+            options={
+                'unique_together': {('prediction', 'key')},
+            },
+        ),
+    ]
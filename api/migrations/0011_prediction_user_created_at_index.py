@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-17 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_prediction_clustering'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prediction',
+            index=models.Index(fields=['user', 'created_at'], name='api_predict_user_id_37cc76_idx'),
+        ),
+    ]
@@ -25,8 +25,13 @@ class MLModel(models.Model):
 class Prediction(models.Model):
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),  # Job queue scans
+            models.Index(fields=['user', 'created_at']),  # Paginated prediction history
+        ]
     class Status(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
         COMPLETED = 'COMPLETED', 'Completed'
         FAILED = 'FAILED', 'Failed'
 
@@ -37,6 +42,15 @@ class Prediction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True) # Will be set by the collector task.
 
+    # Asynchronous jobs (see api.v1.predictions.jobs)
+    input_smiles = models.JSONField(null=True, blank=True)  # Queued input, cleared once the job ends
+    input_file = models.CharField(max_length=255, null=True, blank=True)  # Or the spooled CSV upload
+    standardize = models.BooleanField(default=False)
+    progress_total = models.PositiveIntegerField(default=0)  # Input SMILES to process
+    progress_done = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last progress from the worker running the job
+    error = models.TextField(null=True, blank=True)
+
     def __str__(self):
         return f"Prediction Job {self.id} ({self.status})"
 
@@ -44,6 +58,7 @@ class Compound(models.Model):
     iupac_name = models.CharField(max_length=255, null=True, blank=True)  
     cid = models.CharField(max_length=50, null=True, blank=True)  # Nullable and optional
     smiles = models.TextField(null=True, blank=True)  # Unique identifier
+    smiles_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)  # SHA-256 of the canonical SMILES
     ic50 = models.FloatField(null=True, blank=True)  # Nullable and optional
     lelp = models.FloatField(null=True, blank=True)  # Nullable and optional
     category = models.CharField(max_length=255, null=True, blank=True)  
@@ -55,6 +70,9 @@ class Compound(models.Model):
     inchikey = models.CharField(max_length=255, null=True, blank=True)  
     structure_image = models.URLField(null=True, blank=True)  # Keep as URL  
     created_at = models.DateTimeField(auto_now_add=True) 
+    heavy_atoms = models.PositiveIntegerField(null=True, blank=True)  # Computed with RDKit, used for LELP
+    logp = models.FloatField(null=True, blank=True)  # Crippen logP, computed with RDKit
+    pubchem_checked_at = models.DateTimeField(null=True, blank=True)  # Last PubChem enrichment attempt
 
     def __str__(self):
         return self.iupac_name or "Unnamed Compound"
@@ -69,10 +87,53 @@ class PredictionCompound(models.Model):
     ic50 = models.FloatField(null=True, blank=True)
     lelp = models.FloatField(null=True, blank=True)
 
+    # Applicability domain: highest and average Tanimoto similarity of the compound to
+    # the model's training set (null if the model ships without training fingerprints)
+    domain_max_similarity = models.FloatField(null=True, blank=True)
+    domain_mean_similarity = models.FloatField(null=True, blank=True)
+
     class Meta:
         # This constraint ensures you don't save a result for the same
         # compound twice within the same prediction job.
         unique_together = ('prediction', 'compound')
 
     def __str__(self):
-        return f"Result for {self.compound.name} in Job {self.prediction.id}"
\ No newline at end of file
+        return f"Result for {self.compound.name} in Job {self.prediction.id}"
+
+class PredictionClustering(models.Model):
+    # Cluster assignments of a prediction's compounds, computed on first request per
+    # key, e.g. "butina:0.60" (Tanimoto cutoff) or "scaffold"; see api.v1.predictions.clustering
+    prediction = models.ForeignKey(Prediction, related_name='clusterings', on_delete=models.CASCADE)
+    key = models.CharField(max_length=50)
+    clusters = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('prediction', 'key')
+
+    def __str__(self):
+        return f"{self.key} clustering of Prediction {self.prediction_id}"
+
+class CachedPrediction(models.Model):
+    # Predicted IC50 for a canonical SMILES, keyed by the SHA-256 of the model
+    # artifact that produced it, so a changed artifact never reuses old results.
+    artifact_checksum = models.CharField(max_length=64)
+    smiles = models.TextField()
+    ic50 = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('artifact_checksum', 'smiles')
+
+    def __str__(self):
+        return f"{self.smiles} ({self.artifact_checksum[:12]}): {self.ic50}"
+
+class CachedPubChemRecord(models.Model):
+    # One PubChem response per lookup key, e.g. "cid:<smiles hash>" or "properties:<cid>";
+    # data is NULL when PubChem had no record (negative cache entry).
+    key = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} ({'found' if self.data is not None else 'not found'})"
@@ -1,3 +1,691 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs
+import numpy as np
+import xgboost as xgb
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rdkit import Chem
+from api.v1.compounds.similarity import ROW_BYTES, SimilarityIndex, popcount_rows
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api.models import CachedPrediction, CachedPubChemRecord, Compound, MLModel, Prediction, PredictionCompound
+from api.v1.predictions.domain import ApplicabilityDomain
+from api.v1.predictions.enrichment import PubChemCache, PubChemClient, enrich_compounds
+from api.v1.predictions.jobs import claim_next_job, run_prediction_job
+from api.v1.predictions.featurizers import packed_to_csr, unpack_dense
+from api.v1.predictions.fingerprint_cache import FingerprintCache
+from api.v1.predictions.parsers import PayloadTooLarge, SmilesSpool, StreamingJSONParser
+from api.v1.predictions import scheduling
+from api.v1.predictions.persistence import create_prediction_compounds, get_or_create_compounds
+from api.v1.predictions.registry import sparse_safe_booster
+from api.v1.predictions.result_cache import PredictionResultCache
+from api.v1.predictions.streaming import stream_predictions
+from api.v1.predictions.views import PredictIC50View, PredictionViewSet
+from api.v1.predictions.pubchem_fingerprint import PUBCHEM_BITS, pubchem_on_bits
 
-# Create your tests here.
+TESTDATA_DIR = Path(__file__).resolve().parent / "testdata"
+
+
+class StreamingJSONParserTests(SimpleTestCase):
+    """Incremental parsing of predict request bodies, spooling large `smiles` arrays."""
+
+    def parse(self, body):
+        return StreamingJSONParser().parse(io.BytesIO(body.encode() if isinstance(body, str) else body))
+
+    def test_small_body(self):
+        data = self.parse('{"model_method": "xgb", "smiles": ["CCO", " c1ccccc1 ", "", 5], "run_async": false}')
+        self.assertEqual(data, {"model_method": "xgb", "smiles": ["CCO", "c1ccccc1"], "run_async": False})
+        self.assertEqual(self.parse("[1, 2]"), [1, 2])
+
+    def test_large_smiles_array_is_spooled(self):
+        # Includes SMILES that need CSV quoting
+        smiles = [f"C{'C' * (i % 50)}O" if i % 7 else f'C(Cl)(Br)"{i}",N' for i in range(5000)]
+        data = self.parse(json.dumps({"smiles": smiles, "model_descriptor": "ecfp"}))
+        self.assertIsInstance(data["smiles"], SmilesSpool)
+        self.assertEqual(len(data["smiles"]), len(smiles))
+        self.assertEqual(list(data["smiles"]), smiles)
+        self.assertEqual(data["model_descriptor"], "ecfp")
+
+    def test_malformed_body(self):
+        for body in ('{"smiles": ["CCO", "CCN"', '{"smiles": ["CCO" "CCN"]}', '{"smiles": []} x', '{1: 2}', ""):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(body)
+
+    def test_malformed_body_is_a_bad_request(self):
+        request = APIRequestFactory().post("/", '{"smiles": ["CCO", ', content_type="application/json")
+        force_authenticate(request, user=get_user_model()(username="parser", role="user"))
+        response = PredictIC50View.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(PREDICTION_JSON_MAX_BYTES=200_000, PREDICTION_JSON_MAX_SMILES=2000)
+    def test_oversized_body(self):
+        with self.assertRaises(PayloadTooLarge) as raised:
+            self.parse(json.dumps({"smiles": ["C" * 200] * 1900}))
+        self.assertEqual(raised.exception.status_code, 413)
+        with self.assertRaises(PayloadTooLarge):
+            self.parse(json.dumps({"smiles": ["C"] * 2001}))
+        self.assertEqual(len(self.parse(json.dumps({"smiles": ["C"] * 2000}))["smiles"]), 2000)
+
+
+class PubChemFingerprintTests(SimpleTestCase):
+    """The native PubChem fingerprint against CACTVS fingerprints downloaded from PubChem."""
+
+    def test_matches_reference_fingerprints(self):
+        with open(TESTDATA_DIR / "pubchem_fingerprints.csv", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertTrue(rows)
+        for row in rows:
+            with self.subTest(smiles=row["smiles"]):
+                self.assertEqual(len(row["fingerprint"]), PUBCHEM_BITS)
+                expected = [bit for bit, c in enumerate(row["fingerprint"]) if c == "1"]
+                self.assertEqual(pubchem_on_bits(Chem.MolFromSmiles(row["smiles"])), expected)
+
+
+class SparseInferenceTests(SimpleTestCase):
+    """CSR fingerprints give the same predictions as dense ones once the booster is made sparse-safe."""
+
+    def test_sparse_predictions_match_dense(self):
+        rng = np.random.default_rng(0)
+        n_bits = 64
+        bits = rng.random((500, n_bits)) < 0.1
+        target = bits[:, :8].sum(axis=1) + rng.normal(scale=0.1, size=len(bits))
+        # Trained on dense fingerprints, like the shipped models
+        booster = xgb.train(
+            {"max_depth": 4, "eta": 0.3, "tree_method": "hist"},
+            xgb.DMatrix(bits.astype(np.float32), label=target),
+            num_boost_round=20,
+        )
+        booster = sparse_safe_booster(booster)
+
+        packed = np.packbits(rng.random((200, n_bits)) < 0.1, axis=1)
+        dense = booster.predict(xgb.DMatrix(unpack_dense(packed, n_bits)))
+        sparse = booster.inplace_predict(packed_to_csr(packed, n_bits))
+        np.testing.assert_array_equal(sparse, dense)
+
+
+class ApplicabilityDomainTests(SimpleTestCase):
+    """Packed-plane scoring against a per-pair Tanimoto computation."""
+
+    def test_scores_match_per_pair_tanimoto(self):
+        rng = np.random.default_rng(0)
+        width = 2048
+        # Spans several training tiles, the last one partial
+        training = rng.random((9001, width)) < 0.02
+        queries = rng.random((300, width)) < 0.02
+        queries[0] = False
+        domain = ApplicabilityDomain(np.packbits(training, axis=1), width)
+        self.assertEqual(domain.nbytes, width * (len(training) + 7) // 8 + 4 * len(training))
+
+        best, mean = domain.score(packed_to_csr(np.packbits(queries, axis=1), width))
+        common = queries.astype(np.float32) @ training.T.astype(np.float32)
+        union = queries.sum(axis=1)[:, None] + training.sum(axis=1) - common
+        similarity = np.where(union > 0, common / np.maximum(union, 1), 0)
+        np.testing.assert_allclose(best, similarity.max(axis=1), rtol=1e-6)
+        np.testing.assert_allclose(mean, similarity.mean(axis=1), rtol=1e-5, atol=1e-7)
+
+
+class FingerprintCacheTests(SimpleTestCase):
+    """Row counting, eviction and last_used refreshes of the SQLite fingerprint store."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = FingerprintCache(Path(directory.name) / "fingerprints.sqlite3", max_entries=100)
+
+    def query(self, sql):
+        return self.cache._connection().execute(sql).fetchall()
+
+    def test_row_count_tracks_inserts_and_evictions(self):
+        self.cache.set_many({f"C{i}": b"\x01" for i in range(80)}, "ecfp", 8)
+        self.cache.set_many({f"C{i}": b"\x01" for i in range(60, 120)}, "ecfp", 8)
+        # 120 distinct rows exceed 100, so the store is trimmed to 90
+        self.assertEqual(self.query("SELECT row_count FROM fingerprint_stats"), [(90,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM fingerprints"), [(90,)])
+
+    def test_only_stale_hits_are_refreshed(self):
+        self.cache.set_many({"CCO": b"\x01", "CCN": b"\x02"}, "ecfp", 8)
+        self.cache._connection().execute("UPDATE fingerprints SET last_used = 0 WHERE smiles = 'CCO'")
+        fresh = dict(self.query("SELECT smiles, last_used FROM fingerprints"))["CCN"]
+        self.assertEqual(self.cache.get_many(["CCO", "CCN", "CCC"], "ecfp"), {"CCO": b"\x01", "CCN": b"\x02"})
+        last_used = dict(self.query("SELECT smiles, last_used FROM fingerprints"))
+        self.assertGreater(last_used["CCO"], 0)
+        self.assertEqual(last_used["CCN"], fresh)
+
+
+class SimilarityIndexTests(SimpleTestCase):
+    """Top-k Tanimoto search over the base segment and delta, optionally restricted to some compounds."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        rng = np.random.default_rng(0)
+        self.ids = np.arange(1, 401, dtype=np.int64)
+        # Sparse rows, like ECFP, with a few bits common enough to be stored as bitmaps
+        bits = rng.random((len(self.ids), ROW_BYTES * 8)) < 0.02
+        bits[:, :4] = rng.random((len(self.ids), 4)) < 0.5
+        self.fingerprints = np.packbits(bits, axis=1)
+        self.index = SimilarityIndex(Path(directory.name), delta_max_rows=10_000)
+        self.index.rebuild(self.ids[:300], self.fingerprints[:300])
+        self.index.add(self.ids[300:], self.fingerprints[300:])
+
+    def expected(self, query, k, threshold, allowed_ids=None):
+        common = popcount_rows(self.fingerprints & query).astype(np.float32)
+        similarities = common / (popcount_rows(self.fingerprints) + popcount_rows(query[None])[0] - common)
+        keep = similarities >= threshold
+        if allowed_ids is not None:
+            keep &= np.isin(self.ids, allowed_ids)
+        rows = np.flatnonzero(keep)
+        rows = rows[np.argsort(-similarities[rows], kind="stable")][:k]
+        return similarities[rows]
+
+    def test_search_matches_brute_force(self):
+        query = self.fingerprints[7]
+        ids, similarities = self.index.search(query, k=10)
+        self.assertEqual(ids[0], self.ids[7])
+        np.testing.assert_allclose(similarities, self.expected(query, 10, 0.0), rtol=1e-6)
+
+    def test_search_restricted_to_allowed_ids(self):
+        query = self.fingerprints[0]
+        # Every other compound from both the base segment and the delta, without the query itself
+        allowed_ids = self.ids[1::2]
+        for k, threshold in ((5, 0.0), (50, 0.1), (1000, 0.0)):
+            with self.subTest(k=k, threshold=threshold):
+                ids, similarities = self.index.search(query, k, threshold, allowed_ids)
+                self.assertTrue(np.isin(ids, allowed_ids).all())
+                np.testing.assert_allclose(similarities, self.expected(query, k, threshold, allowed_ids), rtol=1e-6)
+
+    def test_search_with_no_allowed_ids(self):
+        ids, _ = self.index.search(self.fingerprints[0], 10, 0.0, np.zeros(0, dtype=np.int64))
+        self.assertEqual(len(ids), 0)
+
+
+class PredictionResultCacheTests(TestCase):
+    """Predictions of superseded artifacts are dropped from both tiers."""
+
+    def setUp(self):
+        self.cache = PredictionResultCache(max_entries=100)
+        self.cache.set_many("old", {"CCO": 1.0, "CCN": 2.0})
+        self.cache.set_many("new", {"CCO": 3.0})
+
+    def assertCached(self, expected):
+        rows = CachedPrediction.objects.values_list("artifact_checksum", "smiles")
+        self.assertEqual(set(rows), expected)
+        self.assertEqual(set(self.cache._entries), expected)
+
+    def test_discard(self):
+        self.assertEqual(self.cache.discard("old"), 2)
+        self.assertCached({("new", "CCO")})
+        self.assertEqual(self.cache.get_many("old", ["CCO", "CCN"]), {})
+
+    def test_prune(self):
+        self.assertEqual(self.cache.prune({"new"}), 2)
+        self.assertCached({("new", "CCO")})
+        self.assertEqual(self.cache.get_many("new", ["CCO"]), {"CCO": 3.0})
+
+
+class PersistenceQueryTests(TestCase):
+    """Persisting results takes the same number of queries whatever the batch size."""
+
+    # Sizes stay under SQLite's bound-parameter limit, past which statements are split
+    SIZES = (2, 10, 100)
+
+    def test_query_count_is_constant(self):
+        for size in self.SIZES:
+            smiles = [f"C{'C' * i}O" for i in range(size)]  # Distinct alcohols
+            with self.subTest(size=size), transaction.atomic():
+                prediction = Prediction.objects.create(status=Prediction.Status.COMPLETED)
+                with self.assertNumQueries(5):
+                    # New compounds: one lookup plus one insert
+                    get_or_create_compounds(smiles[:size // 2])
+                    # Half existing, half new
+                    compounds = get_or_create_compounds(smiles)
+                    create_prediction_compounds(prediction, [(compounds[s], 1.0, None, None) for s in smiles])
+                transaction.set_rollback(True)
+
+
+class PredictionJobTests(TestCase):
+    """Claiming jobs from the queue, and running them chunk by chunk."""
+
+    def setUp(self):
+        self.users = [get_user_model().objects.create(username=f"jobs-{i}", role="user") for i in range(2)]
+        self.ml_model = MLModel.objects.create(
+            name="test", method="xgb", descriptor="ecfp", version="1", file_path="test.json"
+        )
+
+    def job(self, user, age, status=Prediction.Status.PENDING, heartbeat_age=None, smiles=("CCO",)):
+        """A job created age seconds ago, last reporting progress heartbeat_age seconds ago."""
+        prediction = Prediction.objects.create(
+            user=user, ml_model=self.ml_model, status=status, input_smiles=list(smiles)
+        )
+        Prediction.objects.filter(pk=prediction.pk).update(
+            created_at=timezone.now() - timedelta(seconds=age),
+            heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age) if heartbeat_age is not None else None,
+        )
+        return prediction
+
+    def test_busy_users_are_skipped(self):
+        first, second = self.users
+        self.job(first, 30, Prediction.Status.RUNNING, heartbeat_age=0)
+        self.job(first, 20)
+        waiting = self.job(second, 10)
+        # first is at PREDICTION_JOB_MAX_RUNNING_PER_USER, so its older job waits
+        with override_settings(PREDICTION_JOB_MAX_RUNNING_PER_USER=1):
+            self.assertEqual(claim_next_job().pk, waiting.pk)
+            self.assertIsNone(claim_next_job())
+
+    @override_settings(PREDICTION_JOB_MAX_RUNNING_PER_USER=2)
+    def test_user_with_fewest_running_jobs_goes_first(self):
+        first, second = self.users
+        self.job(first, 40, Prediction.Status.RUNNING, heartbeat_age=0)
+        older = self.job(first, 30)
+        newer = self.job(second, 20)
+        self.assertEqual(claim_next_job().pk, newer.pk)
+        # Both now run one job, so the oldest job wins
+        self.assertEqual(claim_next_job().pk, older.pk)
+        self.assertEqual(Prediction.objects.get(pk=older.pk).status, Prediction.Status.RUNNING)
+
+    @override_settings(PREDICTION_JOB_LEASE_SECONDS=60)
+    def test_stale_running_job_is_reclaimed(self):
+        first, second = self.users
+        self.job(first, 30, Prediction.Status.RUNNING, heartbeat_age=10)
+        abandoned = self.job(second, 20, Prediction.Status.RUNNING, heartbeat_age=120)
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, abandoned.pk)
+        self.assertGreater(claimed.heartbeat_at, timezone.now() - timedelta(seconds=10))
+        self.assertIsNone(claim_next_job())
+
+    def run_job(self, prediction, **kwargs):
+        """Run a job with a stand-in model that predicts the length of each SMILES."""
+        scored = []
+
+        def predict(smiles_list, model_specs, properties=None, domains=None):
+            scored.extend(smiles_list)
+            domains.append({})
+            return [[float(len(smiles)) for smiles in smiles_list]], [{"hits": 0, "misses": len(smiles_list)}]
+
+        with mock.patch("api.v1.predictions.jobs.predict_batch_multi", predict):
+            run_prediction_job(Prediction.objects.select_related("ml_model").get(pk=prediction.pk), **kwargs)
+        prediction.refresh_from_db()
+        return scored
+
+    def test_run_skips_stored_compounds(self):
+        prediction = self.job(self.users[0], 0, Prediction.Status.RUNNING, smiles=["CCO", "CCN", "OCC", "CCC", "xx"])
+        # Left by a worker that died mid-job
+        compounds = get_or_create_compounds(["CCO"])
+        create_prediction_compounds(prediction, [(compounds["CCO"], 1.0, None, None)])
+
+        scored = self.run_job(prediction, chunk_size=2)
+        self.assertEqual(scored, ["CCN", "CCC"])
+        self.assertEqual(prediction.status, Prediction.Status.COMPLETED)
+        self.assertEqual((prediction.progress_done, prediction.progress_total), (5, 5))
+        self.assertIsNone(prediction.input_smiles)
+        self.assertEqual(
+            dict(prediction.prediction_compounds.values_list("compound__smiles", "ic50")),
+            {"CCO": 1.0, "CCN": 3.0, "CCC": 3.0},
+        )
+
+    def test_rows_already_written_by_another_worker_are_kept(self):
+        prediction = self.job(self.users[0], 0, Prediction.Status.RUNNING)
+        compounds = get_or_create_compounds(["CCO"])
+        create_prediction_compounds(prediction, [(compounds["CCO"], 1.0, None, None)])
+        create_prediction_compounds(prediction, [(compounds["CCO"], 2.0, None, None)])
+        self.assertEqual(list(prediction.prediction_compounds.values_list("ic50", flat=True)), [1.0])
+
+    def test_run_without_valid_smiles_fails(self):
+        prediction = self.job(self.users[0], 0, Prediction.Status.RUNNING, smiles=["xx", "yy"])
+        with self.assertLogs("api.v1.predictions.jobs", "ERROR"):
+            self.assertEqual(self.run_job(prediction), [])
+        self.assertEqual(prediction.status, Prediction.Status.FAILED)
+        self.assertEqual(prediction.error, "No valid SMILES strings provided.")
+        self.assertIsNone(prediction.input_smiles)
+        self.assertIsNotNone(prediction.completed_at)
+
+
+class LaneAdmissionTests(TestCase):
+    """Synchronous predictions are refused with 503 or 429 and Retry-After once their lane is full."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        limits = override_settings(
+            PREDICTION_LANE_DIR=Path(directory.name),
+            PREDICTION_FAST_LANE_SLOTS=2,
+            PREDICTION_FAST_LANE_WAIT_SECONDS=0.05,
+            PREDICTION_BULK_LANE_SLOTS=2,
+            PREDICTION_BULK_LANE_PER_USER=1,
+            PREDICTION_RETRY_AFTER_SECONDS=7,
+        )
+        limits.enable()
+        self.addCleanup(limits.disable)
+        # Lanes are built from the settings above on first use
+        lanes = mock.patch.object(scheduling, "_lanes", None)
+        lanes.start()
+        self.addCleanup(lanes.stop)
+
+        self.user = get_user_model().objects.create(username="lanes", role="user")
+        MLModel.objects.create(name="test", method="xgb", descriptor="ecfp", version="1", file_path="test.json")
+        self.held = ExitStack()
+        self.addCleanup(self.held.close)
+
+    def post(self, smiles):
+        request = APIRequestFactory().post(
+            "/", {"model_method": "xgb", "model_descriptor": "ecfp", "smiles": smiles}, format="json"
+        )
+        force_authenticate(request, user=self.user)
+        return PredictIC50View.as_view()(request)
+
+    def test_full_lane(self):
+        fast = scheduling.get_lanes()[scheduling.FAST_LANE]
+        for _ in range(fast.slots):
+            self.held.enter_context(fast.admit())
+        self.assertEqual(fast.in_use(), 2)
+
+        response = self.post(["CCO"])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(fast.stats()["rejected"], 1)
+        # Slots are released with their holders
+        self.held.close()
+        self.assertEqual(fast.in_use(), 0)
+
+    def test_per_user_limit(self):
+        bulk = scheduling.get_lanes()[scheduling.BULK_LANE]
+        self.held.enter_context(bulk.admit(self.user.id))
+        # One bulk slot is still free, but this user already holds their share
+        response = self.post(["C" * i + "O" for i in range(1, settings.PREDICTION_FAST_LANE_MAX_SMILES + 2)])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(bulk.in_use(), 1)
+
+
+class StreamPredictionsTests(TestCase):
+    """NDJSON streaming of synchronous predictions, with a stand-in model."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="stream", role="user")
+        self.ml_models = [
+            MLModel.objects.create(name=f"test {i}", method="xgb", descriptor="ecfp", version=str(i), file_path=f"test{i}.json")
+            for i in range(2)
+        ]
+
+        def predict(smiles_list, model_specs, properties=None, domains=None):
+            domains.extend({} for _ in model_specs)
+            return (
+                [[float(len(smiles) + m) for smiles in smiles_list] for m in range(len(model_specs))],
+                [{"hits": 0, "misses": len(smiles_list)} for _ in model_specs],
+            )
+
+        patcher = mock.patch("api.v1.predictions.streaming.predict_batch_multi", predict)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, smiles_list):
+        return stream_predictions(
+            self.user, self.ml_models, smiles_list, False, "text", chunk_size=2,
+            compound_payload=lambda compound: {"id": compound.id, "smiles": compound.smiles},
+            serialize_model=lambda ml_model: ml_model.id,
+        )
+
+    def test_lines(self):
+        smiles = ["CCO", "xx", "OCC", "CCN"]
+        with mock.patch("api.v1.predictions.streaming.compute_lelp", return_value=0.5) as compute_lelp:
+            lines = [json.loads(line) for line in self.stream(smiles)]
+        # Once per molecule and model, for the stored row and the streamed line alike
+        self.assertEqual(compute_lelp.call_count, 2 * len(self.ml_models))
+
+        header, *results, summary = lines
+        self.assertEqual(header["type"], "header")
+        prediction_ids = [p["prediction_id"] for p in header["predictions"]]
+        self.assertEqual([r["type"] for r in results], ["result"] * len(smiles) * len(self.ml_models))
+        self.assertEqual([r["smiles"] for r in results[::2]], smiles)
+        self.assertEqual([r["prediction_id"] for r in results[:2]], prediction_ids)
+        invalid = results[2]
+        self.assertEqual((invalid["ic50"], invalid["error"]), (None, "Invalid SMILES input"))
+        # OCC is CCO: the compound is sent with its first line only
+        self.assertEqual(results[0]["compound"]["smiles"], "CCO")
+        self.assertEqual((results[4]["compound_id"], results[4]["compound"]), (results[0]["compound_id"], None))
+        self.assertEqual((results[1]["ic50"], results[1]["lelp"]), (4.0, 0.5))
+        self.assertEqual(summary["type"], "summary")
+
+        for prediction_id in prediction_ids:
+            prediction = Prediction.objects.get(pk=prediction_id)
+            self.assertEqual(prediction.status, Prediction.Status.COMPLETED)
+            self.assertEqual(prediction.prediction_compounds.count(), 2)
+
+    def test_closed_stream_fails_the_predictions(self):
+        lines = self.stream(["CCO", "CCN", "CCC", "CCCC"])
+        header = json.loads(next(lines))
+        next(lines)
+        lines.close()
+        for p in header["predictions"]:
+            prediction = Prediction.objects.get(pk=p["prediction_id"])
+            self.assertEqual(prediction.status, Prediction.Status.FAILED)
+            self.assertEqual(prediction.error, "Stream closed before completion.")
+            # The chunk scored before the client went away is kept
+            self.assertEqual(prediction.prediction_compounds.count(), 2)
+
+
+class PredictionQueryTests(TestCase):
+    """
+    Listing a user's predictions takes the same number of queries however many they
+    have, and retrieving one however many compounds it holds.
+    """
+
+    SIZES = (1, 10, 100)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="prediction-queries", role="user")
+        self.ml_model = MLModel.objects.create(name="test", method="xgb", descriptor="ecfp", version="1")
+        self.factory = APIRequestFactory()
+
+    def create_predictions(self, size):
+        """size predictions of size compounds each."""
+        smiles = [f"C{'C' * i}O" for i in range(size)]
+        compounds = get_or_create_compounds(smiles)
+        predictions = []
+        for _ in range(size):
+            prediction = Prediction.objects.create(
+                user=self.user, ml_model=self.ml_model, status=Prediction.Status.COMPLETED
+            )
+            create_prediction_compounds(prediction, [(compounds[s], 1.0, None, None) for s in smiles])
+            predictions.append(prediction)
+        return predictions
+
+    def get(self, action, **kwargs):
+        request = self.factory.get("/")
+        force_authenticate(request, user=self.user)
+        response = PredictionViewSet.as_view({"get": action})(request, **kwargs)
+        response.render()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_query_count_is_constant(self):
+        for size in self.SIZES:
+            with self.subTest(size=size), transaction.atomic():
+                self.create_predictions(size)
+                with self.assertNumQueries(1):
+                    response = self.get("list")
+                self.assertEqual(len(response.data["results"]), min(size, settings.PREDICTION_PAGE_SIZE))
+                transaction.set_rollback(True)
+
+    def test_detail_query_count_is_constant(self):
+        for size in self.SIZES:
+            with self.subTest(size=size), transaction.atomic():
+                predictions = self.create_predictions(size)
+                with self.assertNumQueries(2):
+                    response = self.get("retrieve", pk=predictions[0].pk)
+                self.assertEqual(len(response.data["prediction_compounds"]), size)
+                transaction.set_rollback(True)
+
+
+class _PubChemStandIn(BaseHTTPRequestHandler):
+    """Answers the PUG REST calls PubChemClient makes from canned data, counting each one."""
+
+    CIDS = {"CCO": 702, "c1ccccc1": 241, "CC(=O)Oc1ccccc1C(=O)O": 2244, "CCCC": 7843, "CCN": 0}
+    PROPERTIES = {702: {"IUPACName": "ethanol"}, 241: {"IUPACName": "benzene"}, 2244: {"IUPACName": "2-acetyloxybenzoic acid"}}
+    SYNONYMS = {702: ["ethanol", "ethyl alcohol"], 241: ["benzene", "benzol"], 2244: ["aspirin", "acetylsalicylic acid"]}
+    DESCRIPTIONS = {2244: "Aspirin is a member of the class of benzoic acids."}
+    calls = Counter()
+    delay = 0.0
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        path = self.path.split("/rest/pug/", 1)[1]
+        self.calls[path.split("/")[1]] += 1
+        time.sleep(self.delay)
+
+        if path == "compound/smiles/cids/JSON":
+            smiles = form["smiles"][0]
+            self.calls[f"smiles:{smiles}"] += 1
+            if smiles not in self.CIDS:
+                return self._send(404, {"Fault": {"Code": "PUGREST.NotFound"}})
+            return self._send(200, {"IdentifierList": {"CID": [self.CIDS[smiles]]}})
+
+        cids = [int(c) for c in form["cid"][0].split(",")]
+        if path.startswith("compound/cid/property/"):
+            rows = [{"CID": c, **self.PROPERTIES[c]} for c in cids if c in self.PROPERTIES]
+            return self._send(200, {"PropertyTable": {"Properties": rows}})
+        if path == "compound/cid/synonyms/JSON":
+            info = [{"CID": c, "Synonym": self.SYNONYMS[c]} for c in cids if c in self.SYNONYMS]
+            return self._send(200, {"InformationList": {"Information": info}})
+        info = [{"CID": c, "Description": self.DESCRIPTIONS[c]} for c in cids if c in self.DESCRIPTIONS]
+        if not info:
+            return self._send(404, {"Fault": {"Code": "PUGREST.NotFound"}})
+        return self._send(200, {"InformationList": {"Information": info}})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _MemoryPubChemCache:
+    """In-process PubChemCache for lookups from other threads, which cannot see the test transaction."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get_many(self, keys):
+        return {key: self.values[key] for key in keys if key in self.values}
+
+    def set_many(self, values):
+        self.values.update(values)
+
+
+class PubChemEnrichmentTests(TestCase):
+    """PubChemClient and enrich_compounds against a local stand-in for PUG REST."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _PubChemStandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/rest/pug"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _PubChemStandIn.calls.clear()
+
+    def pubchem_client(self, rate=1000, cache=None):
+        return PubChemClient(self.base_url, rate, 100, 5, cache or PubChemCache(timedelta(days=1), timedelta(hours=1)))
+
+    def test_batching_and_cache(self):
+        client = self.pubchem_client()
+        smiles = ["CCO", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "CCN", "C[Xe]"]
+        cids = client.cids(smiles)
+        self.assertEqual(cids, {"CCO": 702, "c1ccccc1": 241, "CC(=O)Oc1ccccc1C(=O)O": 2244, "CCN": None, "C[Xe]": None})
+        found = sorted(cid for cid in cids.values() if cid)
+        details = (client.properties(found), client.synonyms(found), client.descriptions(found))
+        # One request per SMILES, then one batched request per kind of CID data
+        self.assertEqual((_PubChemStandIn.calls["smiles"], _PubChemStandIn.calls["cid"]), (len(smiles), 3))
+
+        # Found and not-found entries are both served from the cache
+        _PubChemStandIn.calls.clear()
+        again = client.cids(smiles), client.properties(found), client.synonyms(found), client.descriptions(found)
+        self.assertEqual(again, (cids, *details))
+        self.assertEqual(sum(_PubChemStandIn.calls.values()), 0)
+
+    def test_expired_entries_are_refetched(self):
+        client = self.pubchem_client()
+        client.cids(["CCO", "C[Xe]"])
+        # Past the negative TTL but within the TTL: only the "not found" entry is retried
+        CachedPubChemRecord.objects.update(fetched_at=timezone.now() - timedelta(hours=2))
+        _PubChemStandIn.calls.clear()
+        self.assertEqual(client.cids(["CCO", "C[Xe]"]), {"CCO": 702, "C[Xe]": None})
+        self.assertEqual(_PubChemStandIn.calls["smiles:C[Xe]"], 1)
+        self.assertEqual(_PubChemStandIn.calls["smiles:CCO"], 0)
+
+        CachedPubChemRecord.objects.update(fetched_at=timezone.now() - timedelta(days=2))
+        _PubChemStandIn.calls.clear()
+        client.cids(["CCO", "C[Xe]"])
+        self.assertEqual(_PubChemStandIn.calls["smiles"], 2)
+
+    def test_concurrent_lookups_share_a_request(self):
+        client = self.pubchem_client(cache=_MemoryPubChemCache())
+        threads_count = 8
+        barrier = threading.Barrier(threads_count)
+        results = []
+
+        def lookup():
+            barrier.wait()
+            results.append(client.cids(["CCCC"]))
+
+        _PubChemStandIn.delay = 0.2  # Keep the first request in flight while the others arrive
+        self.addCleanup(setattr, _PubChemStandIn, "delay", 0.0)
+        threads = [threading.Thread(target=lookup) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(_PubChemStandIn.calls["smiles:CCCC"], 1)
+        self.assertEqual(results, [{"CCCC": 7843}] * threads_count)
+
+    def test_rate_limit(self):
+        rate = 20
+        client = self.pubchem_client(rate=rate)
+        count = 2 * rate + 1
+        start = time.perf_counter()
+        client.cids([f"[Xe]{'C' * i}" for i in range(1, count + 1)])  # Uncached, not found
+        elapsed = time.perf_counter() - start
+        # A full bucket allows an initial burst; the rest are paced
+        self.assertGreaterEqual(elapsed, (count - client._bucket.capacity) / rate * 0.9)
+        self.assertEqual(_PubChemStandIn.calls["smiles"], count)
+
+    def test_enrich_compounds(self):
+        ethanol = Compound.objects.create(smiles="CCO", iupac_name="local")
+        unknown = Compound.objects.create(smiles="C[Xe]")
+        self.assertEqual(enrich_compounds([ethanol, unknown], self.pubchem_client()), 1)
+        ethanol.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual(ethanol.cid, "702")
+        self.assertEqual(ethanol.synonyms, "ethanol, ethyl alcohol")
+        # Values already set are kept
+        self.assertEqual(ethanol.iupac_name, "local")
+        # Compounds PubChem does not know are marked checked
+        self.assertIsNone(unknown.cid)
+        self.assertIsNotNone(unknown.pubchem_checked_at)
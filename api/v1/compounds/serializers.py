@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from api.models import Compound, Prediction, PredictionCompound  # Adjust the import based on your actual model location
 
@@ -21,4 +22,15 @@ class PredictionCompoundSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PredictionCompound
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class SimilarityQuerySerializer(serializers.Serializer):
+    smiles = serializers.CharField(help_text="Query structure as SMILES")
+    k = serializers.IntegerField(
+        required=False, default=10, min_value=1, max_value=settings.SIMILARITY_MAX_RESULTS,
+        help_text="Return at most this many compounds, most similar first"
+    )
+    threshold = serializers.FloatField(
+        required=False, default=0.0, min_value=0.0, max_value=1.0,
+        help_text="Only return compounds with at least this Tanimoto similarity"
+    )
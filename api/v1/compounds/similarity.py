@@ -0,0 +1,336 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from api.v1.predictions.featurizers import ECFP_BITS, ecfp_key
+from api.v1.predictions.utils import featurize_blocks
+
+LOGGER = logging.getLogger(__name__)
+
+# Compounds are indexed by the ECFP the models use, so their fingerprints come from the shared cache
+FINGERPRINT_KEY = ecfp_key()
+ROW_BYTES = ECFP_BITS // 8
+# Set bits in every byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_BASE_ARRAYS = ("ids", "counts", "indptr", "postings", "dense_index", "columns", "fingerprints")
+_BUILD_CHUNK = 65536
+# Bits set in at least 1 in this many compounds are stored as bitmaps rather than posting lists
+_DENSE_FRACTION = 16
+
+
+def popcount_rows(packed):
+    """Set bits in each row of a packed (n, ROW_BYTES) block."""
+    return _POPCOUNT[packed].sum(axis=1, dtype=np.uint16)
+
+
+def build_postings(fingerprints):
+    """
+    Invert packed fingerprints into per-bit row sets. Returns (indptr, postings,
+    dense_index, columns): the rows with a rare bit b are postings[indptr[b]:indptr[b + 1]]
+    in ascending order; a bit set in at least 1/_DENSE_FRACTION of the rows is instead
+    stored as a packed bitmap over all rows, columns[dense_index[b]] (dense_index is -1
+    for the other bits), which is cheaper to count than a long posting list. Works in row
+    chunks, so the only large allocations are the outputs.
+    """
+    counts = np.zeros(ECFP_BITS, dtype=np.int64)
+    for start in range(0, len(fingerprints), _BUILD_CHUNK):
+        counts += np.unpackbits(fingerprints[start:start + _BUILD_CHUNK], axis=1).sum(axis=0, dtype=np.int64)
+    dense_bits = np.flatnonzero(counts * _DENSE_FRACTION >= max(len(fingerprints), 1))
+    dense_index = np.full(ECFP_BITS, -1, dtype=np.int32)
+    dense_index[dense_bits] = np.arange(len(dense_bits))
+    counts[dense_bits] = 0
+    indptr = np.zeros(ECFP_BITS + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    postings = np.empty(indptr[-1], dtype=np.int32)
+    columns = []
+    cursor = indptr[:-1].copy()
+    for start in range(0, len(fingerprints), _BUILD_CHUNK):
+        bits = np.unpackbits(fingerprints[start:start + _BUILD_CHUNK], axis=1)
+        # _BUILD_CHUNK is a multiple of 8, so the chunks' packed columns line up
+        columns.append(np.packbits(bits[:, dense_bits].T, axis=1))
+        bits[:, dense_bits] = 0
+        rows, bits = np.nonzero(bits)
+        order = np.argsort(bits, kind="stable")  # Keeps rows ascending within each bit
+        rows, bits = rows[order] + start, bits[order]
+        chunk_counts = np.bincount(bits, minlength=ECFP_BITS)
+        group_start = np.zeros(ECFP_BITS, dtype=np.int64)
+        np.cumsum(chunk_counts[:-1], out=group_start[1:])
+        postings[cursor[bits] + np.arange(len(bits)) - group_start[bits]] = rows
+        cursor += chunk_counts
+    columns = np.concatenate(columns, axis=1) if columns else np.zeros((len(dense_bits), 0), dtype=np.uint8)
+    return indptr, postings, dense_index, columns
+
+
+class SimilarityIndex:
+    """
+    Tanimoto search over the ECFP fingerprints of every stored compound.
+
+    The index lives in `directory`, shared by every worker on the host. It has two parts:
+
+    - a base segment of .npy arrays (compound ids, set-bit counts, which rows have each
+      bit as posting lists or bitmaps, see build_postings, and the packed fingerprints),
+      memory-mapped by each worker; the intersection with a query is counted from the
+      row sets of its ~50 bits, so a query does not touch every fingerprint
+    - an append-only delta of compounds added since, as raw packed rows that are
+      scanned directly
+
+    Compounds are appended to the delta as they are stored (see index_compounds). Once
+    it passes delta_max_rows it is merged into a new base segment in the background,
+    and readers switch over on their next query. Both parts belong to a generation
+    named in the CURRENT file; writers serialize on an flock.
+    """
+
+    def __init__(self, directory, delta_max_rows):
+        self.directory = directory
+        self.delta_max_rows = delta_max_rows
+        self._generation = None
+        self._base = None
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    # --- Files ---
+
+    def _path(self, generation, name):
+        return self.directory / f"g{generation}-{name}"
+
+    def _read_current(self):
+        try:
+            return json.loads((self.directory / "CURRENT").read_text())["generation"]
+        except FileNotFoundError:
+            return None
+
+    def _write_current(self, generation):
+        tmp = self.directory / "CURRENT.tmp"
+        tmp.write_text(json.dumps({"generation": generation, "fingerprint": FINGERPRINT_KEY}))
+        os.replace(tmp, self.directory / "CURRENT")
+
+    @contextmanager
+    def _locked(self, name="write", blocking=True):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / f"{name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    def _write_base(self, generation, ids, fingerprints):
+        indptr, postings, dense_index, columns = build_postings(fingerprints)
+        arrays = {
+            "ids": ids, "counts": popcount_rows(fingerprints), "indptr": indptr, "postings": postings,
+            "dense_index": dense_index, "columns": columns, "fingerprints": fingerprints,
+        }
+        for name, array in arrays.items():
+            tmp = self._path(generation, f"{name}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, self._path(generation, f"{name}.npy"))
+        for name in ("delta.ids", "delta.fps"):
+            open(self._path(generation, name), "wb").close()
+
+    def _load_base(self, generation):
+        base = {}
+        for name in _BASE_ARRAYS:
+            path = self._path(generation, f"{name}.npy")
+            try:
+                base[name] = np.load(path, mmap_mode="r")
+            except ValueError:  # Empty arrays cannot be memory-mapped
+                base[name] = np.load(path)
+        return base
+
+    def _read_delta(self, generation):
+        ids_path, fps_path = self._path(generation, "delta.ids"), self._path(generation, "delta.fps")
+        # Rows are written fingerprint first, so an id is only visible once its row is complete
+        n = min(ids_path.stat().st_size // 8, fps_path.stat().st_size // ROW_BYTES)
+        ids = np.fromfile(ids_path, dtype=np.int64, count=n)
+        fingerprints = np.fromfile(fps_path, dtype=np.uint8, count=n * ROW_BYTES).reshape(n, ROW_BYTES)
+        return ids, fingerprints
+
+    def _ensure_initialized(self):
+        # Call with the write lock held
+        if self._read_current() is None:
+            self._write_base(0, np.zeros(0, dtype=np.int64), np.zeros((0, ROW_BYTES), dtype=np.uint8))
+            self._write_current(0)
+
+    # --- Reading ---
+
+    def _base_for(self, generation):
+        """The memory-mapped base segment of a generation, mapped once per process."""
+        with self._lock:
+            if generation != self._generation:
+                self._base, self._generation = self._load_base(generation), generation
+            return self._base
+
+    def _snapshot(self):
+        """Return (base arrays, delta ids, delta fingerprints) of the current generation, or None."""
+        for _ in range(3):
+            generation = self._read_current()
+            if generation is None:
+                return None
+            base = self._base_for(generation)
+            try:
+                return (base, *self._read_delta(generation))
+            except FileNotFoundError:
+                continue  # Replaced by a compaction meanwhile; load the new generation
+        raise RuntimeError("Similarity index changed during every read attempt.")
+
+    def __len__(self):
+        snapshot = self._snapshot()
+        return 0 if snapshot is None else len(snapshot[0]["ids"]) + len(snapshot[1])
+
+    def search(self, query, k=None, threshold=0.0, allowed_ids=None):
+        """
+        Return (ids, similarities) of the compounds whose Tanimoto similarity to the
+        packed query fingerprint is at least threshold, most similar first, at most k.
+        If allowed_ids (an array of compound ids) is given, only those compounds are
+        considered; the top k are then taken among them, in the same single pass.
+        """
+        snapshot = self._snapshot()
+        query_bits = np.flatnonzero(np.unpackbits(query))
+        if snapshot is None or not len(query_bits):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        base, delta_ids, delta_fps = snapshot
+
+        parts = []
+        if len(base["ids"]):
+            n = len(base["ids"])
+            indptr, postings, dense = base["indptr"], base["postings"], base["dense_index"][query_bits]
+            hits = [postings[indptr[b]:indptr[b + 1]] for b in query_bits[dense < 0]]
+            common = np.bincount(np.concatenate(hits), minlength=n) if hits else np.zeros(n, dtype=np.int64)
+            for column in dense[dense >= 0]:
+                common += np.unpackbits(base["columns"][column], count=n)
+            common = common.astype(np.float32)
+            parts.append((base["ids"], common / (base["counts"] + np.float32(len(query_bits)) - common)))
+        if len(delta_ids):
+            common = popcount_rows(delta_fps & query).astype(np.float32)
+            parts.append((delta_ids, common / (popcount_rows(delta_fps) + np.float32(len(query_bits)) - common)))
+
+        ids, similarities = [], []
+        for part_ids, part_similarities in parts:
+            keep = part_similarities >= threshold if threshold > 0 else np.ones(len(part_ids), dtype=bool)
+            if allowed_ids is not None:
+                keep &= np.isin(part_ids, allowed_ids)
+            rows = np.flatnonzero(keep)
+            if k is not None and len(rows) > k:
+                rows = rows[np.argpartition(-part_similarities[rows], k - 1)[:k]]
+            ids.append(np.asarray(part_ids[rows]))
+            similarities.append(part_similarities[rows])
+        ids, similarities = np.concatenate(ids), np.concatenate(similarities)
+        order = np.argsort(-similarities, kind="stable")[:k]
+        return ids[order], similarities[order]
+
+    # --- Writing ---
+
+    def add(self, ids, fingerprints):
+        """Append compounds (ids with their packed fingerprints) that are not indexed yet."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._locked():
+            self._ensure_initialized()
+            generation = self._read_current()
+            delta_ids, _ = self._read_delta(generation)
+            base_ids = self._base_for(generation)["ids"]
+            new = ~(np.isin(ids, base_ids) | np.isin(ids, delta_ids))
+            if new.any():
+                # Fingerprints first: readers only see rows whose id has been written
+                with open(self._path(generation, "delta.fps"), "ab") as f:
+                    f.write(np.ascontiguousarray(fingerprints[new], dtype=np.uint8).tobytes())
+                with open(self._path(generation, "delta.ids"), "ab") as f:
+                    f.write(ids[new].tobytes())
+            delta_rows = len(delta_ids) + int(new.sum())
+        if delta_rows > self.delta_max_rows:
+            self._compact_in_background()
+
+    def _compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception:
+                LOGGER.exception("Similarity index compaction failed")
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def compact(self):
+        """Merge the delta into a new base segment. Returns False if another process is already compacting."""
+        with self._locked("compact", blocking=False) as acquired:
+            if not acquired:
+                return False
+            generation = self._read_current()
+            if generation is None:
+                return True
+            base = self._load_base(generation)
+            delta_ids, delta_fps = self._read_delta(generation)
+            self._install(
+                np.concatenate([base["ids"], delta_ids]),
+                np.concatenate([base["fingerprints"], delta_fps]),
+            )
+            return True
+
+    def rebuild(self, ids, fingerprints):
+        """Replace the index with the given compounds, keeping any added while it was built."""
+        with self._locked("compact"):
+            self._install(np.asarray(ids, dtype=np.int64), fingerprints)
+
+    def _install(self, ids, fingerprints):
+        # Build the new segment unlocked; then, under the write lock, carry over the rows
+        # appended meanwhile and switch readers to it
+        with self._locked():
+            self._ensure_initialized()
+            generation = self._read_current() + 1
+        self._write_base(generation, ids, fingerprints)
+        with self._locked():
+            previous = self._read_current()
+            delta_ids, delta_fps = self._read_delta(previous)
+            late = ~np.isin(delta_ids, ids)
+            with open(self._path(generation, "delta.fps"), "ab") as f:
+                f.write(delta_fps[late].tobytes())
+            with open(self._path(generation, "delta.ids"), "ab") as f:
+                f.write(delta_ids[late].tobytes())
+            self._write_current(generation)
+            # Workers still mapping the previous segment keep it until they reload
+            for path in self.directory.glob(f"g{previous - 1}-*"):
+                path.unlink(missing_ok=True)
+        LOGGER.info(f"Similarity index generation {generation}: {len(ids)} compounds")
+
+
+_index = None
+
+
+def get_similarity_index():
+    """Return the process-wide SimilarityIndex configured from settings."""
+    global _index
+    if _index is None:
+        _index = SimilarityIndex(settings.SIMILARITY_INDEX_DIR, settings.SIMILARITY_INDEX_DELTA_MAX_ROWS)
+    return _index
+
+
+def fingerprint_smiles(smiles_list):
+    """Return (packed fingerprints, valid mask) for SMILES, through the shared fingerprint cache."""
+    blocks, valid = featurize_blocks(smiles_list, [FINGERPRINT_KEY])
+    return blocks[FINGERPRINT_KEY], valid
+
+
+def index_compounds(compounds):
+    """Add stored compounds to the similarity index (called once their transaction commits)."""
+    compounds = [c for c in compounds if c.smiles]
+    if not compounds:
+        return
+    fingerprints, valid = fingerprint_smiles([c.smiles for c in compounds])
+    get_similarity_index().add(np.array([c.pk for c in compounds])[valid], fingerprints[valid])
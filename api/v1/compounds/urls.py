@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import SimilarCompoundsView
+
+urlpatterns = [
+    path('similar/', SimilarCompoundsView.as_view(), name='similar-compounds'),
+]
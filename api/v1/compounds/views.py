@@ -1,7 +1,14 @@
-from rest_framework import viewsets
-from .serializers import CompoundSerializer
+import numpy as np
+from rest_framework import status, viewsets
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from .serializers import CompoundSerializer, SimilarityQuerySerializer
+from .similarity import fingerprint_smiles, get_similarity_index
 from rest_framework.permissions import IsAuthenticated
-from api.models import Compound  # Adjust the import based on your actual model location
+from api.models import Compound, PredictionCompound  # Adjust the import based on your actual model location
+from api.v1.predictions.normalization import canonicalize_smiles
+from api.v1.predictions.serializers import CompoundSerializer as CompoundDetailSerializer
+from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiTypes
 
 class CompoundViewSet(viewsets.ModelViewSet):
     serializer_class = CompoundSerializer
@@ -10,4 +17,54 @@ class CompoundViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if self.request.user.role == 'admin':
             return Compound.objects.all()
-        return Compound.objects.filter(prediction__user=self.request.user)
\ No newline at end of file
+        return Compound.objects.filter(prediction__user=self.request.user)
+
+
+class SimilarCompoundsView(APIView):
+    """
+    Finds stored compounds similar to a query structure by Tanimoto similarity of their
+    ECFP fingerprints. Admins search every compound; users the compounds of their own predictions.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        parameters=[SimilarityQuerySerializer],
+        description=(
+            "Top-k and/or threshold Tanimoto search over the stored compounds, most similar first. "
+            "Compounds are indexed as they are stored; compounds stored before the index existed "
+            "appear after `manage.py build_similarity_index`."
+        ),
+        responses={
+            200: OpenApiResponse(description="Similar compounds.", response=OpenApiTypes.OBJECT),
+            400: OpenApiResponse(description="Invalid query or SMILES."),
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        query = SimilarityQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        smiles = canonicalize_smiles(query.validated_data["smiles"])
+        if smiles is None:
+            return Response({"error": "Invalid SMILES input"}, status=status.HTTP_400_BAD_REQUEST)
+
+        allowed_ids = None
+        if request.user.role != 'admin':
+            allowed_ids = np.fromiter(
+                PredictionCompound.objects.filter(prediction__user=request.user)
+                .values_list("compound_id", flat=True).distinct(),
+                dtype=np.int64,
+            )
+        fingerprints, _ = fingerprint_smiles([smiles])
+        ids, similarities = get_similarity_index().search(
+            fingerprints[0], query.validated_data["k"], query.validated_data["threshold"], allowed_ids
+        )
+        hits = [(int(i), float(s)) for i, s in zip(ids, similarities)]
+
+        compounds = Compound.objects.in_bulk([compound_id for compound_id, _ in hits])
+        return Response({
+            "query": smiles,
+            "results": [
+                {"similarity": round(similarity, 4), "compound": CompoundDetailSerializer(compounds[compound_id]).data}
+                for compound_id, similarity in hits
+                if compound_id in compounds
+            ],
+        }, status=status.HTTP_200_OK)
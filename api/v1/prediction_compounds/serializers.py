@@ -30,5 +30,5 @@ class PredictionCompoundSerializer(serializers.ModelSerializer):
     class Meta:
         model = PredictionCompound
         fields = [
-            'id', 'ic50', 'lelp', 'compound', 'prediction'
+            'id', 'ic50', 'lelp', 'domain_max_similarity', 'domain_mean_similarity', 'compound', 'prediction'
         ]
\ No newline at end of file
@@ -0,0 +1,110 @@
+import threading
+import time
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+
+
+class _Request:
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InferenceBatcher:
+    """
+    Coalesces concurrent predict calls on one model into a single vectorized call.
+
+    The first caller to arrive becomes the leader: it waits up to window seconds (less
+    if max_rows rows queue up first), stacks every queued matrix, runs one predict and
+    hands each caller its slice. Later callers just wait for their slice. No thread is
+    started; callers do the work. Inputs of at least max_rows rows, or any input when
+    window is 0, are predicted directly.
+
+    Batching only pays off when requests are served concurrently in one process, e.g.
+    gunicorn's gthread workers or the featurization of several models at once.
+    """
+
+    def __init__(self, window, max_rows):
+        self.window = window
+        self.max_rows = max_rows
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_rows = 0
+        self._collecting = False
+
+    def predict(self, matrix, predict_fn):
+        """Return predict_fn's output for matrix, possibly computed together with other callers' rows."""
+        if self.window <= 0 or matrix.shape[0] >= self.max_rows:
+            return predict_fn(matrix)
+
+        request = _Request(matrix)
+        with self._cond:
+            self._pending.append(request)
+            self._pending_rows += matrix.shape[0]
+            leader = not self._collecting
+            self._collecting = True
+            if self._pending_rows >= self.max_rows:
+                self._cond.notify()
+
+        if leader:
+            deadline = time.monotonic() + self.window
+            with self._cond:
+                while self._pending_rows < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending, self._pending_rows = self._pending, [], 0
+                self._collecting = False
+            self._run(batch, predict_fn)
+        else:
+            request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    @staticmethod
+    def _run(batch, predict_fn):
+        try:
+            matrices = [request.matrix for request in batch]
+            if len(matrices) == 1:
+                stacked = matrices[0]
+            elif sp.issparse(matrices[0]):
+                stacked = sp.vstack(matrices, format="csr")
+            else:
+                stacked = np.vstack(matrices)
+            predictions = predict_fn(stacked)
+            start = 0
+            for request in batch:
+                end = start + request.matrix.shape[0]
+                request.result = predictions[start:end]
+                start = end
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(artifact_checksum, input_kind):
+    """
+    Return the process-wide InferenceBatcher for one model artifact and input kind
+    ("sparse", "dense" or "estimator"), configured from PREDICTION_BATCH_WINDOW_MS and
+    PREDICTION_BATCH_MAX_ROWS. Batchers hold no reference to the model itself.
+    """
+    key = (artifact_checksum, input_kind)
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = InferenceBatcher(
+                settings.PREDICTION_BATCH_WINDOW_MS / 1000, settings.PREDICTION_BATCH_MAX_ROWS
+            )
+        return _batchers[key]
@@ -0,0 +1,163 @@
+import numpy as np
+from django.conf import settings
+from api.models import PredictionClustering, PredictionCompound
+from .featurization_pool import get_featurization_pool
+from .featurizers import ECFP_BITS, SCAFFOLD_KEY, ecfp_key, packed_to_csr
+from .utils import featurize_blocks
+
+CLUSTER_METHODS = ("butina", "scaffold")
+# Compounds are clustered by the ECFP the models use, so their fingerprints come from the shared cache
+FINGERPRINT_KEY = ecfp_key()
+
+
+class TooManyNeighbors(ValueError):
+    """The cutoff links more pairs than CLUSTERING_MAX_NEIGHBOR_PAIRS allows."""
+
+
+def tanimoto_neighbors(packed, cutoff, block_rows=None, max_pairs=None):
+    """
+    Return the Tanimoto neighbor lists of packed (n, ceil(ECFP_BITS / 8)) fingerprints
+    as CSR arrays (indptr, indices): row i's neighbors, the other rows with similarity
+    >= cutoff, are indices[indptr[i]:indptr[i + 1]].
+
+    The similarity matrix is never held whole: it is computed in block_rows x block_rows
+    tiles of the upper triangle, each as one sparse-dense product (on-bits of one block
+    times the unpacked bits of the other) giving every pairwise intersection, and only
+    the pairs over the cutoff are kept. Rows are processed in order of bit count, since
+    Tanimoto(a, b) <= count(a) / count(b) for count(a) <= count(b): tiles of fingerprints
+    too different in size to reach the cutoff are skipped without being computed.
+    Raises TooManyNeighbors past max_pairs pairs, which bounds the memory of the result.
+    """
+    block_rows = block_rows or settings.CLUSTERING_BLOCK_ROWS
+    max_pairs = max_pairs or settings.CLUSTERING_MAX_NEIGHBOR_PAIRS
+    n = len(packed)
+    queries = packed_to_csr(packed, ECFP_BITS)
+    counts = np.diff(queries.indptr)
+    # Fingerprints without bits are similar to nothing, so they are left out
+    order = np.argsort(counts, kind="stable")
+    order = order[counts[order] > 0]
+    counts = counts[order]
+    # Intersections never exceed the smaller bit count, so the products can run in uint8
+    dtype = np.uint8 if counts.max(initial=0) <= np.iinfo(np.uint8).max else np.uint16
+    queries = queries[order].astype(dtype)
+    # a & b >= cutoff * (a + b - a & b) rearranged, so no union has to be formed:
+    # a & b >= cutoff / (1 + cutoff) * (a + b)
+    scaled = counts.astype(np.float32) * np.float32(cutoff / (1 + cutoff))
+
+    m = len(order)
+    rows, cols, total = [], [], 0
+    for col_start in range(0, m, block_rows):
+        col_stop = min(col_start + block_rows, m)
+        # Built C-ordered (via CSR), as the sparse-dense product would otherwise copy it every time
+        columns = queries[col_start:col_stop].T.tocsr().toarray()
+        # Rows with fewer than cutoff * count bits cannot reach the cutoff with any column here
+        first = int(np.searchsorted(counts, cutoff * counts[col_start], side="left"))
+        for row_start in range(first, col_stop, block_rows):
+            row_stop = min(row_start + block_rows, col_stop)
+            common = queries[row_start:row_stop] @ columns
+            hit = common >= scaled[row_start:row_stop, None] + scaled[None, col_start:col_stop]
+            if row_stop > col_start:
+                # Tile overlaps the diagonal: keep each pair once, and no self-pairs
+                hit &= np.arange(col_start, col_stop)[None, :] > np.arange(row_start, row_stop)[:, None]
+            i, j = np.divmod(np.flatnonzero(hit), col_stop - col_start)
+            total += len(i)
+            if total > max_pairs:
+                raise TooManyNeighbors(
+                    f"A cutoff of {cutoff} links more than {max_pairs} compound pairs; use a higher cutoff."
+                )
+            rows.append((i + row_start).astype(np.int32))
+            cols.append((j + col_start).astype(np.int32))
+
+    # Both directions of every pair, grouped by row and mapped back to the input order
+    i = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+    j = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32)
+    source, target = order[np.concatenate([i, j])], order[np.concatenate([j, i])].astype(np.int32)
+    grouping = np.argsort(source, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=n), out=indptr[1:])
+    return indptr, target[grouping]
+
+
+def butina_clusters(indptr, indices):
+    """
+    Butina (Taylor-Butina) clustering of a neighbor graph from tanimoto_neighbors.
+    Compounds are taken in order of decreasing neighbor count; each one not yet
+    assigned becomes a centroid, and its unassigned neighbors its cluster. Returns
+    one array of row indices per cluster, centroid first, largest clusters first.
+    Matches rdkit.ML.Cluster.Butina.ClusterData without reordering.
+    """
+    n = len(indptr) - 1
+    degree = np.diff(indptr)
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    # Ties go to the higher index, as in RDKit
+    for centroid in np.lexsort((-np.arange(n), -degree)):
+        if assigned[centroid]:
+            continue
+        members = indices[indptr[centroid]:indptr[centroid + 1]]
+        members = members[~assigned[members]]
+        assigned[centroid] = True
+        assigned[members] = True
+        clusters.append(np.concatenate([[centroid], members]))
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+def scaffold_clusters(smiles_list):
+    """
+    Group SMILES by Bemis-Murcko scaffold. Returns [(scaffold, row indices)], largest
+    groups first; acyclic molecules share the scaffold "" and unparsable ones are left out.
+    """
+    blocks, valid = get_featurization_pool().featurize(smiles_list, [SCAFFOLD_KEY])
+    groups = {}
+    for row, (record, ok) in enumerate(zip(blocks[SCAFFOLD_KEY], valid)):
+        if ok:
+            groups.setdefault(record[0], []).append(row)
+    return sorted(groups.items(), key=lambda group: len(group[1]), reverse=True)
+
+
+def clustering_key(method, cutoff):
+    """Cache key of one clustering of a prediction, e.g. "butina:0.60" or "scaffold"."""
+    return method if method == "scaffold" else f"{method}:{cutoff:.2f}"
+
+
+def cluster_prediction(prediction, method, cutoff=None):
+    """
+    Cluster the compounds of a Prediction by scaffold or, at a Tanimoto cutoff, with
+    Butina. Returns [{"label", "compound_ids"}], largest clusters first, where label is
+    the scaffold SMILES or the centroid's compound id (listed first in compound_ids).
+
+    Results are stored per (prediction, method, cutoff) in PredictionClustering, so
+    repeat requests are a single lookup; a prediction's compounds do not change once
+    it has completed. Raises TooManyNeighbors (a ValueError) if the cutoff is too low
+    for the size of the prediction.
+    """
+    key = clustering_key(method, cutoff)
+    cached = PredictionClustering.objects.filter(prediction=prediction, key=key).values_list("clusters", flat=True).first()
+    if cached is not None:
+        return cached
+
+    rows = list(
+        PredictionCompound.objects.filter(prediction=prediction)
+        .order_by("compound_id").values_list("compound_id", "compound__smiles")
+    )
+    compound_ids = [compound_id for compound_id, _ in rows]
+    smiles = [smiles for _, smiles in rows]
+    if method == "scaffold":
+        clusters = [
+            {"label": scaffold, "compound_ids": [compound_ids[row] for row in members]}
+            for scaffold, members in scaffold_clusters(smiles)
+        ]
+    else:
+        blocks, valid = featurize_blocks(smiles, [FINGERPRINT_KEY])
+        parsed = np.flatnonzero(valid)
+        indptr, indices = tanimoto_neighbors(blocks[FINGERPRINT_KEY][parsed], cutoff)
+        clusters = []
+        for members in butina_clusters(indptr, indices):
+            ids = [compound_ids[row] for row in parsed[members].tolist()]
+            clusters.append({"label": ids[0], "compound_ids": ids})
+
+    PredictionClustering.objects.bulk_create(
+        [PredictionClustering(prediction=prediction, key=key, clusters=clusters)], ignore_conflicts=True
+    )
+    return clusters
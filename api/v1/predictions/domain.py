@@ -0,0 +1,97 @@
+import numpy as np
+
+# Training-set fingerprints ship next to each model artifact, e.g. xgb_model_ecfp.json ->
+# xgb_model_ecfp.train.npy: an (n, ceil(width / 8)) uint8 array packed like the descriptor's blocks
+TRAINING_FINGERPRINTS_SUFFIX = ".train.npy"
+# Training compounds unpacked per step (a multiple of 8): at most 2048 bit planes x 4096
+# rows, 8 MB, whatever the size of the training set
+_TILE_ROWS = 4096
+# Queries scored per step; with _TILE_ROWS this bounds each similarity temporary to 4 MB
+_QUERY_BLOCK = 256
+
+
+def training_fingerprints_path(model_path):
+    """Path of the training fingerprints shipped with a model artifact."""
+    return model_path.with_suffix(TRAINING_FINGERPRINTS_SUFFIX)
+
+
+class ApplicabilityDomain:
+    """
+    Tanimoto similarity of query fingerprints to a model's training-set fingerprints.
+
+    The training set stays bit-packed, transposed into one packed plane per fingerprint
+    bit: plane b holds bit b of every training compound, so the resident size is that of
+    the shipped file. The intersection of a query with a training compound is the number
+    of the query's on-bits set in it, so a block of queries is scored against a tile of
+    training compounds by unpacking only the planes those queries use and taking one
+    sparse-dense product (the CSR on-bits of the queries times the unpacked planes).
+    Intersections never exceed the smaller fingerprint's bit count, so the product runs
+    in uint8 when every training fingerprint has at most 255 bits (uint16 otherwise).
+    """
+
+    def __init__(self, packed, width):
+        self.width = width
+        self.size = len(packed)
+        self.planes = np.zeros((width, (self.size + 7) // 8), dtype=np.uint8)
+        counts = np.zeros(self.size, dtype=np.int32)
+        for start in range(0, self.size, _TILE_ROWS):
+            bits = np.unpackbits(packed[start:start + _TILE_ROWS], axis=1, count=width)
+            counts[start:start + len(bits)] = bits.sum(axis=1, dtype=np.int32)
+            self.planes[:, start // 8:(start + len(bits) + 7) // 8] = np.packbits(bits.T, axis=1)
+        self.dtype = np.uint8 if counts.max(initial=0) <= np.iinfo(np.uint8).max else np.uint16
+        self._counts = counts.astype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.planes.nbytes + self._counts.nbytes
+
+    def score(self, queries):
+        """
+        Return (max, mean) float32 arrays: the highest and average Tanimoto similarity to
+        the training set of each row of queries, a CSR matrix of fingerprint on-bits (see
+        packed_to_csr, which inference builds anyway). Rows without set bits score 0.
+        """
+        n = queries.shape[0]
+        best = np.zeros(n, dtype=np.float32)
+        mean = np.zeros(n, dtype=np.float32)
+        if not n or not self.size:
+            return best, mean
+        # A query without bits intersects nothing; counting it as 1 bit keeps the union
+        # positive, so its similarities come out as 0 rather than 0/0
+        query_counts = np.maximum(np.diff(queries.indptr), 1).astype(np.float32)
+        for start in range(0, n, _QUERY_BLOCK):
+            stop = min(start + _QUERY_BLOCK, n)
+            block = queries[start:stop]
+            used = np.unique(block.indices)
+            block = block[:, used].astype(self.dtype)
+            counts = query_counts[start:stop, None]
+            total = np.zeros(stop - start, dtype=np.float32)
+            for tile in range(0, self.size, _TILE_ROWS):
+                rows = min(_TILE_ROWS, self.size - tile)
+                planes = np.unpackbits(self.planes[used, tile // 8:(tile + rows + 7) // 8], axis=1, count=rows)
+                similarity = (block @ planes).astype(np.float32)
+                union = counts + self._counts[tile:tile + rows]
+                union -= similarity
+                similarity /= union
+                np.maximum(best[start:stop], similarity.max(axis=1), out=best[start:stop])
+                total += similarity.sum(axis=1)
+            mean[start:stop] = total / self.size
+        return best, mean
+
+
+def load_applicability_domain(model_path, width):
+    """Load the training fingerprints shipped with a model artifact, or None if it has none."""
+    path = training_fingerprints_path(model_path)
+    if not path.is_file():
+        return None
+    packed = np.load(path)
+    if packed.dtype != np.uint8 or packed.ndim != 2 or packed.shape[1] != (width + 7) // 8:
+        raise ValueError(f"Training fingerprints '{path.name}' do not match a {width}-bit descriptor.")
+    return ApplicabilityDomain(packed, width)
+
+
+def domain_payload(domain):
+    """API representation of a (max, mean) training-set similarity, or None."""
+    if domain is None:
+        return None
+    return {"max_similarity": round(domain[0], 4), "mean_similarity": round(domain[1], 4)}
@@ -0,0 +1,271 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from api.models import CachedPubChemRecord, Compound
+from .normalization import smiles_hash
+
+LOGGER = logging.getLogger(__name__)
+
+# Formula, weight and InChI/InChIKey are computed locally with RDKit (see properties)
+PROPERTIES = ("IUPACName",)
+MAX_SYNONYMS = 10  # Synonyms stored per compound, most common first
+ENRICHED_FIELDS = ("cid", "iupac_name", "synonyms", "description", "structure_image")
+# Attempts per request when PubChem throttles (503/429)
+_RETRIES = 3
+# Keep IN lists and insert batches well below database parameter limits
+_QUERY_CHUNK = 1000
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, in bursts of at most `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PubChemCache:
+    """
+    PubChem responses in the CachedPubChemRecord table, shared by every worker. Entries
+    expire after ttl; "not found" entries (data NULL) after negative_ttl, so compounds
+    PubChem does not know are retried now and then rather than on every run.
+    """
+
+    def __init__(self, ttl, negative_ttl):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def get_many(self, keys):
+        """Return {key: data} for the keys with a fresh entry (data is None when not found)."""
+        now = timezone.now()
+        found = {}
+        for start in range(0, len(keys), _QUERY_CHUNK):
+            rows = CachedPubChemRecord.objects.filter(key__in=keys[start:start + _QUERY_CHUNK])
+            for key, data, fetched_at in rows.values_list("key", "data", "fetched_at"):
+                if fetched_at >= now - (self.ttl if data is not None else self.negative_ttl):
+                    found[key] = data
+        return found
+
+    def set_many(self, values):
+        """Store {key: data} (None records "not found"), replacing older entries."""
+        now = timezone.now()
+        CachedPubChemRecord.objects.bulk_create(
+            [CachedPubChemRecord(key=key, data=data, fetched_at=now) for key, data in values.items()],
+            batch_size=_QUERY_CHUNK,
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=["data", "fetched_at"],
+        )
+
+
+class PubChemClient:
+    """
+    PUG REST client for compound metadata.
+
+    SMILES are resolved to CIDs one per request (PubChem takes a single SMILES per
+    call); properties, synonyms and descriptions are then fetched for up to batch_size
+    CIDs per POST. Every lookup goes through the cache, concurrent lookups of the same
+    key in this process share one request, and all requests pass a token bucket of
+    requests_per_second. base_url can point at a local stand-in server, as the
+    tests do.
+    """
+
+    def __init__(self, base_url, requests_per_second, batch_size, timeout, cache, key_prefix=""):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.cache = cache
+        self.key_prefix = key_prefix
+        self.session = requests.Session()
+        self.requests_made = 0
+        self._bucket = TokenBucket(requests_per_second)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _post(self, path, data):
+        """POST to PUG REST; returns the JSON body, or None when PubChem has no matching record."""
+        for attempt in range(_RETRIES):
+            self._bucket.acquire()
+            response = self.session.post(f"{self.base_url}/{path}", data=data, timeout=self.timeout)
+            with self._lock:
+                self.requests_made += 1
+            if response.status_code in (400, 404):  # PUGREST.BadRequest (e.g. bad SMILES) / NotFound
+                return None
+            if response.status_code in (429, 503) and attempt < _RETRIES - 1:
+                time.sleep(2 ** attempt)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def _lookup(self, kind, idents, fetch, batch_size):
+        """
+        Return {ident: data or None} for idents. Fresh cache entries are used as they are;
+        the rest are fetched with fetch(batch) -> {ident: data}, batch_size at a time, and
+        idents missing from its result are cached as not found.
+        """
+        keys = {ident: f"{self.key_prefix}{kind}:{ident}" for ident in idents}
+        cached = self.cache.get_many(list(keys.values()))
+        results = {ident: cached[key] for ident, key in keys.items() if key in cached}
+
+        owned, waiting = [], {}
+        with self._lock:
+            for ident, key in keys.items():
+                if ident in results:
+                    continue
+                if key in self._inflight:
+                    waiting[ident] = self._inflight[key]
+                else:
+                    self._inflight[key] = Future()
+                    owned.append(ident)
+
+        try:
+            for start in range(0, len(owned), batch_size):
+                batch = owned[start:start + batch_size]
+                fetched = fetch(batch)
+                values = {ident: fetched.get(ident) for ident in batch}
+                self.cache.set_many({keys[ident]: value for ident, value in values.items()})
+                results.update(values)
+                with self._lock:
+                    for ident, value in values.items():
+                        self._inflight.pop(keys[ident]).set_result(value)
+        except Exception as e:
+            with self._lock:
+                for ident in owned:
+                    future = self._inflight.pop(keys[ident], None)
+                    if future is not None:
+                        future.set_exception(e)
+            raise
+
+        for ident, future in waiting.items():
+            results[ident] = future.result()
+        return results
+
+    def cids(self, smiles_list):
+        """Return {smiles: CID or None} for canonical SMILES."""
+        by_hash = {smiles_hash(smiles): smiles for smiles in smiles_list}
+
+        def fetch(batch):
+            body = self._post("compound/smiles/cids/JSON", {"smiles": by_hash[batch[0]]})
+            cids = (body or {}).get("IdentifierList", {}).get("CID", [])
+            return {batch[0]: cids[0]} if cids and cids[0] else {}  # CID 0 means no match
+        found = self._lookup("cid", list(by_hash), fetch, batch_size=1)
+        return {by_hash[digest]: cid for digest, cid in found.items()}
+
+    def properties(self, cids):
+        """Return {cid: {"CID", "IUPACName"} or None}."""
+        def fetch(batch):
+            body = self._post(f"compound/cid/property/{','.join(PROPERTIES)}/JSON", {"cid": ",".join(map(str, batch))})
+            return {item["CID"]: item for item in (body or {}).get("PropertyTable", {}).get("Properties", [])}
+        return self._lookup("properties", cids, fetch, self.batch_size)
+
+    def synonyms(self, cids):
+        """Return {cid: [synonym, ...] or None}."""
+        def fetch(batch):
+            body = self._post("compound/cid/synonyms/JSON", {"cid": ",".join(map(str, batch))})
+            return {
+                item["CID"]: item["Synonym"][:MAX_SYNONYMS]
+                for item in (body or {}).get("InformationList", {}).get("Information", [])
+                if item.get("Synonym")
+            }
+        return self._lookup("synonyms", cids, fetch, self.batch_size)
+
+    def descriptions(self, cids):
+        """Return {cid: description or None}, the first description PubChem lists."""
+        def fetch(batch):
+            body = self._post("compound/cid/description/JSON", {"cid": ",".join(map(str, batch))})
+            found = {}
+            for item in (body or {}).get("InformationList", {}).get("Information", []):
+                if item.get("Description"):
+                    found.setdefault(item["CID"], item["Description"])
+            return found
+        return self._lookup("description", cids, fetch, self.batch_size)
+
+
+_client = None
+
+
+def get_pubchem_client():
+    """Return the process-wide PubChemClient configured from settings."""
+    global _client
+    if _client is None:
+        _client = PubChemClient(
+            settings.PUBCHEM_BASE_URL,
+            settings.PUBCHEM_REQUESTS_PER_SECOND,
+            settings.PUBCHEM_BATCH_SIZE,
+            settings.PUBCHEM_TIMEOUT_SECONDS,
+            PubChemCache(
+                timedelta(days=settings.PUBCHEM_CACHE_TTL_DAYS),
+                timedelta(hours=settings.PUBCHEM_NEGATIVE_CACHE_TTL_HOURS),
+            ),
+        )
+    return _client
+
+
+def compounds_to_enrich(limit):
+    """Compounds without a CID, never checked or last checked longer ago than the negative TTL."""
+    retry_before = timezone.now() - timedelta(hours=settings.PUBCHEM_NEGATIVE_CACHE_TTL_HOURS)
+    return list(
+        Compound.objects.filter(cid=None, smiles__isnull=False)
+        .filter(Q(pubchem_checked_at=None) | Q(pubchem_checked_at__lt=retry_before))
+        .order_by(F("pubchem_checked_at").asc(nulls_first=True), "id")[:limit]
+    )
+
+
+def enrich_compounds(compounds, client=None):
+    """
+    Fill the PubChem metadata of compounds (CID, IUPAC name, synonyms, description,
+    image) where it is missing, and mark them checked. Values already set are kept.
+    Returns the number matched to a CID.
+    """
+    client = client or get_pubchem_client()
+    cids = client.cids(list(dict.fromkeys(c.smiles for c in compounds if c.smiles)))
+    found = sorted({cid for cid in cids.values() if cid})
+    properties = client.properties(found) if found else {}
+    synonyms = client.synonyms(found) if found else {}
+    descriptions = client.descriptions(found) if found else {}
+
+    now = timezone.now()
+    matched = 0
+    for compound in compounds:
+        compound.pubchem_checked_at = now
+        cid = cids.get(compound.smiles)
+        if not cid:
+            continue
+        matched += 1
+        values = {
+            "cid": str(cid),
+            "iupac_name": ((properties.get(cid) or {}).get("IUPACName") or "")[:255] or None,
+            "synonyms": ", ".join(synonyms.get(cid) or []) or None,
+            "description": descriptions.get(cid),
+            "structure_image": f"https://pubchem.ncbi.nlm.nih.gov/image/imgsrv.fcgi?cid={cid}&t=l",
+        }
+        for field, value in values.items():
+            if getattr(compound, field) is None and value is not None:
+                setattr(compound, field, value)
+
+    Compound.objects.bulk_update(
+        compounds, [*ENRICHED_FIELDS, "pubchem_checked_at"], batch_size=settings.PERSIST_BATCH_SIZE
+    )
+    return matched
@@ -0,0 +1,77 @@
+import atexit
+import multiprocessing
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from .featurizers import featurize_smiles, get_descriptor
+
+
+class FeaturizationPool:
+    """
+    Long-lived process pool for featurizing large batches.
+
+    SMILES are sent to the workers in chunks; each worker parses a molecule once for
+    all requested descriptors and returns fingerprints as packed blocks, so IPC
+    carries n_bits / 8 bytes per molecule instead of a float32 vector.
+    Batches smaller than min_batch run in-process, where pickling and process
+    hand-off would cost more than they save (see `manage.py benchmark_featurization`).
+    """
+
+    def __init__(self, workers, chunk_size, min_batch):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_batch = min_batch
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Started on first use so each gunicorn worker owns its own pool. The workers come
+        # from a forkserver rather than a fork of this process, which by now holds threads
+        # (OpenMP, model reloads, batchers) whose locks a forked child could inherit held.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+            return self._executor
+
+    def featurize(self, smiles_list, keys, force_pool=False):
+        """Featurize smiles_list for every descriptor key; see featurize_smiles for the return value."""
+        if not smiles_list:
+            return {key: get_descriptor(key).empty(0) for key in keys}, np.zeros(0, dtype=bool)
+
+        if self.workers < 1 or (len(smiles_list) < self.min_batch and not force_pool):
+            return featurize_smiles(smiles_list, keys)
+
+        chunks = [
+            smiles_list[start:start + self.chunk_size]
+            for start in range(0, len(smiles_list), self.chunk_size)
+        ]
+        executor = self._get_executor()
+        results = list(executor.map(featurize_smiles, chunks, [keys] * len(chunks)))
+        blocks = {key: np.concatenate([chunk[key] for chunk, _ in results]) for key in keys}
+        valid = np.concatenate([mask for _, mask in results])
+        return blocks, valid
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_pool = None
+
+
+def get_featurization_pool():
+    """Return the process-wide FeaturizationPool configured from settings."""
+    global _pool
+    if _pool is None:
+        _pool = FeaturizationPool(
+            settings.FEATURIZATION_WORKERS,
+            settings.FEATURIZATION_CHUNK_SIZE,
+            settings.FEATURIZATION_POOL_MIN_BATCH,
+        )
+        atexit.register(_pool.shutdown)
+    return _pool
@@ -0,0 +1,186 @@
+import numpy as np
+from functools import lru_cache
+from scipy import sparse
+from rdkit import Chem
+from rdkit.Chem import Crippen, Descriptors, MACCSkeys, rdFingerprintGenerator, rdinchi
+from rdkit.Chem.rdMolDescriptors import CalcMolFormula
+from rdkit.Chem.Scaffolds import MurckoScaffold
+from .pubchem_fingerprint import PUBCHEM_BITS, pubchem_on_bits
+
+# ECFP6 parameters the production models were trained with
+ECFP_RADIUS = 3
+ECFP_BITS = 2048
+# RDKit MACCS keys are 167 bits long; bit 0 is always off
+MACCS_KEY = "maccs"
+MACCS_BITS = 167
+# PubChem (CACTVS) substructure keys, see pubchem_fingerprint; bump the version
+# whenever its pattern tables change so cached fingerprints are not reused
+PUBCHEM_KEY = "pubchem:v2"
+# Compound properties computed locally instead of fetched from PubChem
+PROPERTIES_KEY = "properties"
+PROPERTY_COLUMNS = ("molecular_formula", "molecular_weight", "inchi", "inchikey", "heavy_atoms", "logp")
+SCAFFOLD_KEY = "scaffold"
+SCAFFOLD_COLUMNS = ("scaffold",)
+
+
+@lru_cache(maxsize=None)
+def morgan_generator(radius=ECFP_RADIUS, n_bits=ECFP_BITS):
+    """Return a Morgan fingerprint generator, built once per process and parameter set."""
+    return rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=n_bits)
+
+
+def ecfp_key(radius=ECFP_RADIUS, n_bits=ECFP_BITS):
+    """Descriptor key for ECFP at the given radius and length, e.g. "ecfp:r3:2048"."""
+    return f"ecfp:r{radius}:{n_bits}"
+
+
+class BitDescriptor:
+    """
+    A fixed-length fingerprint computed from an RDKit Mol.
+    Its blocks hold one bit-packed uint8 row of ceil(width / 8) bytes per molecule.
+    """
+
+    cacheable = True
+
+    def __init__(self, key, width, on_bits):
+        self.key = key
+        self.width = width
+        self.on_bits = on_bits
+
+    def empty(self, n):
+        return np.zeros((n, (self.width + 7) // 8), dtype=np.uint8)
+
+    def buffer(self, n):
+        return np.zeros((n, self.width), dtype=np.uint8)
+
+    def fill(self, buffer, row, mol):
+        # Only on-bits are touched, so no per-row vector is ever allocated
+        buffer[row, self.on_bits(mol)] = 1
+
+    def finish(self, buffer):
+        return np.packbits(buffer, axis=1)
+
+
+class RecordDescriptor:
+    """
+    Mixed-type per-molecule properties (strings and numbers) computed from an RDKit Mol.
+    Its blocks are object arrays holding one tuple of len(columns) values per molecule,
+    or None for SMILES RDKit cannot parse. They are not stored in the fingerprint cache.
+    """
+
+    cacheable = False
+
+    def __init__(self, key, columns, values):
+        self.key = key
+        self.columns = columns
+        self.width = len(columns)
+        self.values = values
+
+    def empty(self, n):
+        return np.full(n, None, dtype=object)
+
+    buffer = empty
+
+    def fill(self, buffer, row, mol):
+        buffer[row] = self.values(mol)
+
+    def finish(self, buffer):
+        return buffer
+
+
+def molecular_properties(mol):
+    """Values for PROPERTY_COLUMNS; InChI fields are None where RDKit cannot generate them."""
+    # rdinchi returns InChI warnings (e.g. undefined stereo) instead of logging one per molecule
+    inchi, code, *_ = rdinchi.MolToInchi(mol)
+    inchi = inchi if inchi and code in (0, 1) else None  # 0 = ok, 1 = warnings only
+    return (
+        CalcMolFormula(mol),
+        Descriptors.MolWt(mol),
+        inchi,
+        rdinchi.InchiToInchiKey(inchi) if inchi else None,
+        mol.GetNumHeavyAtoms(),
+        Crippen.MolLogP(mol),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_descriptor(key):
+    """
+    Return the descriptor for a key: "ecfp:r<radius>:<bits>", "maccs", "pubchem:v2",
+    "properties" or "scaffold" (Bemis-Murcko scaffold SMILES, "" for acyclic molecules).
+    Raises ValueError for unknown keys.
+    """
+    if key.startswith("ecfp:"):
+        try:
+            _, radius, n_bits = key.split(":")
+            radius, n_bits = int(radius.removeprefix("r")), int(n_bits)
+        except ValueError:
+            raise ValueError(f"Malformed ECFP descriptor key '{key}'.")
+        generator = morgan_generator(radius, n_bits)
+        return BitDescriptor(key, n_bits, lambda mol: list(generator.GetFingerprint(mol).GetOnBits()))
+    if key == MACCS_KEY:
+        return BitDescriptor(key, MACCS_BITS, lambda mol: list(MACCSkeys.GenMACCSKeys(mol).GetOnBits()))
+    if key == PUBCHEM_KEY:
+        return BitDescriptor(key, PUBCHEM_BITS, pubchem_on_bits)
+    if key == PROPERTIES_KEY:
+        return RecordDescriptor(key, PROPERTY_COLUMNS, molecular_properties)
+    if key == SCAFFOLD_KEY:
+        return RecordDescriptor(key, SCAFFOLD_COLUMNS, lambda mol: (MurckoScaffold.MurckoScaffoldSmiles(mol=mol),))
+    raise ValueError(f"Unsupported descriptor '{key}'.")
+
+
+def featurize_smiles(smiles_list, keys):
+    """
+    Parse each SMILES once and compute every requested descriptor from the same Mol.
+
+    Returns (blocks, valid): blocks maps each key to its (len(smiles_list), ...) block
+    (see BitDescriptor / RecordDescriptor), and valid is a boolean
+    mask that is False for SMILES RDKit cannot parse; their rows are left empty in
+    every block.
+    """
+    descriptors = [get_descriptor(key) for key in keys]
+    buffers = [descriptor.buffer(len(smiles_list)) for descriptor in descriptors]
+    valid = np.zeros(len(smiles_list), dtype=bool)
+    for i, smiles in enumerate(smiles_list):
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None: continue
+        for descriptor, buffer in zip(descriptors, buffers):
+            descriptor.fill(buffer, i, mol)
+        valid[i] = True
+    blocks = {
+        descriptor.key: descriptor.finish(buffer)
+        for descriptor, buffer in zip(descriptors, buffers)
+    }
+    return blocks, valid
+
+
+def unpack_dense(packed, n_bits, out=None, chunk_rows=4096):
+    """
+    Unpack an (n, ceil(n_bits / 8)) packed block into a dense (n, n_bits) float32 matrix.
+    Works in row chunks so the only temporary is a chunk-sized uint8 buffer.
+    """
+    if out is None:
+        out = np.empty((len(packed), n_bits), dtype=np.float32)
+    for start in range(0, len(packed), chunk_rows):
+        out[start:start + chunk_rows] = np.unpackbits(packed[start:start + chunk_rows], axis=1, count=n_bits)
+    return out
+
+
+def packed_to_csr(packed, n_bits, chunk_rows=4096):
+    """
+    Convert an (n, ceil(n_bits / 8)) packed block into a CSR matrix of its on-bits.
+    A 2048-bit ECFP row with ~60 on-bits takes ~0.5 KB in CSR instead of 8 KB dense.
+    """
+    indices, row_counts = [], []
+    for start in range(0, len(packed), chunk_rows):
+        dense = np.unpackbits(packed[start:start + chunk_rows], axis=1, count=n_bits)
+        rows, cols = np.nonzero(dense)
+        indices.append(cols.astype(np.int32))
+        row_counts.append(np.bincount(rows, minlength=len(dense)))
+
+    indptr = np.zeros(len(packed) + 1, dtype=np.int64)
+    if row_counts:
+        np.cumsum(np.concatenate(row_counts), out=indptr[1:])
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+    data = np.ones(len(indices), dtype=np.float32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(packed), n_bits))
@@ -0,0 +1,150 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+# SQLite caps the number of bound parameters per statement.
+_QUERY_CHUNK = 900
+# last_used is only refreshed once it is this old, so most hits cost no write
+_TOUCH_INTERVAL_SECONDS = 3600
+
+
+class FingerprintCache:
+    """
+    Disk-backed fingerprint store shared by every worker process.
+
+    Entries are keyed by (canonical SMILES, featurizer key), where the featurizer
+    key encodes the featurizer parameters (e.g. "ecfp:r3:2048"). Vectors are stored
+    bit-packed, so a 2048-bit ECFP takes 256 bytes instead of 8 KB of float32.
+    Once the store grows past max_entries, the least recently used entries are evicted.
+    Recency is tracked to within _TOUCH_INTERVAL_SECONDS, and the row count is kept in
+    fingerprint_stats by every writer, so neither a hit nor a store scans the table.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread; connections are opened lazily so they are
+        # never shared across a gunicorn fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " smiles TEXT NOT NULL,"
+                " featurizer TEXT NOT NULL,"
+                " n_bits INTEGER NOT NULL,"
+                " bits BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (smiles, featurizer)"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_last_used ON fingerprints (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprint_stats ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " row_count INTEGER NOT NULL"
+                ")"
+            )
+            with self._transaction(conn):
+                # Stores created before the count existed are counted once
+                conn.execute("INSERT OR IGNORE INTO fingerprint_stats SELECT 0, COUNT(*) FROM fingerprints")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        # The connection is in autocommit mode; group writes into one transaction
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_many(self, smiles_list, featurizer):
+        """Return {smiles: packed bytes} for every SMILES found in the cache."""
+        conn = self._connection()
+        found = {}
+        stale = []
+        now = time.time()
+        for start in range(0, len(smiles_list), _QUERY_CHUNK):
+            chunk = smiles_list[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT smiles, bits, last_used FROM fingerprints"
+                f" WHERE featurizer = ? AND smiles IN ({placeholders})",
+                [featurizer, *chunk],
+            ).fetchall()
+            for smiles, bits, last_used in rows:
+                found[smiles] = bits
+                if now - last_used >= _TOUCH_INTERVAL_SECONDS:
+                    stale.append((now, smiles, featurizer))
+
+        if stale:
+            with self._transaction(conn):
+                conn.executemany(
+                    "UPDATE fingerprints SET last_used = ? WHERE smiles = ? AND featurizer = ?", stale
+                )
+        return found
+
+    def set_many(self, fingerprints, featurizer, n_bits):
+        """Store {smiles: packed bytes} and evict old entries if the store is over budget."""
+        if not fingerprints:
+            return
+        conn = self._connection()
+        now = time.time()
+        with self._transaction(conn):
+            # A featurizer key always gives the same vector, so rows another worker stored meanwhile are kept
+            added = conn.executemany(
+                "INSERT OR IGNORE INTO fingerprints (smiles, featurizer, n_bits, bits, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (smiles, featurizer, n_bits, bits, now)
+                    for smiles, bits in fingerprints.items()
+                ],
+            ).rowcount
+            conn.execute("UPDATE fingerprint_stats SET row_count = row_count + ?", (added,))
+            self._evict(conn)
+
+    def evict(self):
+        """Trim the store to 90% of max_entries, dropping least recently used rows first."""
+        conn = self._connection()
+        with self._transaction(conn):
+            self._evict(conn)
+
+    def _evict(self, conn):
+        # Call inside a write transaction
+        (count,) = conn.execute("SELECT row_count FROM fingerprint_stats").fetchone()
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        removed = conn.execute(
+            "DELETE FROM fingerprints WHERE (smiles, featurizer) IN ("
+            " SELECT smiles, featurizer FROM fingerprints ORDER BY last_used LIMIT ?)",
+            (excess,),
+        ).rowcount
+        conn.execute("UPDATE fingerprint_stats SET row_count = row_count - ?", (removed,))
+
+
+_cache = None
+
+
+def get_fingerprint_cache():
+    """Return the process-wide FingerprintCache configured from settings."""
+    global _cache
+    if _cache is None:
+        _cache = FingerprintCache(
+            settings.FINGERPRINT_CACHE_PATH,
+            settings.FINGERPRINT_CACHE_MAX_ENTRIES,
+        )
+    return _cache
@@ -0,0 +1,76 @@
+import csv
+import gzip
+import io
+import shutil
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from django.conf import settings
+from .normalization import NormalizedSmiles
+
+GZIP_MAGIC = b"\x1f\x8b"
+CSV_EXTENSIONS = (".csv", ".csv.gz")
+
+
+def open_text(binary):
+    """Wrap a binary file object as UTF-8 text (BOM stripped), gunzipping it if it is gzip'd."""
+    binary.seek(0)
+    magic = binary.read(2)
+    binary.seek(0)
+    if magic == GZIP_MAGIC:
+        binary = gzip.GzipFile(fileobj=binary, mode="rb")
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+def iter_csv_smiles(binary):
+    """
+    Yield the SMILES in the first column of a CSV file (plain or gzip'd), one row at a
+    time, so the file is never held in memory. Blank rows are skipped.
+    """
+    text = open_text(binary)
+    try:
+        for row in csv.reader(text):
+            if row and row[0].strip():
+                yield row[0].strip()
+    finally:
+        # Leave the caller's file open (e.g. to spool it after reading the first rows)
+        text.detach()
+
+
+def iter_unique_chunks(smiles_iter, chunk_size, standardize=False):
+    """
+    Canonicalize an input stream in chunks of chunk_size SMILES and yield
+    (rows, unique) per chunk: the number of input rows consumed and the distinct valid
+    canonical SMILES not seen before.
+
+    Duplicates are dropped within a chunk, and across chunks against the most recent
+    PREDICTION_STREAM_DEDUP_WINDOW molecules, so memory stays bounded however long the
+    stream is. Older repeats can come through again; callers that persist results must
+    skip molecules they already stored.
+    """
+    recent = OrderedDict()
+    while True:
+        chunk = list(islice(smiles_iter, chunk_size))
+        if not chunk:
+            return
+        unique = [s for s in NormalizedSmiles(chunk, standardize=standardize).unique if s not in recent]
+        for smiles in unique:
+            recent[smiles] = None
+        while len(recent) > settings.PREDICTION_STREAM_DEDUP_WINDOW:
+            recent.popitem(last=False)
+        yield len(chunk), unique
+
+
+def spool_upload(uploaded_file):
+    """
+    Copy an uploaded file to PREDICTION_UPLOAD_DIR for a queued job, in fixed-size
+    blocks, and return its path. The name keeps a .gz suffix for gzip'd uploads.
+    """
+    directory = settings.PREDICTION_UPLOAD_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    uploaded_file.seek(0)
+    suffix = ".csv.gz" if uploaded_file.name.endswith(".gz") else ".csv"
+    path = directory / f"{uuid.uuid4().hex}{suffix}"
+    with open(path, "wb") as out:
+        shutil.copyfileobj(uploaded_file, out, length=1 << 20)
+    return path
@@ -0,0 +1,181 @@
+import logging
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from api.models import Prediction, PredictionCompound
+from .ingestion import iter_csv_smiles, iter_unique_chunks
+from .normalization import smiles_hash
+from .persistence import get_or_create_compounds, create_prediction_compounds
+from .properties import compute_lelp
+from .scheduling import LaneSaturated
+from .utils import predict_batch_multi
+
+LOGGER = logging.getLogger(__name__)
+
+
+QUEUED = (Prediction.Status.PENDING, Prediction.Status.RUNNING)
+# Predictions that are jobs, i.e. still carry their input
+HAS_INPUT = Q(input_smiles__isnull=False) | Q(input_file__isnull=False)
+
+
+def enqueue_predictions(user, ml_models, standardize, input_source_type, smiles_list=None, input_file=None):
+    """
+    Queue one PENDING Prediction per model, for either a list of input SMILES or an
+    upload spooled to input_file (see ingestion.spool_upload), which all of them share.
+
+    Raises LaneSaturated (429) when the user already has PREDICTION_JOB_MAX_QUEUED_PER_USER
+    jobs queued or running, and (503) when PREDICTION_JOB_MAX_QUEUED jobs are pending overall.
+    """
+    queued = Prediction.objects.filter(HAS_INPUT, status__in=QUEUED)
+    if queued.filter(user=user).count() + len(ml_models) > settings.PREDICTION_JOB_MAX_QUEUED_PER_USER:
+        raise LaneSaturated(
+            f"You already have the maximum of {settings.PREDICTION_JOB_MAX_QUEUED_PER_USER} queued predictions.",
+            429, settings.PREDICTION_RETRY_AFTER_SECONDS,
+        )
+    if queued.filter(status=Prediction.Status.PENDING).count() + len(ml_models) > settings.PREDICTION_JOB_MAX_QUEUED:
+        raise LaneSaturated("The prediction queue is full; retry later.", 503, settings.PREDICTION_RETRY_AFTER_SECONDS)
+
+    with transaction.atomic():
+        return [
+            Prediction.objects.create(
+                user=user,
+                ml_model=ml_model,
+                status=Prediction.Status.PENDING,
+                input_source_type=input_source_type,
+                input_smiles=smiles_list,
+                input_file=str(input_file) if input_file else None,
+                standardize=standardize,
+            )
+            for ml_model in ml_models
+        ]
+
+
+def claim_next_job():
+    """
+    Claim the next job to run: a queued job, or a running one whose worker stopped
+    reporting progress for longer than PREDICTION_JOB_LEASE_SECONDS.
+
+    Jobs are shared fairly between users: users already running
+    PREDICTION_JOB_MAX_RUNNING_PER_USER jobs are skipped, and among the rest the oldest
+    job of the user with the fewest running jobs wins. Rows are locked with
+    SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can poll the same table
+    without claiming the same job. Returns None if nothing can be claimed.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.PREDICTION_JOB_LEASE_SECONDS)
+    with transaction.atomic():
+        running = dict(
+            Prediction.objects.filter(status=Prediction.Status.RUNNING, heartbeat_at__gte=stale)
+            .values_list("user").annotate(n=Count("id")).order_by()
+        )
+        busy = [user for user, n in running.items() if n >= settings.PREDICTION_JOB_MAX_RUNNING_PER_USER]
+        candidates = list(
+            Prediction.objects.select_for_update(skip_locked=True)
+            .filter(HAS_INPUT)
+            .filter(
+                Q(status=Prediction.Status.PENDING)
+                | Q(status=Prediction.Status.RUNNING, heartbeat_at__lt=stale)
+            )
+            .exclude(user__in=busy)
+            .order_by("created_at")
+            .only("id", "user_id", "created_at")[:50]
+        )
+        if not candidates:
+            return None
+        claimed = min(candidates, key=lambda p: (running.get(p.user_id, 0), p.created_at))
+        Prediction.objects.filter(pk=claimed.pk).update(status=Prediction.Status.RUNNING, heartbeat_at=now)
+    return Prediction.objects.select_related("ml_model").get(pk=claimed.pk)
+
+
+def queue_stats():
+    """Depth of the job queue overall and per user, and how long the oldest job has waited."""
+    queued = Prediction.objects.filter(HAS_INPUT, status__in=QUEUED)
+    by_status = dict(queued.values_list("status").annotate(n=Count("id")).order_by())
+    oldest = queued.filter(status=Prediction.Status.PENDING).aggregate(oldest=Min("created_at"))["oldest"]
+    per_user = {}
+    for user, job_status, n in queued.values_list("user", "status").annotate(n=Count("id")).order_by():
+        per_user.setdefault(str(user), {})[job_status.lower()] = n
+    return {
+        "pending": by_status.get(Prediction.Status.PENDING, 0),
+        "running": by_status.get(Prediction.Status.RUNNING, 0),
+        "oldest_pending_seconds": round((timezone.now() - oldest).total_seconds(), 1) if oldest else None,
+        "per_user": per_user,
+    }
+
+
+def iter_job_input(prediction):
+    """Yield a job's input SMILES, streaming them from its spooled upload if it has one."""
+    if prediction.input_file:
+        with open(prediction.input_file, "rb") as f:
+            yield from iter_csv_smiles(f)
+    else:
+        yield from prediction.input_smiles
+
+
+def run_prediction_job(prediction, chunk_size=None):
+    """
+    Score a claimed job chunk by chunk: each chunk of input SMILES is canonicalized,
+    featurized, predicted and committed together with the progress, so memory stays flat
+    however large the input is and the prediction endpoint serves partial results while
+    the job runs. Molecules already stored for the prediction (repeats further down the
+    input, or work of a worker that died mid-job) are skipped.
+
+    progress_total counts input SMILES (one quick pass over the input) and
+    progress_done the SMILES processed so far.
+    """
+    chunk_size = chunk_size or settings.PREDICTION_JOB_CHUNK_SIZE
+    ml_model = prediction.ml_model
+    model_spec = (ml_model.file_path, ml_model.method, ml_model.descriptor, ml_model.version)
+    try:
+        total = sum(1 for _ in iter_job_input(prediction))
+        Prediction.objects.filter(pk=prediction.pk).update(progress_total=total, progress_done=0)
+
+        scored = 0
+        for rows, unique in iter_unique_chunks(iter_job_input(prediction), chunk_size, prediction.standardize):
+            hashes = {smiles: smiles_hash(smiles) for smiles in unique}
+            stored = set(
+                PredictionCompound.objects
+                .filter(prediction=prediction, compound__smiles_hash__in=hashes.values())
+                .values_list("compound__smiles_hash", flat=True)
+            )
+            pending = [smiles for smiles in unique if hashes[smiles] not in stored]
+            scored += len(unique)
+
+            properties, domains = {}, []
+            predictions = predict_batch_multi(
+                pending, [model_spec], properties=properties, domains=domains
+            )[0][0] if pending else []
+            domain = domains[0] if domains else {}
+            with transaction.atomic():
+                compounds = get_or_create_compounds(pending, properties)
+                create_prediction_compounds(prediction, [
+                    (compounds[smiles], ic50, compute_lelp(ic50, compounds[smiles]), domain.get(smiles))
+                    for smiles, ic50 in zip(pending, predictions)
+                    if not isinstance(ic50, str)
+                ])
+                Prediction.objects.filter(pk=prediction.pk).update(
+                    progress_done=F("progress_done") + rows, heartbeat_at=timezone.now()
+                )
+        if not scored:
+            raise ValueError("No valid SMILES strings provided.")
+
+        Prediction.objects.filter(pk=prediction.pk).update(
+            status=Prediction.Status.COMPLETED, completed_at=timezone.now(), input_smiles=None, input_file=None
+        )
+        _release_input_file(prediction)
+    except Exception as e:
+        LOGGER.exception(f"Prediction job {prediction.pk} failed")
+        Prediction.objects.filter(pk=prediction.pk).update(
+            status=Prediction.Status.FAILED, completed_at=timezone.now(), error=str(e),
+            input_smiles=None, input_file=None
+        )
+        _release_input_file(prediction)
+
+
+def _release_input_file(prediction):
+    # The upload is shared by every model's job from the same request; the last one deletes it
+    if prediction.input_file and not Prediction.objects.filter(input_file=prediction.input_file, status__in=QUEUED).exists():
+        Path(prediction.input_file).unlink(missing_ok=True)
@@ -0,0 +1,41 @@
+import hashlib
+from rdkit import Chem
+from rdkit.Chem.MolStandardize import rdMolStandardize
+
+
+def canonicalize_smiles(smiles, standardize=False):
+    """
+    Return RDKit's canonical SMILES for the input, or None if it cannot be parsed.
+    With standardize=True the molecule is first reduced to its parent fragment
+    (salts and solvents stripped, structure cleaned up).
+    """
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None: return None
+    if standardize:
+        mol = rdMolStandardize.FragmentParent(mol)
+    return Chem.MolToSmiles(mol)
+
+
+def smiles_hash(canonical_smiles):
+    """Compound identity key: SHA-256 hex digest of the canonical SMILES."""
+    return hashlib.sha256(canonical_smiles.encode()).hexdigest()
+
+
+class NormalizedSmiles:
+    """
+    Canonicalizes a batch of input SMILES once, up front.
+
+    `canonical` is aligned with `inputs` (None for unparsable SMILES) and `unique`
+    holds each distinct valid molecule once, in first-seen order. Featurization,
+    inference and persistence run on `unique`; `fan_out` maps their results back
+    onto the original input order.
+    """
+
+    def __init__(self, inputs, standardize=False):
+        self.inputs = list(inputs)
+        self.canonical = [canonicalize_smiles(s, standardize) for s in self.inputs]
+        self.unique = [s for s in dict.fromkeys(self.canonical) if s is not None]
+
+    def fan_out(self, values):
+        """Map a {canonical_smiles: value} dict back onto the input order."""
+        return [values.get(c) if c is not None else None for c in self.canonical]
@@ -0,0 +1,15 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class PredictionCursorPagination(CursorPagination):
+    """
+    Newest-first cursor pagination of a user's predictions. Each page is one indexed
+    range scan on (user, created_at), however deep the client pages, and pages stay
+    stable while new predictions are created.
+    """
+
+    ordering = "-created_at"
+    page_size = settings.PREDICTION_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.PREDICTION_MAX_PAGE_SIZE
@@ -0,0 +1,194 @@
+import codecs
+import csv
+import io
+import json
+import tempfile
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+from .ingestion import iter_csv_smiles
+
+# Larger `smiles` arrays are spooled to a temporary file instead of a Python list
+_IN_MEMORY_SMILES = 1000
+_READ_SIZE = 64 * 1024
+_WHITESPACE = " \t\r\n"
+_DECODER = json.JSONDecoder()
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Request body too large."
+    default_code = "payload_too_large"
+
+
+class SmilesSpool:
+    """
+    A large `smiles` array, spooled to a temporary file as one-column CSV while the body
+    was parsed. Iterating yields the SMILES lazily; it can also be copied as an upload
+    (see ingestion.spool_upload).
+    """
+    name = "smiles.csv"
+
+    def __init__(self, file, count):
+        self.file = file
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter_csv_smiles(self.file)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+
+class _Reader:
+    """Incrementally decodes a UTF-8 byte stream, counting bytes against max_bytes."""
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buffer = ""
+        self.pos = 0
+        self.read_bytes = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(_READ_SIZE)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise PayloadTooLarge(f"Request body exceeds {self.max_bytes} bytes.")
+        self.eof = not data
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character ("" at the end of the body)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ParseError(f"JSON parse error - expected '{char}' at byte {self.read_bytes}.")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more of the body as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                # A number may continue past the end of the buffer
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ParseError(f"JSON parse error - {e}")
+            self.fill()
+
+
+class StreamingJSONParser(BaseParser):
+    """
+    JSON parser for the predict endpoint that never holds a large `smiles` array in memory.
+
+    The body is decoded incrementally. Up to a thousand SMILES are returned as a list, as
+    JSONParser would; beyond that they are written to a temporary file as they are parsed
+    and `smiles` becomes a SmilesSpool. The body size (PREDICTION_JSON_MAX_BYTES) and the
+    number of SMILES (PREDICTION_JSON_MAX_SMILES) are checked while reading, so oversized
+    requests are rejected with 413 without reading them to the end.
+    """
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_bytes = settings.PREDICTION_JSON_MAX_BYTES
+        request = (parser_context or {}).get("request")
+        if request is not None and int(request.META.get("CONTENT_LENGTH") or 0) > max_bytes:
+            raise PayloadTooLarge(f"Request body exceeds {max_bytes} bytes.")
+        if stream is None:
+            return {}
+
+        reader = _Reader(stream, max_bytes)
+        if reader.peek() != "{":
+            # Anything but an object is small enough to decode as usual
+            value = reader.value()
+            if reader.peek():
+                raise ParseError("JSON parse error - extra data after the document.")
+            return value
+
+        reader.expect("{")
+        data = {}
+        if reader.peek() == "}":
+            reader.pos += 1
+            return data
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ParseError("JSON parse error - object keys must be strings.")
+            reader.expect(":")
+            if key == "smiles" and reader.peek() == "[":
+                data[key] = self._parse_smiles(reader)
+            else:
+                data[key] = reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+                continue
+            reader.expect("}")
+            break
+        if reader.peek():
+            raise ParseError("JSON parse error - extra data after the document.")
+        return data
+
+    def _parse_smiles(self, reader):
+        max_smiles = settings.PREDICTION_JSON_MAX_SMILES
+        reader.expect("[")
+        smiles, kept, count = [], 0, 0
+        spool = None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            writer.writerows([s] for s in smiles)
+            spool.write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+            smiles.clear()
+
+        if reader.peek() == "]":
+            reader.pos += 1
+            return smiles
+        while True:
+            value = reader.value()
+            count += 1
+            if count > max_smiles:
+                raise PayloadTooLarge(f"At most {max_smiles} SMILES can be submitted at once.")
+            # Non-strings and blanks are dropped, as for list input in the view
+            if isinstance(value, str) and value.strip():
+                smiles.append(value.strip())
+                kept += 1
+            if len(smiles) > _IN_MEMORY_SMILES:
+                spool = spool or tempfile.TemporaryFile()
+                flush()
+            if reader.peek() == ",":
+                reader.pos += 1
+                continue
+            reader.expect("]")
+            break
+
+        if spool is None:
+            return smiles
+        flush()
+        spool.seek(0)
+        return SmilesSpool(spool, kept)
@@ -0,0 +1,152 @@
+from functools import partial
+from django.conf import settings
+from django.db import connection, transaction
+from api.models import Compound, PredictionCompound
+from api.v1.compounds.similarity import index_compounds
+from .featurizers import PROPERTY_COLUMNS
+from .normalization import canonicalize_smiles, smiles_hash
+from .properties import apply_properties, compute_properties
+
+
+def get_or_create_compounds(smiles_list, properties=None):
+    """
+    Return {smiles: Compound} for a list of distinct canonical SMILES, creating the
+    missing compounds.
+
+    New compounds are stored with their RDKit properties (formula, weight, InChI,
+    InChIKey, heavy atoms, logP), taken from properties ({smiles: values}, e.g. from
+    predict_batch_multi) or computed here; compounds stored before these were computed
+    get them filled in with one bulk update. New compounds are added to the similarity
+    index once the transaction commits.
+
+    Compounds are identified by smiles_hash (unique). Existing ones are resolved with
+    a single IN query on that index (split only where the database limits query
+    parameters, e.g. SQLite) and the missing ones are inserted in bulk with
+    INSERT ... ON CONFLICT (smiles_hash) DO UPDATE, so a compound created meanwhile by
+    a concurrent request is reused rather than duplicated. The number of queries does
+    not grow with the batch. Call inside a transaction.
+    """
+    hashes = {smiles: smiles_hash(smiles) for smiles in smiles_list}
+    by_hash = {}
+    chunk = connection.ops.bulk_batch_size(["smiles_hash"], smiles_list) or 1
+    for start in range(0, len(smiles_list), chunk):
+        keys = [hashes[smiles] for smiles in smiles_list[start:start + chunk]]
+        by_hash.update((compound.smiles_hash, compound) for compound in Compound.objects.filter(smiles_hash__in=keys))
+
+    missing = [
+        Compound(smiles=smiles, smiles_hash=hashes[smiles])
+        for smiles in smiles_list if hashes[smiles] not in by_hash
+    ]
+    outdated = {
+        smiles: by_hash[hashes[smiles]]
+        for smiles in smiles_list if hashes[smiles] in by_hash and by_hash[hashes[smiles]].logp is None
+    }
+    properties = dict(properties or {})
+    to_compute = [s for s in [*(c.smiles for c in missing), *outdated] if s not in properties]
+    if to_compute:
+        properties.update(compute_properties(to_compute))
+    for compound in missing:
+        apply_properties(compound, properties.get(compound.smiles, ()))
+    updated = [
+        compound for smiles, compound in outdated.items()
+        if apply_properties(compound, properties.get(smiles, ()))
+    ]
+    if updated:
+        Compound.objects.bulk_update(updated, PROPERTY_COLUMNS, batch_size=settings.PERSIST_BATCH_SIZE)
+
+    created = Compound.objects.bulk_create(
+        missing,
+        batch_size=settings.PERSIST_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["smiles_hash"],
+        update_fields=["smiles_hash"],
+    )
+    by_hash.update((compound.smiles_hash, compound) for compound in created)
+    if created:
+        # A failure here only delays indexing until the next `manage.py build_similarity_index`
+        transaction.on_commit(partial(index_compounds, created), robust=True)
+    return {smiles: by_hash[hashes[smiles]] for smiles in smiles_list}
+
+
+def create_prediction_compounds(prediction, results):
+    """
+    Store the results of one Prediction, given as (compound, ic50, lelp, domain) tuples,
+    where domain is the (max, mean) training-set similarity or None.
+
+    Rows are written with bulk_create in PERSIST_BATCH_SIZE batches. Rows the prediction
+    already holds are left as they are, so a job worker whose lease was taken over can
+    finish its chunk without failing the job under its new owner. Call inside a
+    transaction.
+    """
+    rows = [
+        PredictionCompound(
+            prediction=prediction, compound=compound, ic50=ic50, lelp=lelp,
+            domain_max_similarity=domain[0] if domain else None,
+            domain_mean_similarity=domain[1] if domain else None,
+        )
+        for compound, ic50, lelp, domain in results
+    ]
+    PredictionCompound.objects.bulk_create(rows, batch_size=settings.PERSIST_BATCH_SIZE, ignore_conflicts=True)
+    return rows
+
+
+# Descriptive fields a surviving compound inherits from its duplicates when it lacks them
+_MERGED_FIELDS = (
+    "iupac_name", "cid", "category", "description", "molecular_formula", "molecular_weight",
+    "synonyms", "inchi", "inchikey", "structure_image",
+)
+
+
+def merge_duplicate_compounds():
+    """
+    Backfill smiles_hash and merge compounds that share a canonical structure.
+
+    The oldest compound of each group survives and takes over any descriptive fields it
+    is missing; PredictionCompound rows are repointed to it (dropping a row when its
+    prediction already holds the survivor) and the duplicates are deleted. Compounds
+    whose SMILES RDKit cannot parse keep a NULL smiles_hash. Returns (hashed, merged):
+    compounds given a smiles_hash and duplicates removed.
+    """
+    groups = {}
+    unhashed = {}
+    for pk, smiles, key in Compound.objects.order_by("pk").values_list("pk", "smiles", "smiles_hash").iterator():
+        if key is None:
+            canonical = canonicalize_smiles(smiles) if smiles else None
+            if canonical is None:
+                continue
+            key = unhashed[pk] = smiles_hash(canonical)
+        groups.setdefault(key, []).append(pk)
+
+    newly_hashed = len(unhashed)
+    merged = 0
+    for key, pks in groups.items():
+        if len(pks) < 2:
+            continue
+        survivor_pk, duplicate_pks = pks[0], pks[1:]
+        compounds = Compound.objects.in_bulk(pks)
+        survivor = compounds[survivor_pk]
+        for field in _MERGED_FIELDS:
+            if getattr(survivor, field) is None:
+                values = [getattr(compounds[pk], field) for pk in duplicate_pks]
+                setattr(survivor, field, next((v for v in values if v is not None), None))
+
+        taken = set(PredictionCompound.objects.filter(compound_id=survivor_pk).values_list("prediction_id", flat=True))
+        repoint, drop = [], []
+        rows = PredictionCompound.objects.filter(compound_id__in=duplicate_pks).values_list("pk", "prediction_id")
+        for pk, prediction_id in rows:
+            (drop if prediction_id in taken else repoint).append(pk)
+            taken.add(prediction_id)
+        PredictionCompound.objects.filter(pk__in=drop).delete()
+        PredictionCompound.objects.filter(pk__in=repoint).update(compound_id=survivor_pk)
+        Compound.objects.filter(pk__in=duplicate_pks).delete()
+
+        survivor.smiles_hash = key
+        survivor.save(update_fields=[*_MERGED_FIELDS, "smiles_hash"])
+        merged += len(duplicate_pks)
+        newly_hashed -= sum(unhashed.pop(pk, None) is not None for pk in duplicate_pks)
+        unhashed.pop(survivor_pk, None)
+
+    # Hash the remaining (unique) compounds only now, after duplicates are gone
+    updates = [Compound(pk=pk, smiles_hash=key) for pk, key in unhashed.items()]
+    Compound.objects.bulk_update(updates, ["smiles_hash"], batch_size=settings.PERSIST_BATCH_SIZE)
+    return newly_hashed, merged
@@ -0,0 +1,40 @@
+import math
+from django.conf import settings
+from .featurization_pool import get_featurization_pool
+from .featurizers import PROPERTIES_KEY, PROPERTY_COLUMNS
+
+# Molar concentration of one unit of predicted IC50, per PREDICTION_IC50_UNIT
+IC50_UNITS = {"M": 1.0, "mM": 1e-3, "uM": 1e-6, "nM": 1e-9}
+# 2.303 RT at 298 K in kcal/mol: free energy of binding per pIC50 unit
+_KCAL_PER_PIC50 = 1.37
+
+
+def compute_properties(smiles_list):
+    """Return {smiles: values of PROPERTY_COLUMNS} for the SMILES RDKit can parse."""
+    blocks, valid = get_featurization_pool().featurize(smiles_list, [PROPERTIES_KEY])
+    return {smiles: row for smiles, row, ok in zip(smiles_list, blocks[PROPERTIES_KEY], valid) if ok}
+
+
+def apply_properties(compound, values):
+    """Set locally computed properties on a compound where they are missing; returns True if any was set."""
+    changed = False
+    for field, value in zip(PROPERTY_COLUMNS, values):
+        if getattr(compound, field) is None and value is not None:
+            setattr(compound, field, value)
+            changed = True
+    return changed
+
+
+def compute_lelp(ic50, compound):
+    """
+    LELP (lipophilicity-corrected ligand efficiency) = logP / LE, where
+    LE = 1.37 * pIC50 / heavy atoms. Returns None where it is undefined: missing
+    properties, or a non-positive IC50 or LE.
+    """
+    if ic50 is None or compound.logp is None or not compound.heavy_atoms or ic50 <= 0:
+        return None
+    pic50 = -math.log10(ic50 * IC50_UNITS[settings.PREDICTION_IC50_UNIT])
+    efficiency = _KCAL_PER_PIC50 * pic50 / compound.heavy_atoms
+    if efficiency <= 0:
+        return None
+    return compound.logp / efficiency
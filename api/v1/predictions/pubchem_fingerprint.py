@@ -0,0 +1,319 @@
+"""
+RDKit implementation of the PubChem (CACTVS) 881-bit substructure fingerprint.
+
+The models tagged "pubchem" were trained on deepchem's PubChemFingerprint, which
+downloads the CACTVS fingerprint of each compound from PubChem. This module computes
+the same keys locally, following the layout of the published PubChem fingerprint
+specification (ftp.ncbi.nlm.nih.gov/pubchem/specifications/pubchem_fingerprints.txt):
+
+    Section 1  bits 0-114    hierarchic element counts
+    Section 2  bits 115-262  ring counts in the smallest set of smallest rings
+    Section 3  bits 263-326  simple atom pairs
+    Section 4  bits 327-415  simple atom nearest neighbours
+    Section 5  bits 416-459  detailed atom neighbourhoods
+    Section 6  bits 460-712  simple SMARTS patterns
+    Section 7  bits 713-880  complex SMARTS patterns
+
+All 881 keys are ported. api/testdata/pubchem_fingerprints.csv holds CACTVS
+fingerprints downloaded from PubChem, which the test suite checks bit for bit; run
+`manage.py check_pubchem_fingerprint` against a larger reference set before enabling
+PUBCHEM_FINGERPRINT_ENABLED.
+
+All SMARTS are compiled once at import, so each featurization worker pays the cost
+once, and patterns that need an element the molecule lacks are skipped without
+running a substructure search.
+"""
+import re
+from rdkit import Chem
+
+PUBCHEM_BITS = 881
+
+_PERIODIC_TABLE = Chem.GetPeriodicTable()
+
+# --- Section 1: Hierarchic element counts ---
+
+ELEMENT_THRESHOLDS = [
+    ("H", (4, 8, 16, 32)), ("Li", (1, 2)), ("B", (1, 2, 4)), ("C", (2, 4, 8, 16, 32)),
+    ("N", (1, 2, 4, 8)), ("O", (1, 2, 4, 8, 16)), ("F", (1, 2, 4)), ("Na", (1, 2)),
+    ("Si", (1, 2)), ("P", (1, 2, 4)), ("S", (1, 2, 4, 8)), ("Cl", (1, 2, 4, 8)),
+    ("K", (1, 2)), ("Br", (1, 2, 4)), ("I", (1, 2, 4)),
+] + [
+    (symbol, (1,)) for symbol in (
+        "Be Mg Al Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Kr Rb Sr Y Zr Nb Mo Ru Rh "
+        "Pd Ag Cd In Sn Sb Te Xe Cs Ba Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi La Ce Pr Nd "
+        "Pm Sm Eu Gd Tb Dy Ho Er Tm Yb Tc U"
+    ).split()
+]
+
+# (bit, atomic number, minimum count)
+_ELEMENT_BITS = []
+for _symbol, _thresholds in ELEMENT_THRESHOLDS:
+    for _threshold in _thresholds:
+        _ELEMENT_BITS.append((len(_ELEMENT_BITS), _PERIODIC_TABLE.GetAtomicNumber(_symbol), _threshold))
+
+# --- Section 2: Rings ---
+
+# Ring size -> minimum ring counts, each with 7 bits: any ring, then saturated-or-aromatic
+# carbon-only / N-containing / heteroatom-containing, then the same three for
+# unsaturated non-aromatic rings. Rings are those of the SSSR plus, as in CACTVS's ESSSR,
+# the envelope of each pair of rings fused on one bond (e.g. the 9-ring of indole).
+RING_THRESHOLDS = [(3, (1, 2)), (4, (1, 2)), (5, (1, 2, 3, 4, 5)), (6, (1, 2, 3, 4, 5)),
+                   (7, (1, 2)), (8, (1, 2)), (9, (1,)), (10, (1,))]
+_RING_KINDS = 7
+_RING_BASE = 115
+_AROMATIC_RING_BASE = 255  # >= 1..4 aromatic rings, each followed by >= n hetero-aromatic rings
+_MAX_ENVELOPE_SIZE = max(size for size, _ in RING_THRESHOLDS)
+
+# --- Sections 3-6: SMARTS in PubChem specification notation ---
+# Element symbols match any aromaticity; "-" and "=" also match aromatic bonds;
+# H is a hydrogen count on the neighbouring atom.
+
+ATOM_PAIRS = [
+    "Li~H", "Li~Li", "Li~B", "Li~C", "Li~O", "Li~F", "Li~P", "Li~S", "Li~Cl",
+    "B~H", "B~B", "B~C", "B~N", "B~O", "B~F", "B~Si", "B~P", "B~S", "B~Cl", "B~Br",
+    "C~H", "C~C", "C~N", "C~O", "C~F", "C~Na", "C~Mg", "C~Al", "C~Si", "C~P", "C~S",
+    "C~Cl", "C~As", "C~Se", "C~Br", "C~I",
+    "N~H", "N~N", "N~O", "N~F", "N~Si", "N~P", "N~S", "N~Cl", "N~Br",
+    "O~H", "O~O", "O~Mg", "O~Na", "O~Al", "O~Si", "O~P", "O~K",
+    "F~P", "F~S", "Al~H", "Al~Cl", "Si~H", "Si~Si", "Si~Cl", "P~H", "P~P", "As~H", "As~As",
+]
+
+NEAREST_NEIGHBOURS = [
+    "C(~Br)(~C)", "C(~Br)(~C)(~C)", "C(~Br)(~H)", "C(~Br)(:C)", "C(~Br)(:N)",
+    "C(~C)(~C)", "C(~C)(~C)(~C)", "C(~C)(~C)(~C)(~C)", "C(~C)(~C)(~C)(~H)",
+    "C(~C)(~C)(~C)(~N)", "C(~C)(~C)(~C)(~O)", "C(~C)(~C)(~H)(~N)", "C(~C)(~C)(~H)(~O)",
+    "C(~C)(~C)(~N)", "C(~C)(~C)(~O)", "C(~C)(~Cl)", "C(~C)(~Cl)(~H)", "C(~C)(~H)",
+    "C(~C)(~H)(~N)", "C(~C)(~H)(~O)", "C(~C)(~H)(~O)(~O)", "C(~C)(~H)(~P)",
+    "C(~C)(~H)(~S)", "C(~C)(~I)", "C(~C)(~N)", "C(~C)(~O)", "C(~C)(~S)", "C(~C)(~Si)",
+    "C(~C)(:C)", "C(~C)(:C)(:C)", "C(~C)(:C)(:N)", "C(~C)(:N)", "C(~C)(:N)(:N)",
+    "C(~Cl)(~Cl)", "C(~Cl)(~H)", "C(~Cl)(:C)", "C(~F)(~F)", "C(~F)(:C)", "C(~H)(~N)",
+    "C(~H)(~O)", "C(~H)(~O)(~O)", "C(~H)(~S)", "C(~H)(~Si)", "C(~H)(:C)",
+    "C(~H)(:C)(:C)", "C(~H)(:C)(:N)", "C(~H)(:N)", "C(~H)(~H)(~H)", "C(~N)(~N)",
+    "C(~N)(:C)", "C(~N)(:C)(:C)", "C(~N)(:C)(:N)", "C(~N)(:N)", "C(~O)(~O)",
+    "C(~O)(:C)", "C(~O)(:C)(:C)", "C(~S)(:C)", "C(:C)(:C)", "C(:C)(:C)(:C)",
+    "C(:C)(:C)(:N)", "C(:C)(:N)", "C(:C)(:N)(:N)", "C(:N)(:N)",
+    "N(~C)(~C)", "N(~C)(~C)(~C)", "N(~C)(~C)(~H)", "N(~C)(~H)", "N(~C)(~H)(~N)",
+    "N(~C)(~O)", "N(~C)(:C)", "N(~C)(:C)(:C)", "N(~H)(~N)", "N(~H)(:C)", "N(~H)(:C)(:C)",
+    "N(~O)(~O)", "N(~O)(:O)", "N(:C)(:C)", "N(:C)(:C)(:C)",
+    "O(~C)(~C)", "O(~C)(~H)", "O(~C)(~P)", "O(~H)(~S)", "O(:C)(:C)",
+    "P(~C)(~C)", "P(~O)(~O)", "S(~C)(~C)", "S(~C)(~H)", "S(~C)(~O)", "Si(~C)(~C)",
+]
+
+DETAILED_NEIGHBOURHOODS = [
+    "C=C", "C#C", "C=N", "C#N", "C=O", "C=S", "N=N", "N=O", "N=P", "P=O", "P=P",
+    "C(#C)(-C)", "C(#C)(-H)", "C(#N)(-C)", "C(-C)(-C)(=C)", "C(-C)(-C)(=N)",
+    "C(-C)(-C)(=O)", "C(-C)(-Cl)(=O)", "C(-C)(-H)(=C)", "C(-C)(-H)(=N)", "C(-C)(-H)(=O)",
+    "C(-C)(-N)(=C)", "C(-C)(-N)(=N)", "C(-C)(-N)(=O)", "C(-C)(-O)(=O)", "C(-C)(=C)",
+    "C(-C)(=N)", "C(-C)(=O)", "C(-Cl)(=O)", "C(-H)(-N)(=C)", "C(-H)(=C)", "C(-H)(=N)",
+    "C(-H)(=O)", "C(-N)(=C)", "C(-N)(=N)", "C(-N)(=O)", "C(-O)(=O)", "N(-C)(=C)",
+    "N(-C)(=O)", "N(-O)(=O)", "P(-O)(=O)", "S(-C)(=O)", "S(-O)(=O)", "S(=O)(=O)",
+]
+
+SIMPLE_SMARTS = [
+    "C-C-C#C", "O-C-C=N", "O-C-C=O", "N:C-S-H", "N-C-C=C", "O=S-C-C", "N#C-C=C",
+    "C=N-N-C", "O=S-C-N", "S-S-C:C", "C:C-C=C", "S:C:C:C", "C:N:C-C", "S-C:N:C",
+    "S:C:C:N", "S-C=N-C", "C-O-C=C", "N-N-C:C", "S-C=N-H", "S-C-S-C", "C:S:C-C",
+    "O-S-C:C", "C:N-C:C", "N-S-C:C", "N-C:N:C", "N:C:C:N", "N-C:N:N", "N-C=N-C",
+    "N-C=N-H", "N-C-S-C", "C-C-C=C", "C-N:C-H", "N-C:O:C", "O=C-C:C", "O=C-C:N",
+    "C-N-C:C", "N:N-C-H", "O-C:C:N", "O-C=C-C", "N-C:C:N", "C-S-C:C", "Cl-C:C-C",
+    "N-C=C-H", "Cl-C:C-H", "N:C:N-C", "Cl-C:C-O", "C-C:N:C", "C-C-S-C", "S=C-N-C",
+    "Br-C:C-C", "H-N-N-H", "S=C-N-H", "C-As-O-H", "S:C:C-H", "O-N-C-C", "N-N-C-C",
+    "H-C=C-H", "N-N-C-N", "O=C-N-N", "N=C-N-C", "C=C-C:C", "C:N-C-H", "C-N-N-H",
+    "N:C:C-C", "C-C=C-C", "As-C:C-H", "Cl-C:C-Cl", "C:C:N-H", "H-N-C-H", "Cl-C-C-Cl",
+    "N:C-C:C", "S-C:C-C", "S-C:C-H", "S-C:C-N", "S-C:C-O", "O=C-C-C", "O=C-C-N",
+    "O=C-C-O", "N=C-C-C", "N=C-C-H", "C-N-C-H", "O-C:C-C", "O-C:C-H", "O-C:C-N",
+    "O-C:C-O", "N-C:C-C", "N-C:C-H", "N-C:C-N", "O-C-C:C", "N-C-C:C", "Cl-C-C-C",
+    "Cl-C-C-O", "C:C-C:C", "O=C-C=C", "Br-C-C-C", "N=C-C=C", "C=C-C-C", "N:C-O-H",
+    "O=N-C:C", "O-C-N-H", "N-C-N-C", "Cl-C-C=O", "Br-C-C=O", "O-C-O-C", "C=C-C=C",
+    "C:C-O-C", "O-C-C-N", "O-C-C-O", "N#C-C-C", "N-C-C-N", "C:C-C-C", "H-C-O-H",
+    "N:C:N:C", "O-C-C=C", "O-C-C:C-C", "O-C-C:C-O", "N=C-C:C-H", "C:C-N-C:C",
+    "C-C:C-C:C", "O=C-C-C-C", "O=C-C-C-N", "O=C-C-C-O", "C-C-C-C-C", "Cl-C:C-O-C",
+    "C:C-C=C-C", "C-C:C-N-C", "C-S-C-C-C", "N-C:C-O-H", "O=C-C-C=O", "C-C:C-O-C",
+    "C-C:C-O-H", "Cl-C-C-C-C", "N-C-C-C-C", "N-C-C-C-N", "C-O-C-C=C", "C:C-C-C-C",
+    "N=C-N-C-C", "O=C-C-C:C", "Cl-C:C:C-C", "H-C-C=C-H", "N-C:C:C-C", "N-C:C:C-N",
+    "O=C-C-N-C", "C-C:C:C-C", "C-O-C-C:C", "O=C-C-O-C", "O-C:C-C-C", "N-C-C-C:C",
+    "C-C-C-C:C", "Cl-C-C-N-C", "C-O-C-O-C", "N-C-C-N-C", "N-C-O-C-C", "C-N-C-C-C",
+    "C-C-O-C-C", "N-C-C-O-C", "C:C:N:N:C", "C-C-C-O-H", "C:C-C-C:C", "O-C-C=C-C",
+    "C:C-O-C-C", "N-C:C:C:N", "O=C-O-C:C", "O=C-C:C-C", "O=C-C:C-N", "O=C-C:C-O",
+    "C-O-C:C-C", "O=As-C:C:C", "C-N-C-C:C", "S-C:C:C-N", "O-C:C-O-C", "O-C:C-O-H",
+    "C-C-O-C:C", "N-C-C:C-C", "C-C-C:C-C", "N-N-C-N-H", "C-N-C-N-C", "O-C-C-C-C",
+    "O-C-C-C-N", "O-C-C-C-O", "C=C-C-C-C", "O-C-C-C=C", "O-C-C-C=O", "H-C-C-N-H",
+    "C-C=N-N-C", "O=C-N-C-C", "O=C-N-C-H", "O=C-N-C-N", "O=N-C:C-N", "O=N-C:C-O",
+    "O=C-N-C=O", "O-C:C:C-C", "O-C:C:C-N", "O-C:C:C-O", "N-C-N-C-C", "O-C-C-C:C",
+    "C-C-N-C-C", "C-N-C:C-C", "C-C-S-C-C", "O-C-C-N-C", "C-C=C-C-C", "O-C-O-C-C",
+    "O-C-C-O-C", "O-C-C-O-H", "C-C=C-C=C", "N-C:C-C-C", "C=C-C-O-C", "C=C-C-O-H",
+    "C-C:C-C-C", "Cl-C:C-C=O", "Br-C:C:C-C", "O=C-C=C-C", "O=C-C=C-H", "O=C-C=C-N",
+    "N-C-N-C:C", "Br-C-C-C:C", "N#C-C-C-C", "C-C=C-C:C", "C-C-C=C-C", "C-C-C-C-C-C",
+    "O-C-C-C-C-C", "O-C-C-C-C-O", "O-C-C-C-C-N", "N-C-C-C-C-C", "O=C-C-C-C-C",
+    "O=C-C-C-C-N", "O=C-C-C-C-O", "O=C-C-C-C=O", "C-C-C-C-C-C-C", "O-C-C-C-C-C-C",
+    "O-C-C-C-C-C-O", "O-C-C-C-C-C-N", "O=C-C-C-C-C-C", "O=C-C-C-C-C-O", "O=C-C-C-C-C=O",
+    "O=C-C-C-C-C-N", "C-C-C-C-C-C-C-C", "C-C-C-C-C-C(-C)-C", "O-C-C-C-C-C-C-C",
+    "O-C-C-C-C-C(-C)-C", "O-C-C-C-C-C-O-C", "O-C-C-C-C-C(-O)-C", "O-C-C-C-C-C-N-C",
+    "O-C-C-C-C-C(-N)-C", "O=C-C-C-C-C-C-C", "O=C-C-C-C-C(-O)-C", "O=C-C-C-C-C(=O)-C",
+    "O=C-C-C-C-C(-N)-C", "C-C(-C)-C-C", "C-C(-C)-C-C-C", "C-C-C(-C)-C-C",
+    "C-C(-C)(-C)-C-C", "C-C(-C)-C(-C)-C",
+]
+_SIMPLE_SMARTS_BASE = 460
+
+# --- Section 7: Substituent pairs on 6- and 5-membered rings (plain SMARTS) ---
+# Substituents and ring atoms match any aromaticity, so an aromatic ring also sets the
+# cyclohexane bits, as it does in PubChem. Ring positions are para, meta, ortho.
+
+_SUBSTITUENTS = ("[#6]", "[#8]", "[#16]", "[#7]", "Cl", "Br")
+_RING_TEMPLATES = (
+    "{}c1ccc({})cc1", "{}c1cc({})ccc1", "{}c1c({})cccc1",
+    "{}[#6]1[#6][#6][#6]({})[#6][#6]1", "{}[#6]1[#6][#6]({})[#6][#6][#6]1", "{}[#6]1[#6]({})[#6][#6][#6][#6]1",
+    "{}[#6]1[#6][#6]({})[#6][#6]1", "{}[#6]1[#6]({})[#6][#6][#6]1",
+)
+COMPLEX_SMARTS = [
+    template.format(first, second)
+    for template in _RING_TEMPLATES
+    for i, first in enumerate(_SUBSTITUENTS)
+    for second in _SUBSTITUENTS[i:]
+]
+
+_TOKEN = re.compile(r"[A-Z][a-z]?|[-=#:~()]")
+_BOND_SMARTS = {"-": "-,:", "=": "=,:", "#": "#", ":": ":", "~": "~"}
+
+
+def spec_to_smarts(spec):
+    """Translate a pattern in PubChem specification notation (e.g. "C(~C)(~H)(:N)") to SMARTS."""
+    atoms, edges, branches = [], [], []
+    previous = bond = None
+    for token in _TOKEN.findall(spec):
+        if token == "(":
+            branches.append(previous)
+        elif token == ")":
+            previous = branches.pop()
+        elif token in _BOND_SMARTS:
+            bond = token
+        else:
+            atoms.append(token)
+            if previous is not None:
+                edges.append((previous, len(atoms) - 1, bond))
+            previous = len(atoms) - 1
+
+    # Hydrogens become H-count constraints on their heavy neighbour
+    hydrogens = [0] * len(atoms)
+    neighbours = {i: [] for i, symbol in enumerate(atoms) if symbol != "H"}
+    for a, b, bond in edges:
+        if atoms[a] == "H":
+            hydrogens[b] += 1
+        elif atoms[b] == "H":
+            hydrogens[a] += 1
+        else:
+            neighbours[a].append((b, bond))
+            neighbours[b].append((a, bond))
+
+    def emit(i, parent):
+        query = f"#{_PERIODIC_TABLE.GetAtomicNumber(atoms[i])}"
+        # At least n hydrogens: !H0&!H1&...&!H(n-1)
+        query += "".join(f"&!H{n}" for n in range(hydrogens[i]))
+        children = [_BOND_SMARTS[bond] + emit(j, i) for j, bond in neighbours[i] if j != parent]
+        return f"[{query}]" + "".join(f"({child})" for child in children[:-1]) + "".join(children[-1:])
+
+    return emit(next(iter(neighbours)), None)
+
+
+def _compile(smarts):
+    pattern = Chem.MolFromSmarts(smarts)
+    if pattern is None:
+        raise ValueError(f"Invalid PubChem fingerprint SMARTS '{smarts}'.")
+    return pattern, frozenset(atom.GetAtomicNum() for atom in pattern.GetAtoms())
+
+
+# (bit, compiled pattern, atomic numbers the pattern needs)
+_SUBSTRUCTURE_BITS = []
+for _base, _specs, _translate in (
+    (263, ATOM_PAIRS, True),
+    (327, NEAREST_NEIGHBOURS, True),
+    (416, DETAILED_NEIGHBOURHOODS, True),
+    (_SIMPLE_SMARTS_BASE, SIMPLE_SMARTS, True),
+    (713, COMPLEX_SMARTS, False),
+):
+    for _offset, _spec in enumerate(_specs):
+        _SUBSTRUCTURE_BITS.append((_base + _offset, *_compile(spec_to_smarts(_spec) if _translate else _spec)))
+
+
+def _rings(mol):
+    """
+    (atom indices, bond indices, counts as aromatic) of the rings of Section 2. Envelopes
+    only count as aromatic when both fusion atoms are carbon, which matches CACTVS on
+    bridgehead-nitrogen systems such as triazolopyrimidine.
+    """
+    ring_info = mol.GetRingInfo()
+    rings = []
+    for atom_ring, bond_ring in zip(ring_info.AtomRings(), ring_info.BondRings()):
+        rings.append((set(atom_ring), set(bond_ring)))
+    result = [
+        (atoms, bonds, all(mol.GetBondWithIdx(i).GetIsAromatic() for i in bonds)) for atoms, bonds in rings
+    ]
+    for i, (atoms_a, bonds_a) in enumerate(rings):
+        for atoms_b, bonds_b in rings[i + 1:]:
+            shared = bonds_a & bonds_b
+            if len(shared) != 1 or len(atoms_a) + len(atoms_b) - 2 > _MAX_ENVELOPE_SIZE:
+                continue
+            bonds = bonds_a ^ bonds_b
+            fusion = mol.GetBondWithIdx(next(iter(shared)))
+            aromatic = (
+                all(mol.GetBondWithIdx(j).GetIsAromatic() for j in bonds)
+                and fusion.GetBeginAtom().GetAtomicNum() == 6 and fusion.GetEndAtom().GetAtomicNum() == 6
+            )
+            result.append((atoms_a | atoms_b, bonds, aromatic))
+    return result
+
+
+def _ring_bits(mol):
+    on_bits = []
+    counts = {size: [0] * _RING_KINDS for size, _ in RING_THRESHOLDS}
+    aromatic = hetero_aromatic = 0
+    for atom_ring, bond_ring, is_aromatic in _rings(mol):
+        elements = {mol.GetAtomWithIdx(i).GetAtomicNum() for i in atom_ring}
+        bonds = [mol.GetBondWithIdx(i) for i in bond_ring]
+        carbon_only, has_nitrogen, has_hetero = elements == {6}, 7 in elements, elements != {6}
+
+        if is_aromatic:
+            aromatic += 1
+            hetero_aromatic += has_hetero
+
+        kinds = counts.get(len(atom_ring))
+        if kinds is None:
+            continue
+        saturated = all(
+            bond.GetIsAromatic() or bond.GetBondType() == Chem.BondType.SINGLE for bond in bonds
+        )
+        offset = 1 if saturated else 4
+        kinds[0] += 1
+        kinds[offset] += carbon_only
+        kinds[offset + 1] += has_nitrogen
+        kinds[offset + 2] += has_hetero
+
+    bit = _RING_BASE
+    for size, thresholds in RING_THRESHOLDS:
+        for threshold in thresholds:
+            on_bits.extend(bit + kind for kind, count in enumerate(counts[size]) if count >= threshold)
+            bit += _RING_KINDS
+
+    for n in range(1, 5):
+        if aromatic >= n:
+            on_bits.append(_AROMATIC_RING_BASE + 2 * (n - 1))
+        if hetero_aromatic >= n:
+            on_bits.append(_AROMATIC_RING_BASE + 2 * (n - 1) + 1)
+    return on_bits
+
+
+def pubchem_on_bits(mol):
+    """Return the sorted indices of the PubChem fingerprint bits set for an RDKit Mol."""
+    element_counts = {}
+    for atom in mol.GetAtoms():
+        element_counts[atom.GetAtomicNum()] = element_counts.get(atom.GetAtomicNum(), 0) + 1
+        element_counts[1] = element_counts.get(1, 0) + atom.GetTotalNumHs()
+    elements = set(element_counts)
+
+    on_bits = [bit for bit, number, threshold in _ELEMENT_BITS if element_counts.get(number, 0) >= threshold]
+    on_bits.extend(_ring_bits(mol))
+    on_bits.extend(
+        bit for bit, pattern, required in _SUBSTRUCTURE_BITS
+        if required <= elements and mol.HasSubstructMatch(pattern)
+    )
+    return sorted(on_bits)
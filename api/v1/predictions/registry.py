@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+import xgboost as xgb
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+from api.models import MLModel
+from .domain import load_applicability_domain
+from .result_cache import get_result_cache
+
+LOGGER = logging.getLogger(__name__)
+
+
+def sparse_safe_booster(booster):
+    """
+    Return a copy of an XGBoost booster whose missing-value branches follow 0.0.
+
+    In CSR input, absent entries are treated as missing rather than as 0.0. The models
+    were trained on dense fingerprints, so their default (missing) branches were never
+    exercised; pointing each one at the branch 0.0 takes (left when 0 < threshold)
+    leaves dense predictions unchanged and makes sparse predictions identical to them.
+    """
+    model = json.loads(booster.save_raw("json"))
+    gbm = model["learner"]["gradient_booster"]
+    trees = (gbm["model"] if "model" in gbm else gbm["gbtree"]["model"])["trees"]
+    for tree in trees:
+        tree["default_left"] = [
+            int(threshold > 0) if left != -1 else default
+            for left, threshold, default in zip(
+                tree["left_children"], tree["split_conditions"], tree["default_left"]
+            )
+        ]
+    patched = xgb.Booster()
+    patched.load_model(bytearray(json.dumps(model).encode()))
+    return patched
+
+
+def load_model_file(model_path):
+    """
+    Load a single model artifact.
+    Supported formats: .pkl (pickled estimator), .json (xgboost Booster).
+    """
+    if model_path.suffix == ".pkl":
+        with model_path.open("rb") as f:
+            return pickle.load(f)
+    if model_path.suffix == ".json":
+        model = xgb.Booster()
+        model.load_model(str(model_path))
+        return sparse_safe_booster(model)
+    raise ValueError(f"Unsupported model format '{model_path.suffix}'.")
+
+
+def artifact_checksum(model_path):
+    """SHA-256 of an artifact file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with model_path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Resolves MLModel rows to artifacts in ML_MODEL_DIR and keeps loaded models in memory.
+
+    Models are loaded on first use and kept in LRU order. Whenever the resident set
+    exceeds memory_budget bytes (artifact size on disk is used as the estimate), the
+    least recently used models are dropped; requests already holding a reference keep
+    using it until they finish. The most recently used model is never evicted, so a
+    single artifact larger than the budget can still be served.
+
+    Resident models are hot-reloaded without blocking requests: when a request asks for
+    a newer MLModel version than the one loaded, or the artifact file changed on disk
+    (checked at most every check_interval seconds, confirmed by checksum), the new
+    artifact is loaded in a background thread and swapped in atomically. Until then,
+    and for requests already in flight, the old model keeps serving.
+    """
+
+    def __init__(self, model_dir, memory_budget, check_interval):
+        self.model_dir = model_dir
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        # file_path -> {"model", "size", "version", "checksum", "mtime", "loaded_at", "last_used", "checked_at"},
+        # plus "domain" and "domain_size" once applicability_domain() has loaded them
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._reloading = set()
+
+    def resolve(self, method, descriptor, version=None):
+        """
+        Return the MLModel row for (method, descriptor, version).
+        Without a version, the most recently registered one is used.
+        Raises MLModel.DoesNotExist if nothing matches.
+        """
+        queryset = MLModel.objects.filter(method=method, descriptor=descriptor).exclude(file_path=None)
+        if version:
+            queryset = queryset.filter(version=version)
+        ml_model = queryset.order_by("-created_at").first()
+        if ml_model is None:
+            raise MLModel.DoesNotExist(
+                f"No model registered for method '{method}' and descriptor '{descriptor}'"
+                + (f" (version '{version}')." if version else ".")
+            )
+        return ml_model
+
+    def get(self, file_path, version=None):
+        """
+        Return the loaded model for an artifact, loading it on first use.
+        `version` is the MLModel version the caller resolved; if it differs from the
+        resident one, a background reload is triggered and the resident model is
+        returned meanwhile.
+        """
+        return self.acquire(file_path, version)[0]
+
+    def acquire(self, file_path, version=None):
+        """
+        Like get(), but return (model, checksum), where checksum is the SHA-256 of the
+        artifact that model was loaded from. Taken together, so results can be
+        attributed to the exact artifact even while a hot reload swaps it.
+        """
+        with self._lock:
+            entry = self._resident.get(file_path)
+            if entry is not None:
+                self._resident.move_to_end(file_path)
+                entry["last_used"] = time.time()
+                if self._is_stale(file_path, entry, version):
+                    self._reload_in_background(file_path, version)
+                return entry["model"], entry["checksum"]
+            load_lock = self._load_locks.setdefault(file_path, threading.Lock())
+
+        # Load outside the registry lock so other models stay available meanwhile;
+        # the per-artifact lock stops concurrent requests loading the same file twice.
+        with load_lock:
+            with self._lock:
+                entry = self._resident.get(file_path)
+                if entry is not None:
+                    return entry["model"], entry["checksum"]
+
+            model_path = self.model_dir / file_path
+            if not model_path.is_file():
+                raise ValueError(f"Model '{file_path}' not found or failed to load.")
+            entry = self._load_entry(model_path, version)
+
+            with self._lock:
+                self._resident[file_path] = entry
+                self._evict()
+            return entry["model"], entry["checksum"]
+
+    def applicability_domain(self, file_path, width):
+        """
+        Return the ApplicabilityDomain for a model artifact (see domain.py), or None if
+        no training fingerprints ship with it. It is loaded on first use and kept with
+        the resident model, counting towards the memory budget, so it is evicted and
+        reloaded along with the model; replace both files together.
+        """
+        with self._lock:
+            entry = self._resident.get(file_path)
+            if entry is not None and "domain" in entry:
+                return entry["domain"]
+
+        domain = load_applicability_domain(self.model_dir / file_path, width)
+        with self._lock:
+            if entry is not None and self._resident.get(file_path) is entry and "domain" not in entry:
+                entry["domain"] = domain
+                entry["domain_size"] = domain.nbytes if domain is not None else 0
+                self._evict()
+        return domain
+
+    def _load_entry(self, model_path, version, checksum=None):
+        stat = model_path.stat()
+        now = time.time()
+        return {
+            "model": load_model_file(model_path),
+            "size": stat.st_size,
+            "version": version,
+            "checksum": checksum or artifact_checksum(model_path),
+            "mtime": stat.st_mtime,
+            "loaded_at": now,
+            "last_used": now,
+            "checked_at": now,
+        }
+
+    def _is_stale(self, file_path, entry, version):
+        # Called with self._lock held.
+        if version is not None and version != entry["version"]:
+            return True
+        now = time.time()
+        if now - entry["checked_at"] < self.check_interval:
+            return False
+        entry["checked_at"] = now
+        try:
+            stat = (self.model_dir / file_path).stat()
+        except OSError:
+            return False  # Artifact removed or mid-replace; keep serving the loaded copy
+        return stat.st_mtime != entry["mtime"] or stat.st_size != entry["size"]
+
+    def _reload_in_background(self, file_path, version):
+        # Called with self._lock held.
+        if file_path in self._reloading:
+            return
+        self._reloading.add(file_path)
+        threading.Thread(
+            target=self._reload, args=(file_path, version),
+            name=f"model-reload-{file_path}", daemon=True,
+        ).start()
+
+    def _reload(self, file_path, version):
+        model_path = self.model_dir / file_path
+        try:
+            with self._lock:
+                current = self._resident.get(file_path)
+                version = version if version is not None else (current or {}).get("version")
+
+            checksum = artifact_checksum(model_path)
+            if current is not None and checksum == current["checksum"]:
+                # Same bytes (touched file or metadata-only version bump): no reload needed
+                stat = model_path.stat()
+                with self._lock:
+                    current.update(version=version, mtime=stat.st_mtime, size=stat.st_size)
+                return
+
+            entry = self._load_entry(model_path, version, checksum)
+            with self._lock:
+                # Atomic swap: in-flight requests keep their reference to the old model
+                if file_path in self._resident:
+                    entry["last_used"] = self._resident[file_path]["last_used"]
+                self._resident[file_path] = entry
+                self._evict()
+                superseded = current is not None and all(
+                    other["checksum"] != current["checksum"] for other in self._resident.values()
+                )
+            LOGGER.info(f"Reloaded model {file_path} (version {version}, sha256 {checksum[:12]})")
+        except Exception as e:
+            LOGGER.error(f"Failed to reload model {file_path}, keeping the loaded copy: {e}")
+            return
+        finally:
+            with self._lock:
+                self._reloading.discard(file_path)
+
+        if superseded:
+            self._discard_cached_predictions(current["checksum"])
+
+    @staticmethod
+    def _discard_cached_predictions(checksum):
+        # Runs in the reload thread, which has its own database connection to close
+        try:
+            deleted = get_result_cache().discard(checksum)
+            LOGGER.info(f"Deleted {deleted} cached predictions of superseded artifact {checksum[:12]}")
+        except Exception as e:
+            LOGGER.error(f"Failed to delete cached predictions of artifact {checksum[:12]}: {e}")
+        finally:
+            connections.close_all()
+
+    def _evict(self):
+        total = sum(self._footprint(entry) for entry in self._resident.values())
+        while total > self.memory_budget and len(self._resident) > 1:
+            _, entry = self._resident.popitem(last=False)
+            total -= self._footprint(entry)
+
+    @staticmethod
+    def _footprint(entry):
+        return entry["size"] + entry.get("domain_size", 0)
+
+    def resident(self):
+        """Describe the models currently held in memory, most recently used last."""
+        with self._lock:
+            return [
+                {
+                    "file_path": file_path,
+                    "version": entry["version"],
+                    "checksum": entry["checksum"],
+                    "size_bytes": entry["size"],
+                    "loaded_at": entry["loaded_at"],
+                    "last_used": entry["last_used"],
+                    "reloading": file_path in self._reloading,
+                }
+                for file_path, entry in self._resident.items()
+            ]
+
+
+_registry = None
+
+
+def get_model_registry():
+    """Return the process-wide ModelRegistry configured from settings."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(
+            settings.ML_MODEL_DIR,
+            settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+            settings.MODEL_RELOAD_CHECK_SECONDS,
+        )
+    return _registry
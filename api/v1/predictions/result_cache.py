@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from api.models import CachedPrediction
+
+# Keep IN lists and insert batches well below database parameter limits
+_QUERY_CHUNK = 1000
+
+
+class PredictionResultCache:
+    """
+    Two-tier cache of predicted values keyed by (artifact checksum, canonical SMILES).
+
+    Lookups hit an in-process LRU first and fall back to the CachedPrediction table,
+    which every worker shares; values found there are promoted into the LRU. Keys
+    carry the SHA-256 of the model artifact, so when an artifact changes (and the
+    registry reloads it) its old results simply stop matching.
+
+    The LRU is bounded by max_entries; the table is not, so rows of superseded
+    artifacts are deleted by discard() when the registry reloads a model, and by
+    prune() (the prune_prediction_cache command, meant to run periodically) for
+    artifacts replaced while no worker had them loaded.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, artifact_checksum, smiles_list):
+        """Return {smiles: ic50} for every SMILES with a cached prediction."""
+        found, missing = {}, []
+        with self._lock:
+            for smiles in smiles_list:
+                key = (artifact_checksum, smiles)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[smiles] = self._entries[key]
+                else:
+                    missing.append(smiles)
+
+        stored = {}
+        for start in range(0, len(missing), _QUERY_CHUNK):
+            stored.update(
+                CachedPrediction.objects
+                .filter(artifact_checksum=artifact_checksum, smiles__in=missing[start:start + _QUERY_CHUNK])
+                .values_list("smiles", "ic50")
+            )
+        self._remember(artifact_checksum, stored)
+        found.update(stored)
+        return found
+
+    def set_many(self, artifact_checksum, values):
+        """Store {smiles: ic50} in both tiers; rows another worker already wrote are kept."""
+        if not values:
+            return
+        self._remember(artifact_checksum, values)
+        CachedPrediction.objects.bulk_create(
+            [
+                CachedPrediction(artifact_checksum=artifact_checksum, smiles=smiles, ic50=ic50)
+                for smiles, ic50 in values.items()
+            ],
+            batch_size=_QUERY_CHUNK,
+            ignore_conflicts=True,
+        )
+
+    def discard(self, artifact_checksum):
+        """Drop every prediction of one artifact from both tiers; returns the rows deleted."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == artifact_checksum]:
+                del self._entries[key]
+        return CachedPrediction.objects.filter(artifact_checksum=artifact_checksum).delete()[0]
+
+    def prune(self, current_checksums):
+        """Drop the predictions of every artifact not in current_checksums; returns the rows deleted."""
+        current_checksums = set(current_checksums)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] not in current_checksums]:
+                del self._entries[key]
+        return CachedPrediction.objects.exclude(artifact_checksum__in=current_checksums).delete()[0]
+
+    def _remember(self, artifact_checksum, values):
+        with self._lock:
+            for smiles, ic50 in values.items():
+                self._entries[(artifact_checksum, smiles)] = ic50
+                self._entries.move_to_end((artifact_checksum, smiles))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+
+
+def get_result_cache():
+    """Return the process-wide PredictionResultCache configured from settings."""
+    global _cache
+    if _cache is None:
+        _cache = PredictionResultCache(settings.PREDICTION_CACHE_MAX_ENTRIES)
+    return _cache
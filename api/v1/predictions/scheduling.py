@@ -0,0 +1,168 @@
+import fcntl
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+FAST_LANE = "fast"
+BULK_LANE = "bulk"
+
+
+class LaneSaturated(Exception):
+    """
+    Raised when a request cannot be admitted. Carries the HTTP status to answer with
+    (429 for a per-user limit, 503 when the server is saturated) and a Retry-After hint.
+    """
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    A fixed number of execution slots shared by every worker process on the host.
+
+    Each slot is a lock file under PREDICTION_LANE_DIR held with flock, so a slot held
+    by a worker that dies is released by the kernel. A request waits up to
+    wait_seconds for a free slot and is rejected after that; with per_user set, one
+    user can hold at most that many slots at a time. Admission counts and wait times
+    are tracked per process.
+    """
+
+    def __init__(self, name, slots, wait_seconds=0.0, per_user=None):
+        self.name = name
+        self.slots = slots
+        self.wait_seconds = wait_seconds
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.service_avg = None  # Moving average of how long a request holds a slot, in seconds
+
+    def _try_lock(self, tag, slots):
+        directory = settings.PREDICTION_LANE_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(slots):
+            fd = os.open(directory / f"{tag}-{i}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    def _release(fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from the observed slot hold time."""
+        estimate = self.service_avg if self.service_avg is not None else settings.PREDICTION_RETRY_AFTER_SECONDS
+        return max(1, math.ceil(estimate))
+
+    @contextmanager
+    def admit(self, user_id=None):
+        """Hold one slot for the duration of the block; raises LaneSaturated if none frees up in time."""
+        start = time.monotonic()
+        user_fd = None
+        if self.per_user is not None and user_id is not None:
+            user_fd = self._try_lock(f"{self.name}-user{user_id}", self.per_user)
+            if user_fd is None:
+                with self._lock:
+                    self.rejected += 1
+                raise LaneSaturated(
+                    f"You already have {self.per_user} {self.name} prediction(s) running; wait for them to finish.",
+                    429, self.retry_after(),
+                )
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            fd = self._try_lock(self.name, self.slots)
+            while fd is None and time.monotonic() - start < self.wait_seconds:
+                time.sleep(0.01)
+                fd = self._try_lock(self.name, self.slots)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if fd is None:
+            self._release(user_fd)
+            with self._lock:
+                self.rejected += 1
+            raise LaneSaturated(f"The {self.name} prediction lane is full; retry shortly.", 503, self.retry_after())
+
+        admitted_at = time.monotonic()
+        waited = admitted_at - start
+        with self._lock:
+            self.admitted += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        try:
+            yield
+        finally:
+            self._release(fd)
+            self._release(user_fd)
+            held = time.monotonic() - admitted_at
+            with self._lock:
+                self.service_avg = held if self.service_avg is None else 0.8 * self.service_avg + 0.2 * held
+
+    def in_use(self):
+        """Slots currently held by any process (probed without waiting)."""
+        busy = 0
+        for i in range(self.slots):
+            fd = os.open(settings.PREDICTION_LANE_DIR / f"{self.name}-{i}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                busy += 1
+            finally:
+                os.close(fd)
+        return busy
+
+    def stats(self):
+        settings.PREDICTION_LANE_DIR.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "in_use": self.in_use(),
+                "per_user": self.per_user,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_avg_ms": round(1000 * self.wait_total / self.admitted, 2) if self.admitted else None,
+                "wait_max_ms": round(1000 * self.wait_max, 2),
+                "service_avg_ms": round(1000 * self.service_avg, 2) if self.service_avg is not None else None,
+            }
+
+
+_lanes = None
+
+
+def get_lanes():
+    """Return the process-wide {name: Lane} for synchronous predictions, configured from settings."""
+    global _lanes
+    if _lanes is None:
+        _lanes = {
+            # Reserved for small interactive requests; bulk work never takes these slots
+            FAST_LANE: Lane(FAST_LANE, settings.PREDICTION_FAST_LANE_SLOTS,
+                            wait_seconds=settings.PREDICTION_FAST_LANE_WAIT_SECONDS),
+            BULK_LANE: Lane(BULK_LANE, settings.PREDICTION_BULK_LANE_SLOTS,
+                            per_user=settings.PREDICTION_BULK_LANE_PER_USER),
+        }
+    return _lanes
+
+
+def lane_for(n_smiles):
+    """Return the Lane a synchronous request for n_smiles SMILES runs in."""
+    lanes = get_lanes()
+    return lanes[FAST_LANE] if n_smiles <= settings.PREDICTION_FAST_LANE_MAX_SMILES else lanes[BULK_LANE]
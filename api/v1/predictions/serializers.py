@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from api.models import Compound, Prediction, PredictionCompound, MLModel
+from .clustering import CLUSTER_METHODS
 class MLModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = MLModel
@@ -15,7 +16,7 @@ class PredictionCompoundSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = PredictionCompound
-        fields = ['id', 'ic50', 'lelp', 'compound']
+        fields = ['id', 'ic50', 'lelp', 'domain_max_similarity', 'domain_mean_similarity', 'compound']
 
 class PredictionSerializer(serializers.ModelSerializer):
     prediction_compounds = PredictionCompoundSerializer(many=True, read_only=True)
@@ -30,27 +31,76 @@ class PredictionSerializer(serializers.ModelSerializer):
             "status",
             "input_source_type",
             "created_at",
+            "completed_at",
+            "progress_total",
+            "progress_done",
+            "error",
             "prediction_compounds"  # ⬅️ Put this at the bottom  
         ]
 
+class PredictionSummarySerializer(serializers.ModelSerializer):
+    """
+    A prediction without its results, for listings. compound_count and best_ic50 (the
+    lowest predicted IC50) are annotated by PredictionViewSet.get_queryset.
+    """
+    model_name = serializers.CharField(source='ml_model.name', read_only=True, default=None)
+    compound_count = serializers.IntegerField(read_only=True)
+    best_ic50 = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Prediction
+        fields = [
+            "id",
+            "user",
+            "ml_model",
+            "model_name",
+            "status",
+            "input_source_type",
+            "created_at",
+            "completed_at",
+            "progress_total",
+            "progress_done",
+            "error",
+            "compound_count",
+            "best_ic50",
+        ]
+
 class PredictionInputSerializer(serializers.Serializer):
     smiles = serializers.CharField(required=False, help_text="Comma-separated SMILES strings")
-    file = serializers.FileField(required=False, help_text="CSV file containing SMILES in the first column")
-    model_method = serializers.CharField(required=True, help_text="Model method used for prediction")
-    model_descriptor = serializers.CharField(required=True, help_text="Model descriptor used for prediction")
+    file = serializers.FileField(required=False, help_text="CSV file (optionally gzip'd, .csv.gz) containing SMILES in the first column")
+    model_method = serializers.CharField(required=False, help_text="Model method used for prediction (required unless 'models' is given)")
+    model_descriptor = serializers.CharField(required=False, help_text="Model descriptor used for prediction (required unless 'models' is given)")
+    model_version = serializers.CharField(required=False, help_text="Model version; defaults to the latest registered one")
+    models = serializers.ListField(
+        child=serializers.CharField(), required=False,
+        help_text="Score with several models in one pass, e.g. ['xgb:ecfp', 'svr:ecfp:2']"
+    )
+    standardize = serializers.BooleanField(required=False, default=False, help_text="Strip salts/solvents and standardize molecules before canonicalization")
+    run_async = serializers.BooleanField(required=False, default=False, help_text="Queue the prediction as a background job and return 202 at once (always done for large inputs)")
 
     def validate(self, data):
         if not data.get('smiles') and not data.get('file'):
             raise serializers.ValidationError("Either 'smiles' or 'file' must be provided.")
         
         if data.get('file'):
-            if not data['file'].name.endswith(('.csv', '.json')):
+            if not data['file'].name.endswith(('.csv', '.csv.gz', '.json')):
                 raise serializers.ValidationError("File must be a CSV or JSON.")
         
-        if not data.get('model_descriptor'):
-            raise serializers.ValidationError("Model descriptor is required.")
-        
-        if not data.get('model_method'):
-            raise serializers.ValidationError("Model method is required.")
+        if not data.get('models'):
+            if not data.get('model_descriptor'):
+                raise serializers.ValidationError("Model descriptor is required.")
+
+            if not data.get('model_method'):
+                raise serializers.ValidationError("Model method is required.")
         
-        return data
\ No newline at end of file
+        return data
+
+class ClusterQuerySerializer(serializers.Serializer):
+    method = serializers.ChoiceField(
+        choices=CLUSTER_METHODS, required=False, default="butina",
+        help_text="'butina' (Tanimoto similarity of ECFP fingerprints) or 'scaffold' (Bemis-Murcko scaffold)"
+    )
+    cutoff = serializers.FloatField(
+        required=False, default=0.6, min_value=0.1, max_value=1.0,
+        help_text="Butina only: compounds at least this Tanimoto-similar are neighbors (rounded to 2 decimals)"
+    )
@@ -0,0 +1,160 @@
+import json
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from api.models import Prediction
+from .normalization import NormalizedSmiles
+from .persistence import get_or_create_compounds, create_prediction_compounds
+from .properties import compute_lelp
+from .domain import domain_payload
+from .utils import predict_batch_multi
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Lets clients opt into streamed results with `Accept: application/x-ndjson` or
+    `?format=ndjson`. Streamed results bypass it; it only renders ordinary responses
+    (errors, queued jobs) as a single JSON line.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return _line(data)
+
+
+def _line(data):
+    return (json.dumps(data, cls=DjangoJSONEncoder) + "\n").encode()
+
+
+class _ClosingIterator:
+    """Iterates lines and calls on_close when the response is closed, even if it was never iterated."""
+
+    def __init__(self, lines, on_close):
+        self._lines = lines
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def close(self):
+        try:
+            self._lines.close()
+        finally:
+            self._on_close()
+
+
+def ndjson_response(lines, on_close):
+    return StreamingHttpResponse(_ClosingIterator(lines, on_close), content_type=NDJSON_MEDIA_TYPE)
+
+
+def stream_predictions(user, ml_models, smiles_list, standardize, input_source_type,
+                       chunk_size, compound_payload, serialize_model):
+    """
+    Score the SMILES chunk by chunk and yield the results as NDJSON lines, so the first
+    ones reach the client as soon as their chunk is predicted and committed.
+
+    The first line is {"type": "header", "predictions": [...]} with one prediction id per
+    model; then one {"type": "result", "prediction_id", "smiles", "ic50", "lelp",
+    "applicability_domain", "compound_id", "compound"} line per input SMILES and model,
+    in input order, where the full compound is only sent on the first line that refers
+    to it; and finally a {"type": "summary"} line (or {"type": "error"} if scoring failed part-way, in which
+    case the predictions are marked FAILED).
+    """
+    predictions = [
+        Prediction.objects.create(
+            user=user, ml_model=ml_model, status=Prediction.Status.RUNNING, input_source_type=input_source_type
+        )
+        for ml_model in ml_models
+    ]
+    model_specs = [(m.file_path, m.method, m.descriptor, m.version) for m in ml_models]
+    scored = {}  # canonical SMILES -> (compound id, [(ic50, lelp, domain) per model]); no payloads are kept
+    cache_stats = [{"hits": 0, "misses": 0} for _ in ml_models]
+    rows = iter(smiles_list)
+    try:
+        yield _line({
+            "type": "header",
+            "predictions": [
+                {"prediction_id": prediction.id, "ml_model": serialize_model(ml_model)}
+                for prediction, ml_model in zip(predictions, ml_models)
+            ],
+        })
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            normalized = NormalizedSmiles(chunk, standardize=standardize)
+            fresh = [smiles for smiles in normalized.unique if smiles not in scored]
+            new_payloads = {}
+            if fresh:
+                properties, domains = {}, []
+                all_predictions, chunk_stats = predict_batch_multi(
+                    fresh, model_specs, properties=properties, domains=domains
+                )
+                for totals, stats in zip(cache_stats, chunk_stats):
+                    totals["hits"] += stats["hits"]
+                    totals["misses"] += stats["misses"]
+                with transaction.atomic():
+                    compounds = get_or_create_compounds(fresh, properties)
+                    # (ic50, lelp, domain) per model, None where featurization failed; the
+                    # same values are stored and streamed
+                    results = {
+                        smiles: [
+                            None if isinstance(v[i], str) else (v[i], compute_lelp(v[i], compounds[smiles]), domain.get(smiles))
+                            for v, domain in zip(all_predictions, domains)
+                        ]
+                        for i, smiles in enumerate(fresh)
+                    }
+                    for m, prediction in enumerate(predictions):
+                        create_prediction_compounds(prediction, [
+                            (compounds[smiles], *values[m]) for smiles, values in results.items() if values[m] is not None
+                        ])
+                for smiles, values in results.items():
+                    scored[smiles] = (compounds[smiles].id, values)
+                    new_payloads[smiles] = compound_payload(compounds[smiles])
+
+            for smiles, canonical, entry in zip(normalized.inputs, normalized.canonical, normalized.fan_out(scored)):
+                compound_id, values = entry or (None, [None] * len(predictions))
+                for prediction, value in zip(predictions, values):
+                    if value is None:
+                        yield _line({
+                            "type": "result", "prediction_id": prediction.id, "smiles": smiles,
+                            "ic50": None, "lelp": None, "applicability_domain": None,
+                            "error": "Invalid SMILES input", "compound": None,
+                        })
+                        continue
+                    yield _line({
+                        "type": "result", "prediction_id": prediction.id, "smiles": smiles,
+                        "ic50": value[0], "lelp": value[1], "applicability_domain": domain_payload(value[2]),
+                        "compound_id": compound_id,
+                        "compound": new_payloads.pop(canonical, None),
+                    })
+    except GeneratorExit:
+        # Client went away; what was committed so far stays with the prediction
+        Prediction.objects.filter(pk__in=[p.pk for p in predictions]).update(
+            status=Prediction.Status.FAILED, completed_at=timezone.now(), error="Stream closed before completion."
+        )
+        raise
+    except Exception as e:
+        Prediction.objects.filter(pk__in=[p.pk for p in predictions]).update(
+            status=Prediction.Status.FAILED, completed_at=timezone.now(), error=str(e)
+        )
+        yield _line({"type": "error", "error": str(e)})
+        return
+
+    Prediction.objects.filter(pk__in=[p.pk for p in predictions]).update(
+        status=Prediction.Status.COMPLETED, completed_at=timezone.now()
+    )
+    yield _line({
+        "type": "summary",
+        "message": f"Prediction complete and saved for {len(scored)} unique compounds from {len(smiles_list)} SMILES.",
+        "cache": cache_stats,
+    })
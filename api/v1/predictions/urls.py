@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PredictionViewSet, PredictIC50View
+from .views import PredictionViewSet, PredictIC50View, ResidentModelsView, SchedulerStatusView
 
 router = DefaultRouter()
 router.register(r'', PredictionViewSet, basename='predictions')
@@ -8,5 +8,7 @@ router.register(r'', PredictionViewSet, basename='predictions')
 
 urlpatterns = [
   path('predict/', PredictIC50View.as_view(), name='predict'),
+  path('models/', ResidentModelsView.as_view(), name='resident-models'),
+  path('scheduler/', SchedulerStatusView.as_view(), name='scheduler-status'),
   path('', include(router.urls)),
 ]
\ No newline at end of file
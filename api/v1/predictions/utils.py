@@ -1,134 +1,252 @@
+import threading
 import numpy as np
-import pickle
 import xgboost as xgb
-from rdkit import Chem, DataStructs
-from rdkit.Chem import AllChem
-# import deepchem as dc
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from .registry import get_model_registry
+from .fingerprint_cache import get_fingerprint_cache
+from .result_cache import get_result_cache
+from .batching import get_batcher
+from .featurization_pool import get_featurization_pool
+from .featurizers import MACCS_KEY, PROPERTIES_KEY, PUBCHEM_KEY, ecfp_key, get_descriptor, unpack_dense, packed_to_csr
 
 # --- Configuration ---
-MODEL_DIR = settings.ML_MODEL_DIR
-XGB_FEATURE_NAMES = [f"bit{i}" for i in range(2048)]
-# --- Pre-loaded Models & Featurizers ---
-MODELS = {}
-# PUBCHEM_FEATURIZER = dc.feat.PubChemFingerprint()
-
-def load_all_models():
-    """
-    Loads all supported ML model files from MODEL_DIR into memory.
-    Supported formats: .pkl (pickle), .json (xgboost Booster).
-    """
-    MODEL_DIR.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
-
-    for model_path in MODEL_DIR.iterdir():
-        if not model_path.is_file():
-            continue  # skip directories, etc.
-
-        try:
-            if model_path.suffix == ".pkl":
-                with model_path.open("rb") as f:
-                    model = pickle.load(f)
-            elif model_path.suffix == ".json":
-                model = xgb.Booster()
-                model.load_model(str(model_path))
-            else:
-                continue
-
-            # Use model name without extension as key
-            model_name = model_path.name
-            MODELS[model_name] = model
-
-        except Exception as e:
-            print(f"Failed to load model {model_path.name}: {e}")
-
+# Methods served by pickled scikit-learn style estimators
+ESTIMATOR_METHODS = {"rf", "svr", "lgbm"}
 
 # --- Featurization Functions (with Caching) ---
 
-# A map to simplify calling the correct featurizer
-FEATURIZER_MAP = {
-    "ecfp": lambda smiles: smiles_to_ecfp(smiles),
-    # "maccs": lambda smiles: smiles_to_maccs(smiles),
-    # "pubchemfp": lambda smiles: smiles_to_pubchemfp(smiles)
+# Featurizer key per model descriptor. The key also namespaces the fingerprint cache,
+# so it must change whenever featurizer parameters do.
+DESCRIPTOR_KEYS = {
+    "ecfp": ecfp_key(),
+    "maccs": MACCS_KEY,
 }
+if settings.PUBCHEM_FINGERPRINT_ENABLED:
+    # The API docs call this descriptor "pubchem", the model files "pubchemfp"
+    DESCRIPTOR_KEYS.update(pubchem=PUBCHEM_KEY, pubchemfp=PUBCHEM_KEY)
+
+def descriptor_key(model_descriptor):
+    """Featurizer key for a model descriptor; raises ValueError if it is not supported."""
+    if model_descriptor not in DESCRIPTOR_KEYS:
+        raise ValueError("Unsupported model descriptor.")
+    return DESCRIPTOR_KEYS[model_descriptor]
+
+def featurize_blocks(smiles_list, keys):
+    """
+    Featurize a batch of canonical SMILES for several descriptors at once.
+
+    Blocks come from the shared on-disk cache where possible. Every SMILES missing from
+    the cache for any of the keys is parsed once by RDKit (through the featurization
+    process pool for large batches) and all requested descriptors are computed from
+    that Mol; the results are written back for other workers and later requests.
+    Descriptors that are not cached (e.g. "properties") ride along with that parse:
+    they are computed for the SMILES parsed anyway and left empty for the rest, unless
+    no cached descriptor was requested.
+    Returns (blocks, valid) as featurize_smiles does, aligned with smiles_list.
+    """
+    unique = list(dict.fromkeys(smiles_list))
+    blocks = {key: get_descriptor(key).empty(len(unique)) for key in keys}
+    valid = np.zeros(len(unique), dtype=bool)
+    cache = get_fingerprint_cache()
+
+    cached_keys = [key for key in keys if get_descriptor(key).cacheable]
+    missing = set() if cached_keys else set(range(len(unique)))
+    for key in cached_keys:
+        cached = cache.get_many(unique, key)
+        hit_rows = [i for i, s in enumerate(unique) if s in cached]
+        if hit_rows:
+            block = blocks[key]
+            hit_block = np.frombuffer(b"".join(cached[unique[i]] for i in hit_rows), dtype=block.dtype)
+            block[hit_rows] = hit_block.reshape(len(hit_rows), -1)
+            valid[hit_rows] = True
+        missing.update(i for i, s in enumerate(unique) if s not in cached)
+
+    if missing:
+        miss_rows = sorted(missing)
+        misses = [unique[i] for i in miss_rows]
+        computed, ok = get_featurization_pool().featurize(misses, keys)
+        valid[miss_rows] = ok
+        for key in keys:
+            blocks[key][miss_rows] = computed[key]
+            if key not in cached_keys:
+                continue
+            cache.set_many(
+                {s: row.tobytes() for s, row, good in zip(misses, computed[key], ok) if good},
+                key, get_descriptor(key).width
+            )
+
+    if len(unique) != len(smiles_list):
+        # Duplicates in the input: expand back to one row per input SMILES
+        position = {s: i for i, s in enumerate(unique)}
+        index = np.fromiter((position[s] for s in smiles_list), dtype=np.intp, count=len(smiles_list))
+        return {key: block[index] for key, block in blocks.items()}, valid[index]
+    return blocks, valid
+
+class DescriptorFeatures:
+    """
+    One descriptor's features for a batch, featurized once and shared by every model
+    that uses the descriptor. The CSR and dense views are derived on first use.
+    """
 
-@lru_cache(maxsize=2048) # Increased cache size for batch operations
-def smiles_to_ecfp(smiles, radius=3, n_bits=2048):
-    """Convert a SMILES string to an ECFP6 fingerprint vector with caching."""
-    mol = Chem.MolFromSmiles(smiles)
-    if mol is None: return None
-    fp = AllChem.GetMorganFingerprintAsBitVect(mol, radius, nBits=n_bits)
-    array = np.zeros((n_bits,), dtype=np.float32) # Return a 1D array
-    DataStructs.ConvertToNumpyArray(fp, array)
-    return array
-
-# @lru_cache(maxsize=2048)
-# def smiles_to_maccs(smiles):
-#     """Convert SMILES to MACCS keys fingerprint with caching."""
-#     mol = Chem.MolFromSmiles(smiles)
-#     if not mol: return None
-#     fp = MACCSkeys.GenMACCSKeys(mol)
-#     array = np.zeros((166,), dtype=np.float32) # MACCS has 166 bits (1-166)
-#     # The first bit (index 0) is unused, so we convert the 167-bit vector
-#     DataStructs.ConvertToNumpyArray(fp, array)
-#     return array
-
-# @lru_cache(maxsize=2048)
-# def smiles_to_pubchemfp(smiles):
-#     """Convert SMILES to PubChem fingerprint with caching."""
-    fingerprints = PUBCHEM_FEATURIZER.featurize(smiles)
-#     # Check if featurization was successful before accessing the array
-#     return fingerprints[0] if fingerprints.size > 0 else None
+    def __init__(self, key, block, valid):
+        self.descriptor = get_descriptor(key)
+        self.block = block
+        self.valid = valid
+        self._csr = None
+        self._dense = None
+        self._lock = threading.Lock()
+
+    def csr(self):
+        with self._lock:
+            if self._csr is None:
+                self._csr = packed_to_csr(self.block, self.descriptor.width)
+            return self._csr
+
+    def dense(self):
+        with self._lock:
+            if self._dense is None:
+                self._dense = unpack_dense(self.block, self.descriptor.width)
+            return self._dense
 
 # --- Prediction Logic ---
 
-def predict_batch_ic50(smiles_list, model_name, model_method, model_descriptor):
+def predict_batch_ic50(smiles_list, model_name, model_method, model_descriptor, inference_mode=None, model_version=None, domain=None):
     """
-    Predict IC50 for a batch of SMILES using a pre-loaded model.
+    Predict IC50 for a batch of SMILES with the model artifact `model_name`, which the
+    model registry loads on first use (and hot-reloads when model_version changes).
+    smiles_list is expected to hold canonical SMILES (see normalization.NormalizedSmiles),
+    since the fingerprint and result caches are keyed on the canonical form.
+
+    For XGBoost, inference_mode is "sparse" (CSR fingerprints through
+    Booster.inplace_predict) or "dense" (float32 matrix through a DMatrix); it defaults
+    to PREDICTION_INFERENCE_MODE and both produce identical predictions. Pickled
+    estimators (rf/svr/lgbm) always receive the dense matrix.
+
+    If domain is a dict, it is filled with {smiles: (max, mean)} Tanimoto similarity of
+    each valid SMILES to the model's training set (see predict_batch_multi).
     """
-    model = MODELS.get(model_name)
-    if model is None:
-        raise ValueError(f"Model '{model_name}' not found or failed to load.")
-
-    # Step 1: Featurize all SMILES in a batch
-    featurizer = FEATURIZER_MAP.get(model_descriptor)
-    if featurizer is None:
-        raise ValueError("Unsupported model descriptor.")
-    
-    # Use a ThreadPoolExecutor to process featurization in parallel
-    with ThreadPoolExecutor() as executor:
-        # map() maintains the order of the input smiles_list
-        results = list(executor.map(featurizer, smiles_list))
-
-    fingerprints, valid_smiles, errors = [], [], {}
-    for i, fp in enumerate(results):
-        smiles = smiles_list[i]
-        if fp is not None:
-            fingerprints.append(fp)
-            valid_smiles.append(smiles)
-        else:
-            errors[smiles] = "Invalid SMILES input"
-    
-    if not fingerprints:
-        return errors # Return only errors if no valid SMILES were found
-
-    # Step 2: Stack fingerprints into a single NumPy array for batch prediction
-    fp_array = np.vstack(fingerprints)
-
-    # Step 3: Normalize and Predict on the entire batch
-    # if model_method == "rf":
-    #     predictions = model.predict(fp_array)
-    if model_method == "xgb":
-        dmatrix = xgb.DMatrix(fp_array, feature_names=XGB_FEATURE_NAMES)
-        predictions = model.predict(dmatrix)
+    model_spec = (model_name, model_method, model_descriptor, model_version)
+    domains = [] if domain is not None else None
+    results, _ = predict_batch_multi(smiles_list, [model_spec], inference_mode, domains=domains)
+    if domain is not None:
+        domain.update(domains[0])
+    return results[0]
+
+def predict_batch_multi(smiles_list, model_specs, inference_mode=None, properties=None, domains=None):
+    """
+    Predict IC50 for the same batch of SMILES with several models in one pass.
+
+    model_specs is a list of (model_name, model_method, model_descriptor, model_version)
+    tuples. Results already computed by the same model artifact come from the result
+    cache; the remaining SMILES are parsed once for all descriptors, each descriptor's
+    matrices are shared by all models using it, and the models run concurrently.
+
+    Returns (results, cache_stats): one result list per model spec, each aligned with
+    smiles_list (see predict_batch_ic50), and one {"hits", "misses"} dict per model
+    spec counting distinct SMILES served from / missing from the result cache.
+
+    If properties is a dict, it is filled with {smiles: values of PROPERTY_COLUMNS}
+    for the SMILES this call parses with RDKit, computed from the same Mol as the
+    fingerprints, so new compounds can be stored without parsing them again.
+
+    If domains is a list, one {smiles: (max, mean)} dict per model spec is appended to
+    it: the highest and average Tanimoto similarity of each valid SMILES to the model's
+    training-set fingerprints, an applicability-domain signal computed for the whole
+    batch at once (see domain.ApplicabilityDomain). Models shipped without training
+    fingerprints get an empty dict. Result-cache hits are scored too, from the
+    fingerprint cache.
+    """
+    for _, model_method, _, _ in model_specs:
+        if model_method != "xgb" and model_method not in ESTIMATOR_METHODS:
+            raise ValueError("Unsupported model method")
+
+    inference_mode = inference_mode or settings.PREDICTION_INFERENCE_MODE
+    if inference_mode not in ("sparse", "dense"):
+        raise ValueError(f"Unsupported inference mode '{inference_mode}'.")
+
+    keys = {descriptor: descriptor_key(descriptor) for _, _, descriptor, _ in model_specs}
+    registry = get_model_registry()
+    loaded = [registry.acquire(name, version) for name, _, _, version in model_specs]
+
+    # Reuse results the same artifacts already produced; only the rest is featurized
+    result_cache = get_result_cache()
+    unique = list(dict.fromkeys(smiles_list))
+    cached = [result_cache.get_many(checksum, unique) for _, checksum in loaded]
+    pending = [[s for s in unique if s not in hits] for hits in cached]
+    training = [
+        registry.applicability_domain(name, get_descriptor(keys[descriptor]).width) if domains is not None else None
+        for name, _, descriptor, _ in model_specs
+    ]
+
+    # Featurize every pending SMILES once for all descriptors (only cache misses reach RDKit);
+    # scoring the applicability domain needs the fingerprints of the cached ones as well
+    if any(domain is not None for domain in training):
+        to_featurize = unique
     else:
-        raise ValueError("Unsupported model method")
-
-    # Step 4: Combine results with original SMILES and any errors
-    results_map = {smiles: float(pred) for smiles, pred in zip(valid_smiles, predictions)}
-    results_map.update(errors)
-    final_results = [results_map.get(s, None) for s in smiles_list]  # Ensure order matches input
+        to_featurize = list(dict.fromkeys(s for smiles in pending for s in smiles))
+    row_of = {s: i for i, s in enumerate(to_featurize)}
+    features = {}
+    if to_featurize:
+        feature_keys = list(dict.fromkeys(keys.values()))
+        if properties is not None:
+            feature_keys.append(PROPERTIES_KEY)
+        blocks, valid = featurize_blocks(to_featurize, feature_keys)
+        features = {
+            descriptor: DescriptorFeatures(key, blocks[key], valid)
+            for descriptor, key in keys.items()
+        }
+        if properties is not None:
+            properties.update((s, row) for s, row in zip(to_featurize, blocks[PROPERTIES_KEY]) if row is not None)
+
+    def run(model, checksum, model_spec, smiles):
+        _, model_method, model_descriptor, _ = model_spec
+        if not smiles:
+            return {}
+        shared = features[model_descriptor]
+        # Models with cache hits only predict the rows they are missing
+        rows = None if len(smiles) == len(to_featurize) else [row_of[s] for s in smiles]
+        valid = shared.valid if rows is None else shared.valid[rows]
+        if not valid.any():
+            return {}
+
+        # Invalid rows are all-zero; their predictions are dropped below.
+        # Concurrent requests to the same model are coalesced into one predict call.
+        if model_method in ESTIMATOR_METHODS:
+            input_kind, matrix, predict_fn = "estimator", shared.dense(), model.predict
+        elif inference_mode == "sparse":
+            input_kind, matrix, predict_fn = "sparse", shared.csr(), model.inplace_predict
+        else:
+            input_kind, matrix = "dense", shared.dense()
+            predict_fn = lambda dense: model.predict(xgb.DMatrix(dense, feature_names=model.feature_names))
+        predictions = get_batcher(checksum, input_kind).predict(matrix if rows is None else matrix[rows], predict_fn)
+        return {s: float(pred) for s, pred, ok in zip(smiles, predictions, valid) if ok}
 
-    # Return results in the same order as the input
-    return final_results
\ No newline at end of file
+    if len(model_specs) == 1:
+        computed = [run(*loaded[0], model_specs[0], pending[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(model_specs)) as executor:
+            computed = list(executor.map(
+                run, [model for model, _ in loaded], [checksum for _, checksum in loaded], model_specs, pending
+            ))
+
+    results, cache_stats = [], []
+    for (_, checksum), hits, fresh, misses in zip(loaded, cached, computed, pending):
+        result_cache.set_many(checksum, fresh)
+        values = {**hits, **fresh}
+        # Return results in the same order as the input
+        results.append([values.get(s, "Invalid SMILES input") for s in smiles_list])
+        cache_stats.append({"hits": len(hits), "misses": len(misses)})
+
+    if domains is not None:
+        for (_, _, descriptor, _), domain in zip(model_specs, training):
+            shared = features.get(descriptor)
+            if domain is None or shared is None or not shared.valid.any():
+                domains.append({})
+                continue
+            rows = np.flatnonzero(shared.valid)
+            best, mean = domain.score(shared.csr()[rows])
+            domains.append({
+                to_featurize[row]: (float(b), float(m)) for row, b, m in zip(rows, best, mean)
+            })
+    return results, cache_stats
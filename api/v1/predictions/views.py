@@ -1,26 +1,49 @@
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.views import APIView
-import csv
-import io
-from django.shortcuts import get_object_or_404
+from rest_framework.settings import api_settings
+from rest_framework.parsers import FormParser, MultiPartParser
+from contextlib import ExitStack
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-import pubchempy as pcp
-import requests
 
 from rest_framework.response import Response
-from .serializers import PredictionSerializer, PredictionInputSerializer
+from .serializers import (
+    PredictionSerializer, PredictionSummarySerializer, PredictionInputSerializer, MLModelSerializer, ClusterQuerySerializer,
+)
 from rest_framework.permissions import IsAuthenticated
-from api.models import Prediction, Compound, PredictionCompound, MLModel
-from .utils import predict_batch_ic50
+from rest_framework.exceptions import PermissionDenied
+from api.models import Prediction, PredictionCompound, MLModel
+from .utils import predict_batch_multi
+from .persistence import get_or_create_compounds, create_prediction_compounds
+from .domain import domain_payload
+from .clustering import TooManyNeighbors, cluster_prediction
+from .pagination import PredictionCursorPagination
+from .properties import compute_lelp
+from .jobs import enqueue_predictions, queue_stats
+from .ingestion import CSV_EXTENSIONS, iter_csv_smiles, spool_upload
+from .streaming import NDJSONRenderer, ndjson_response, stream_predictions
+from .parsers import SmilesSpool, StreamingJSONParser
+from .scheduling import LaneSaturated, get_lanes, lane_for
+from .normalization import NormalizedSmiles
+from .registry import get_model_registry
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiResponse, OpenApiTypes, OpenApiExample
 
 @extend_schema_view(
     list=extend_schema(
-        description="Get a list of all predictions (admin) or only your own (user).",
+        description=(
+            "Get a list of all predictions (admin) or only your own (user), newest first, without their "
+            "results: each has its model name, compound count and best (lowest) IC50. Cursor-paginated: "
+            "follow `next`/`previous`; `page_size` sets the page length."
+        ),
         responses={
             200: OpenApiResponse(
-                description="List of predictions.",
-                response=PredictionSerializer(many=True)
+                description="Page of predictions.",
+                response=PredictionSummarySerializer(many=True)
             ),
             403: OpenApiResponse(description="Forbidden: User not authenticated.")
         }
@@ -52,20 +75,144 @@ class PredictionViewSet(viewsets.ModelViewSet):
     """
     serializer_class = PredictionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PredictionCursorPagination
     http_method_names = ['get', 'delete', 'head', 'options']
 
     def get_queryset(self):
-        if self.request.user.role == 'admin':
-            return Prediction.objects.all()
-        return Prediction.objects.filter(user=self.request.user)
+        queryset = Prediction.objects.select_related('ml_model')
+        if self.request.user.role != 'admin':
+            queryset = queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            # Correlated subqueries, so only the predictions on the page are aggregated
+            results = PredictionCompound.objects.filter(prediction=OuterRef('pk')).order_by().values('prediction')
+            return queryset.annotate(
+                compound_count=Coalesce(Subquery(results.annotate(n=Count('id')).values('n')), 0),
+                best_ic50=Subquery(results.annotate(best=Min('ic50')).values('best')),
+            )
+        if self.action == 'retrieve':
+            return queryset.prefetch_related(
+                Prefetch('prediction_compounds', queryset=PredictionCompound.objects.select_related('compound'))
+            )
+        return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PredictionSummarySerializer
+        return PredictionSerializer
 
+    @extend_schema(
+        parameters=[ClusterQuerySerializer],
+        description=(
+            "Group the compounds of a completed prediction into chemical series: by Bemis-Murcko scaffold, "
+            "or by Butina clustering of their ECFP fingerprints at a Tanimoto cutoff. Clusters are listed "
+            "largest first, each with its members (the Butina centroid first) and best IC50. Each "
+            "(prediction, method, cutoff) is computed once and then served from storage."
+        ),
+        responses={
+            200: OpenApiResponse(description="Clusters.", response=OpenApiTypes.OBJECT),
+            400: OpenApiResponse(description="Invalid query, or a cutoff too low for this many compounds."),
+            404: OpenApiResponse(description="Prediction not found."),
+            409: OpenApiResponse(description="Prediction has not completed yet."),
+        }
+    )
+    @action(detail=True, methods=['get'])
+    def clusters(self, request, *args, **kwargs):
+        prediction = self.get_object()
+        query = ClusterQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        method = query.validated_data["method"]
+        cutoff = round(query.validated_data["cutoff"], 2) if method == "butina" else None
+        if prediction.status != Prediction.Status.COMPLETED:
+            return Response({"error": "Prediction has not completed yet."}, status=status.HTTP_409_CONFLICT)
 
+        try:
+            clusters = cluster_prediction(prediction, method, cutoff)
+        except TooManyNeighbors as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = {
+            row["compound_id"]: row
+            for row in PredictionCompound.objects.filter(prediction=prediction)
+            .values("compound_id", "compound__smiles", "ic50", "lelp")
+        }
+        label = "scaffold" if method == "scaffold" else "centroid_id"
+        payload = []
+        for cluster in clusters:
+            members = [
+                {"compound_id": compound_id, "smiles": results[compound_id]["compound__smiles"],
+                 "ic50": results[compound_id]["ic50"], "lelp": results[compound_id]["lelp"]}
+                for compound_id in cluster["compound_ids"] if compound_id in results
+            ]
+            ic50s = [member["ic50"] for member in members if member["ic50"] is not None]
+            payload.append({
+                label: cluster["label"],
+                "size": len(members),
+                "best_ic50": min(ic50s, default=None),
+                "members": members,
+            })
+        return Response({
+            "prediction_id": prediction.id,
+            "method": method,
+            "cutoff": cutoff,
+            "compounds": len(results),
+            "clusters": payload,
+        }, status=status.HTTP_200_OK)
+
+
+class ResidentModelsView(APIView):
+    """
+    Lists the ML models currently loaded in this worker's model registry (admin only).
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        description="List the ML models resident in this worker's memory and the memory budget.",
+        responses={
+            200: OpenApiResponse(description="Resident models.", response=OpenApiTypes.OBJECT),
+            403: OpenApiResponse(description="Forbidden: Not allowed."),
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        if request.user.role != 'admin':
+            raise PermissionDenied("Only admin can inspect loaded models.")
+        registry = get_model_registry()
+        models = registry.resident()
+        return Response({
+            "memory_budget_bytes": registry.memory_budget,
+            "resident_bytes": sum(m["size_bytes"] for m in models),
+            "models": models,
+        }, status=status.HTTP_200_OK)
+
+
+class SchedulerStatusView(APIView):
+    """
+    Reports prediction lane occupancy and job queue depth (admin only).
+    """
+    permission_classes = [IsAuthenticated]
 
+    @extend_schema(
+        description=(
+            "Slots in use per prediction lane (across workers on this host), admission counts and wait "
+            "times (this worker), and the depth of the job queue overall and per user."
+        ),
+        responses={
+            200: OpenApiResponse(description="Scheduler status.", response=OpenApiTypes.OBJECT),
+            403: OpenApiResponse(description="Forbidden: Not allowed."),
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        if request.user.role != 'admin':
+            raise PermissionDenied("Only admin can inspect the prediction scheduler.")
+        return Response({
+            "lanes": {name: lane.stats() for name, lane in get_lanes().items()},
+            "jobs": queue_stats(),
+        }, status=status.HTTP_200_OK)
 
 
 class PredictIC50View(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+    parser_classes = [StreamingJSONParser, FormParser, MultiPartParser]
 
     @extend_schema(
         request=PredictionInputSerializer,
@@ -83,6 +230,7 @@ class PredictIC50View(APIView):
                                     "smiles": "C=C", 
                                     "ic50": 0.00032,
                                     "lelp": 0.5,  # Example LELP value
+                                    "applicability_domain": {"max_similarity": 0.72, "mean_similarity": 0.18},
                                     "compound": 
                                     {
                                         "id": "1",
@@ -102,6 +250,7 @@ class PredictIC50View(APIView):
                                     "smiles": "CCO",
                                     "ic50": 0.00213,
                                     "lelp": 0.7,  # Example LELP value
+                                    "applicability_domain": {"max_similarity": 0.35, "mean_similarity": 0.09},
                                     "compound": 
                                     {
                                         "id": "2",
@@ -123,6 +272,17 @@ class PredictIC50View(APIView):
                     )
                 ]
             ),
+            202: OpenApiResponse(
+                description="Prediction queued as a background job.",
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        name="Prediction Queued",
+                        value={"message": "Prediction queued for 20000 SMILES.", "prediction_id": 42, "status": "PENDING"},
+                        status_codes=["202"]
+                    )
+                ]
+            ),
             400: OpenApiResponse(
                 description="Bad request.",
                 response=OpenApiTypes.OBJECT,
@@ -133,23 +293,46 @@ class PredictIC50View(APIView):
                         status_codes=["400"]
                     )
                 ]
-            )
+            ),
+            429: OpenApiResponse(description="Too many predictions of this user running or queued; see Retry-After."),
+            503: OpenApiResponse(description="Prediction lanes or job queue saturated; see Retry-After.")
         },
         description=(
-            "Predict IC50 values from SMILES strings or a CSV file using a selected ML model.\n\n"
+            "Predict IC50 values from SMILES strings or a CSV file (plain or gzip'd) using a selected ML model.\n\n"
             "**Supported Models (method + descriptor):**\n"
             "- xgb + ecfp\n"
             "- xgb + pubchem\n"
             "- lgbm + ecfp\n"
             "- lgbm + pubchem\n"
             "- svr + ecfp\n"
-            "- svr + pubchem\n"
+            "- svr + pubchem\n\n"
+            "Pass `models` (e.g. `[\"xgb:ecfp\", \"svr:ecfp\"]`) instead of model_method/model_descriptor "
+            "to score with several models in one pass. Each SMILES is parsed once for all descriptors, one Prediction "
+            "is created per model, and the response lists them under `predictions`.\n\n"
+            "Compounds already scored by the same model artifact are served from the result cache; "
+            "`cache` reports the hits and misses (distinct molecules) per model.\n\n"
+            "Each result carries an `applicability_domain`: the highest and average Tanimoto similarity of the "
+            "compound to the model's training set, stored with the result (null for models shipped without "
+            "training fingerprints, see `manage.py build_training_fingerprints`).\n\n"
+            "Inputs of at least PREDICTION_ASYNC_THRESHOLD SMILES, or requests with `run_async`, are queued "
+            "instead: the response is 202 with the prediction id(s), and the prediction endpoint reports "
+            "`status`, `progress_done`/`progress_total` and the results stored so far while workers run.\n\n"
+            "Synchronous requests of up to PREDICTION_FAST_LANE_MAX_SMILES SMILES run in a reserved fast lane; "
+            "larger ones share a bounded bulk lane with a per-user limit. When a lane or the job queue is full "
+            "the response is 429 (per-user limit) or 503 (server busy) with a `Retry-After` header.\n\n"
+            "With `Accept: application/x-ndjson` (or `?format=ndjson`) synchronous results are streamed as "
+            "they are scored: a `header` line with the prediction ids, one `result` line per SMILES and model "
+            "(the full compound only on its first line, `compound_id` on every line), then a `summary` line.\n\n"
+            "JSON bodies are parsed incrementally: large `smiles` arrays are spooled to disk as they are read "
+            "and bodies over PREDICTION_JSON_MAX_BYTES or with more than PREDICTION_JSON_MAX_SMILES SMILES are "
+            "rejected with 413.\n"
         )
     )
     def post(self, request, *args, **kwargs):
         user = request.user
         csv_file = request.FILES.get("file", None)
         smiles_input = request.data.get("smiles", None)
+        models_input = request.data.get("models", None)
         model_descriptor = request.data.get("model_descriptor", None)
         model_method = request.data.get("model_method", None)
 
@@ -167,10 +350,11 @@ class PredictIC50View(APIView):
         errors = {}
 
         # Validate required fields
-        if not model_method:
-            errors["model_method"] = ["This field is required."]
-        if not model_descriptor:
-            errors["model_descriptor"] = ["This field is required."]
+        if not models_input:
+            if not model_method:
+                errors["model_method"] = ["This field is required."]
+            if not model_descriptor:
+                errors["model_descriptor"] = ["This field is required."]
         if not smiles_input and not csv_file:
             errors["input"] = ["Either 'smiles' or 'file' must be provided."]
 
@@ -178,31 +362,46 @@ class PredictIC50View(APIView):
         if errors:
             return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
-        smiles_list = []
+        try:
+            model_specs = self.parse_model_specs(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate required parameters
-        if not all([model_descriptor, model_method]):
-            return Response(
-                {"error": "model_descriptor and model_method are required."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # Resolve the requested models to their registered artifacts
+        registry = get_model_registry()
+        ml_models = []
+        try:
+            for method, descriptor, version in model_specs:
+                ml_model = registry.resolve(method, descriptor, version)
+                if ml_model not in ml_models:
+                    ml_models.append(ml_model)
+        except MLModel.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
 
-        # Fetch MLModel in one query
-        ml_model = get_object_or_404(MLModel, file_path="xgb_model_ecfp.json")
+        standardize = str(request.data.get("standardize", "")).lower() in ("1", "true", "yes")
+        run_async = str(request.data.get("run_async", "")).lower() in ("1", "true", "yes")
+        input_source_type = "csv" if csv_file else "text"
 
         smiles_list = []
+        input_file = None
         if csv_file:
-            if not csv_file.name.endswith(".csv"):
-                return Response({"error": "Only CSV files are supported."}, status=status.HTTP_400_BAD_REQUEST)
+            if not csv_file.name.endswith(CSV_EXTENSIONS):
+                return Response({"error": "Only CSV files (optionally gzip'd) are supported."}, status=status.HTTP_400_BAD_REQUEST)
             try:
-                decoded_file = csv_file.read().decode("utf-8-sig")
-                io_string = io.StringIO(decoded_file)
-                reader = csv.reader(io_string)
-                # Assumes SMILES is in the first column
-                smiles_list = [row[0].strip() for row in reader if row and row[0].strip()]
+                # Assumes SMILES is in the first column. Rows are streamed and at most
+                # PREDICTION_ASYNC_THRESHOLD are read here; larger files are spooled to disk
+                # and queued, so an upload is never held in memory as a whole.
+                smiles_list = list(islice(iter_csv_smiles(csv_file), settings.PREDICTION_ASYNC_THRESHOLD))
+                if run_async or len(smiles_list) >= settings.PREDICTION_ASYNC_THRESHOLD:
+                    input_file = spool_upload(csv_file)
             except Exception as e:
                 return Response({"error": f"Failed to parse CSV: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        elif isinstance(smiles_input, SmilesSpool):
+            # Large JSON arrays were spooled to disk by the parser; treat them like a CSV upload
+            smiles_list = list(islice(iter(smiles_input), settings.PREDICTION_ASYNC_THRESHOLD))
+            if run_async or len(smiles_input) > len(smiles_list):
+                input_file = spool_upload(smiles_input)
         elif smiles_input:
             if isinstance(smiles_input, str):
                 smiles_list = [s.strip() for s in smiles_input.split(",") if s.strip()]
@@ -219,71 +418,58 @@ class PredictIC50View(APIView):
         if not smiles_list:
             return Response({"error": "No valid SMILES strings provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            predictions = predict_batch_ic50(
-                smiles_list=smiles_list,
-                model_name="xgb_model_ecfp.json",
-                model_method="xgb",
-                model_descriptor="ecfp"
-            )
-
-            # results = [{"smiles": smiles, "ic50": ic50} for smiles, ic50 in zip(smiles_list, predictions)]
-
-            # 1. Create Prediction instance
-            prediction = Prediction.objects.create(
-                user=user,
-                ml_model=ml_model,
-                status=Prediction.Status.COMPLETED,
-                input_source_type="csv" if csv_file else "text",
-                completed_at=timezone.now()  # Set completed_at to now
-            )
-
-            results = []
-            # 2. Save Compounds and PredictionCompound results
-            for smiles, ic50 in zip(smiles_list, predictions):
-                compound, _ = Compound.objects.get_or_create(
-                    smiles=smiles,
-                    defaults={
-                        "iupac_name": None,  # optional fields, fill if available
-                        "cid": None,
-                        "description": None,
-                    }
-                )
-
-                PredictionCompound.objects.create(
-                    prediction=prediction,
-                    compound=compound,
-                    ic50=ic50,
-                    lelp=None  # fill this if you calculate LELP
+        if input_file or run_async or len(smiles_list) >= settings.PREDICTION_ASYNC_THRESHOLD:
+            # Large inputs are scored by `manage.py run_prediction_worker`; poll the prediction for progress
+            try:
+                predictions = enqueue_predictions(
+                    user, ml_models, standardize, input_source_type,
+                    smiles_list=None if input_file else smiles_list, input_file=input_file
                 )
-
-                results.append({
-                    "smiles": smiles,
-                    "ic50": ic50,
-                    "lelp": None,  # fill this if you calculate LELP
-                    "compound": {
-                        "id": compound.id,
-                        "smiles": compound.smiles,
-                        "iupac_name": compound.iupac_name,
-                        "cid": compound.cid,
-                        "description": compound.description,
-                        "molecular_formula": compound.molecular_formula,
-                        "molecular_weight": compound.molecular_weight,
-                        "synonyms": compound.synonyms,
-                        "inchi": compound.inchi,
-                        "inchikey": compound.inchikey,
-                        "structure_image": compound.structure_image
-                    }
-                })
-
+            except LaneSaturated as e:
+                if input_file:
+                    input_file.unlink(missing_ok=True)
+                return self.saturated_response(e)
+            if csv_file:
+                message = f"Prediction queued for {csv_file.name}"
+            else:
+                count = len(smiles_input) if isinstance(smiles_input, SmilesSpool) else len(smiles_list)
+                message = f"Prediction queued for {count} SMILES"
+            if len(predictions) == 1:
+                return Response({
+                    "message": f"{message}.",
+                    "prediction_id": predictions[0].id,
+                    "status": predictions[0].status
+                }, status=status.HTTP_202_ACCEPTED)
             return Response({
-                "message": f"Prediction complete and saved for {len(results)} SMILES.",
-                "results": results
-            }, status=status.HTTP_200_OK)
-        
+                "message": f"{message} with {len(predictions)} models.",
+                "predictions": [
+                    {"prediction_id": p.id, "ml_model": MLModelSerializer(p.ml_model).data, "status": p.status}
+                    for p in predictions
+                ]
+            }, status=status.HTTP_202_ACCEPTED)
+
+        # Small requests run in the reserved fast lane, larger ones in the bounded bulk lane
+        lane = lane_for(len(smiles_list))
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            # The lane slot is held until the streamed response is closed
+            admission = ExitStack()
+            try:
+                admission.enter_context(lane.admit(user.id))
+            except LaneSaturated as e:
+                return self.saturated_response(e)
+            lines = stream_predictions(
+                user, ml_models, smiles_list, standardize, input_source_type,
+                chunk_size=settings.PREDICTION_STREAM_CHUNK_SIZE,
+                compound_payload=self.compound_payload,
+                serialize_model=lambda ml_model: MLModelSerializer(ml_model).data,
+            )
+            return ndjson_response(lines, on_close=admission.close)
+        try:
+            with lane.admit(user.id):
+                return self.predict_now(user, ml_models, smiles_list, standardize, input_source_type)
+        except LaneSaturated as e:
+            return self.saturated_response(e)
 
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
         # try:
@@ -345,52 +531,161 @@ class PredictIC50View(APIView):
         #     "compounds": CompoundSerializer(compounds_to_create, many=True).data
         # }, status=status.HTTP_201_CREATED)
     
-    def fetch_pubchem_data(self, smiles):
-        """Fetch compound data from PubChem and optimize API calls."""
-        data = {
-            "cid": None, "molecular_formula": None, "molecular_weight": None,
-            "iupac_name": None, "inchi": None, "inchikey": None, "description": None,
-            "synonyms": None, "structure_image": None, "name": None,
-            "category": None
-        }
+    def predict_now(self, user, ml_models, smiles_list, standardize, input_source_type):
+        """Score the SMILES with every model, store one Prediction per model and return the results."""
+        # Canonicalize once; everything downstream works on distinct molecules
+        normalized = NormalizedSmiles(smiles_list, standardize=standardize)
+
+        if not normalized.unique:
+            return Response({"error": "No valid SMILES strings provided."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            compounds = pcp.get_compounds(smiles, 'smiles')
-            if compounds:
-                compound = compounds[0]  # Get the first matching compound
-                data.update({
-                    "cid": compound.cid,
-                    "molecular_formula": compound.molecular_formula,
-                    "molecular_weight": compound.molecular_weight,
-                    "iupac_name": compound.iupac_name,
-                    "inchi": compound.inchi,
-                    "inchikey": compound.inchikey,
-                    "synonyms": ", ".join(compound.synonyms) if compound.synonyms else None,
-                    "structure_image": f"https://pubchem.ncbi.nlm.nih.gov/image/imgsrv.fcgi?cid={compound.cid}&t=l" if compound.cid else None,
+            # Featurize each descriptor once and run all requested models on the shared matrices;
+            # the same RDKit pass yields the properties stored with new compounds
+            properties, domains = {}, []
+            all_predictions, cache_stats = predict_batch_multi(
+                smiles_list=normalized.unique,
+                model_specs=[
+                    (ml_model.file_path, ml_model.method, ml_model.descriptor, ml_model.version)
+                    for ml_model in ml_models
+                ],
+                properties=properties,
+                domains=domains,
+            )
+
+            with transaction.atomic():
+                # 1. Resolve or create all Compounds in bulk, shared by every model's results
+                compounds = get_or_create_compounds(normalized.unique, properties)
+
+                # 2. One Prediction per model, with one PredictionCompound per distinct molecule
+                outputs = []
+                for ml_model, predictions, cache, domain in zip(ml_models, all_predictions, cache_stats, domains):
+                    prediction = Prediction.objects.create(
+                        user=user,
+                        ml_model=ml_model,
+                        status=Prediction.Status.COMPLETED,
+                        input_source_type=input_source_type,
+                        completed_at=timezone.now()  # Set completed_at to now
+                    )
+
+                    # Featurization failures are skipped here and reported per row below
+                    ic50s = {
+                        smiles: ic50
+                        for smiles, ic50 in zip(normalized.unique, predictions)
+                        if not isinstance(ic50, str)
+                    }
+                    lelps = {smiles: compute_lelp(ic50, compounds[smiles]) for smiles, ic50 in ic50s.items()}
+                    create_prediction_compounds(
+                        prediction,
+                        [(compounds[smiles], ic50, lelps[smiles], domain.get(smiles)) for smiles, ic50 in ic50s.items()]
+                    )
+                    outputs.append((ml_model, prediction, ic50s, lelps, domain, cache))
+
+            # 3. Fan results back out to the original input order
+            payloads = {}
+            response_predictions = []
+            invalid = {
+                "ic50": None,
+                "lelp": None,
+                "applicability_domain": None,
+                "error": "Invalid SMILES input",
+                "compound": None
+            }
+            for ml_model, prediction, ic50s, lelps, domain, cache in outputs:
+                by_molecule = {}
+                for canonical, ic50 in ic50s.items():
+                    if canonical not in payloads:
+                        payloads[canonical] = self.compound_payload(compounds[canonical])
+                    by_molecule[canonical] = {
+                        "ic50": ic50,
+                        "lelp": lelps[canonical],
+                        "applicability_domain": domain_payload(domain.get(canonical)),
+                        "compound": payloads[canonical]
+                    }
+                results = [
+                    {"smiles": smiles, **(result or invalid)}
+                    for smiles, result in zip(normalized.inputs, normalized.fan_out(by_molecule))
+                ]
+                response_predictions.append({
+                    "prediction_id": prediction.id,
+                    "ml_model": MLModelSerializer(ml_model).data,
+                    "cache": cache,
+                    "results": results
                 })
 
-                # Fetch description from PubChem REST API
-                if compound.cid:
-                    description = self.fetch_pubchem_description(compound.cid)
-                    if description:
-                        data["description"] = description
-                        
-        except Exception as e:
-            print(f"Error fetching data from PubChem: {e}")
+            message = (
+                f"Prediction complete and saved for {len(compounds)} unique compounds "
+                f"from {len(normalized.inputs)} SMILES"
+            )
+            if len(response_predictions) == 1:
+                # Single-model requests keep the original response shape
+                return Response({
+                    "message": f"{message}.",
+                    "prediction_id": response_predictions[0]["prediction_id"],
+                    "cache": response_predictions[0]["cache"],
+                    "results": response_predictions[0]["results"]
+                }, status=status.HTTP_200_OK)
+            return Response({
+                "message": f"{message} with {len(response_predictions)} models.",
+                "predictions": response_predictions
+            }, status=status.HTTP_200_OK)
 
-        return data
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    def fetch_pubchem_description(self, cid):
-        """Fetch compound description from PubChem API."""
-        url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/description/JSON"
-        try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                json_data = response.json()
-                descriptions = json_data.get("InformationList", {}).get("Information", [])
-                for item in descriptions:
-                    if "Description" in item:
-                        return item["Description"]
-        except requests.RequestException as e:
-            print(f"Error fetching description from PubChem: {e}")
-        return None
\ No newline at end of file
+    def saturated_response(self, error):
+        """429/503 with Retry-After for a request that could not be admitted."""
+        return Response({"error": str(error)}, status=error.status_code, headers={"Retry-After": str(error.retry_after)})
+
+    def parse_model_specs(self, data):
+        """
+        Return the requested models as a list of (method, descriptor, version) tuples.
+
+        `models` may be a list of {"method", "descriptor", "version"} objects, a list of
+        "method:descriptor[:version]" strings, or one comma-separated string of those.
+        Without `models`, the single model_method/model_descriptor/model_version is used.
+        """
+        if hasattr(data, "getlist") and len(data.getlist("models")) > 1:
+            models_input = data.getlist("models")
+        else:
+            models_input = data.get("models", None)
+
+        if not models_input:
+            return [(data.get("model_method"), data.get("model_descriptor"), data.get("model_version") or None)]
+
+        if isinstance(models_input, str):
+            models_input = [m for m in models_input.split(",") if m.strip()]
+        if not isinstance(models_input, list):
+            raise ValueError("'models' must be a list of models or a comma-separated string.")
+
+        specs = []
+        for item in models_input:
+            if isinstance(item, dict):
+                method, descriptor, version = item.get("method"), item.get("descriptor"), item.get("version")
+            elif isinstance(item, str):
+                parts = [p.strip() for p in item.split(":")]
+                if len(parts) not in (2, 3):
+                    raise ValueError(f"Invalid model '{item}'; expected 'method:descriptor[:version]'.")
+                method, descriptor, version = (parts + [None])[:3]
+            else:
+                raise ValueError("Each model must be an object or a 'method:descriptor[:version]' string.")
+            if not method or not descriptor:
+                raise ValueError("Each model needs both a method and a descriptor.")
+            specs.append((method, descriptor, version or None))
+        return specs
+
+    def compound_payload(self, compound):
+        """Compound fields included with every prediction result."""
+        return {
+            "id": compound.id,
+            "smiles": compound.smiles,
+            "iupac_name": compound.iupac_name,
+            "cid": compound.cid,
+            "description": compound.description,
+            "molecular_formula": compound.molecular_formula,
+            "molecular_weight": compound.molecular_weight,
+            "synonyms": compound.synonyms,
+            "inchi": compound.inchi,
+            "inchikey": compound.inchikey,
+            "structure_image": compound.structure_image
+        }